@@ -13,6 +13,8 @@ playsound("audio\\model_loaded.wav")
 stop_recording=False
 is_recording=False
 stop_playback = False
+# The proxy of the latest recording, its response can be cancelled with F2 while it plays
+current_proxy = None
 pykeyboard= keyboard.Controller()
 
 #keyboard events
@@ -31,12 +33,14 @@ COMBINATIONS = [
 def record_speech():
     global stop_recording
     global is_recording
+    global current_proxy
 
      # Set up an event loop for the async operations
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
 
     proxy = agent_proxy.get_agent_sroxy_sockets(device_id = "864068071000005")
+    current_proxy = proxy
 
     is_recording=True
     chunk = 1024  # Record in chunks of 5000 samples = 2Kb
@@ -55,7 +59,8 @@ def record_speech():
     playsound("audio\\on.wav")
     print("Start recording...\n")
 
-    while stop_recording==False:
+    # Recording stops on F2, or when the server detects the end of speech
+    while stop_recording==False and not proxy.is_endpoint_detected():
         data = stream.read(chunk)
         loop.run_until_complete(proxy.add_audio([data]))
         frames.append(data)
@@ -75,6 +80,10 @@ def record_speech():
     # Generate the audio response
     loop.run_until_complete(proxy.generate_audio_response())
     loop.close()
+    if current_proxy is not proxy:
+        # Interrupted by a barge-in, the new recording is already running
+        return
+    current_proxy = None
     print("---------------------------------------------------------------------------------------------------------------------")
     print("ready - start recording with F2 ...\n")
 
@@ -101,6 +110,9 @@ def on_release(key):
         for keys in c["keys"]:
             if keys.issubset(pressed):
                 if c["command"]=="start record" and stop_recording==False and is_recording==False:
+                    if current_proxy is not None:
+                        # F2 while the response plays interrupts it and starts a new recording
+                        current_proxy.barge_in()
                     t1 = threading.Thread(target=record_speech)
                     t1.start()
                 else:
@@ -6,6 +6,7 @@ dotenv.load_dotenv(dotenv_path="./server/.env" )
 from typing import Optional
 import io
 from server import utils_logger
+from server import utils_framing
 import base64
 from bot.utills_audio_player import AudioPlayer 
 import pydub
@@ -18,6 +19,10 @@ is_single_app = True if os.getenv("IS_SINGLE_APP", "True").lower() == "true" els
 server_url: str = os.getenv("SERVER_URL", "http://localhost:8000/voice_chat_stream")  
 audio_input_format: str = os.getenv("AUDIO_INPUT_FORMAT", "wav") 
 audio_input_format = "wav" if is_single_app else audio_input_format
+# Audio encoding requested for the server's response: pcm, opus, amr or mp3
+audio_output_codec: str = os.getenv("AUDIO_OUTPUT_CODEC", "pcm")
+# Framing of the HTTP response stream: binary frames or base64 audio in JSON objects
+stream_framing: str = os.getenv("STREAM_FRAMING", "binary")
 server_url = f'{server_url}_{audio_input_format}'
 
 console_logger, console_tracer = utils_logger.get_logger_tracer()
@@ -25,6 +30,8 @@ console_logger, console_tracer = utils_logger.get_logger_tracer()
 if is_single_app:
     from server import main
     from server import utils_speech
+    from server import utils_persistence
+    from server import agent_base
 
 console_logger.info(f"Is single app: {is_single_app}")
 
@@ -100,13 +107,17 @@ class AgentProxy :
         self.is_first_chunk = True
         self.encoded_string = None
         self.last_chunk = ""
+        self.frame_decoder = utils_framing.FrameDecoder()
 
-        self.ap: AudioPlayer = AudioPlayer(parent_context=context_api.get_current())  
+        self.ap: AudioPlayer = AudioPlayer(parent_context=context_api.get_current(), codec=audio_output_codec)  
         console_logger.info(f"Audio input format: {audio_input_format}")
         console_logger.info(f"Server url: {server_url}")
 
     @console_tracer.start_as_current_span("process_audio_chunk")
     def process_audio_chunk(self,audio_chunk: bytes) -> None:
+        if stream_framing == utils_framing.framing_binary:
+            self.process_frames(audio_chunk)
+            return
         self.total_data_size += len(audio_chunk)  
         self.total_packets += 1
         chunks, self.last_chunk = get_all_pairs(audio_chunk, self.last_chunk)
@@ -119,7 +130,23 @@ class AgentProxy :
                 audio = base64.b64decode(query_response["audio"])
                 self.total_audio_size += len(audio)
                 self.total_audio_chunks += 1
-                self.ap.add_audio([audio])
+                self.ap.add_encoded_audio([audio])
+
+    def process_frames(self, data: bytes) -> None:
+        self.total_packets += 1
+        self.total_data_size += len(data)
+        for frame_type, payload in self.frame_decoder.feed(data):
+            if frame_type == utils_framing.FRAME_AUDIO:
+                if self.is_first_chunk:
+                    self.is_first_chunk = False
+                    console_logger.info(f"Received First audio chunk of size: {len(payload)}")
+                self.total_audio_size += len(payload)
+                self.total_audio_chunks += 1
+                self.ap.add_encoded_audio([payload])
+            elif frame_type == utils_framing.FRAME_TRANSCRIPT:
+                console_logger.info(f"Transcript: {str(payload, 'utf-8')}")
+            elif frame_type == utils_framing.FRAME_METRICS:
+                console_logger.info(f"Response metrics: {str(payload, 'utf-8')}")
 
     @console_tracer.start_as_current_span("generate_audio_response")
     async def generate_audio_response(self,
@@ -142,7 +169,7 @@ class AgentProxy :
                 encoded_string = base64.b64encode(audio_bytes).decode('utf-8')
 
             if(is_single_app):
-                query_input = main.QueryInput(device_id=device_id, user_input=user_input, user_audio_input=encoded_string)
+                query_input = main.QueryInput(device_id=device_id, user_input=user_input, user_audio_input=encoded_string, audio_codec=audio_output_codec, framing=stream_framing)
                 console_logger.info(f"Received User input: {query_input.user_input}")
                 async for audio_chunk in main.get_audio_stream_base64( query_input=query_input, type=audio_input_format):
                     self.process_audio_chunk(audio_chunk) 
@@ -152,7 +179,9 @@ class AgentProxy :
                     "device_id": device_id,
                     "user_input": user_input,
                     #"user_input": "",
-                    "user_audio_input": encoded_string
+                    "user_audio_input": encoded_string,
+                    "audio_codec": audio_output_codec,
+                    "framing": stream_framing
                 }   
 
                 with requests.get(url=server_url, stream=True, headers=headers, json=request_paylaod) as response:
@@ -187,35 +216,75 @@ class AgentProxySocketsSingleApp:
         self.is_first_chunk = True
         self.last_chunk = ""
 
-        self.streaming_stt = utils_speech.StreamingSTT(parent_context=context_api.get_current())
-        self.streaming_stt.create_stream()
+        # Created with the first audio, once the device's language is looked up
+        self.streaming_stt = None
+        self.speculation = None
+
+        # Set by barge_in() to cancel the response, from the keyboard thread
+        self.cancellation = asyncio.Event()
+        self.loop = None
+        self.ap = None
+
+    async def start_streaming_stt(self):
+        if self.streaming_stt is None:
+            languages = await agent_base.get_device_stt_languages(self.device_id)
+            if agent_base.speculative_start_enabled:
+                self.speculation = agent_base.SpeculativeTurn(self.device_id)
+            on_partial = self.speculation.update if self.speculation else None
+            self.streaming_stt = utils_speech.StreamingSTT(parent_context=context_api.get_current(), languages=languages, on_partial=on_partial)
+            self.streaming_stt.create_stream()
     
     async def add_audio(self, frames):
+        await self.start_streaming_stt()
         self.total_audio_chunks_sent += 1
         for frame in frames:
             self.total_audio_size_sent += len(frame)
            
         self.streaming_stt.add_audio(frames)
+
+    def is_endpoint_detected(self) -> bool:
+        """
+        Returns True once the server has detected the end of the user's speech, recording can stop.
+        """
+        return self.streaming_stt is not None and self.streaming_stt.is_endpoint_detected()
+
+    def barge_in(self):
+        """
+        Cancels the response being played, when the user starts speaking over it. Called from another thread.
+        """
+        console_logger.info("Barge-in, cancelling the response")
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.cancellation.set)
+        if self.ap is not None:
+            self.ap.stop()
     
     async def add_audio_complete(self):
+        await self.start_streaming_stt()
         self.streaming_stt.add_audio_complete()
 
     @console_tracer.start_as_current_span("AgentProxySocketsSingleApp - generate_audio_response")
     async def generate_audio_response(self):
         console_logger.info(f"Sending user for device id : {self.device_id}")       
+        await self.start_streaming_stt()
         self.streaming_stt.add_audio_complete()  # must be done to signal the end of stream 
-        ap: AudioPlayer = AudioPlayer(parent_context=context_api.get_current())  
+        self.loop = asyncio.get_running_loop()
+        ap: AudioPlayer = AudioPlayer(parent_context=context_api.get_current(), codec=audio_output_codec)  
+        self.ap = ap
         play_filler_music(ap, 1)         
 
         try:
-            async for audio_chunk in main.get_audio_stream(device_id=self.device_id, streaming_stt=self.streaming_stt):
+            async for audio_chunk in main.get_audio_stream(device_id=self.device_id, streaming_stt=self.streaming_stt, audio_codec=audio_output_codec, speculation=self.speculation,
+                                                           cancellation=self.cancellation):
+                if self.cancellation.is_set():
+                    # Chunks already produced before the barge-in are dropped
+                    continue
                 if self.is_first_chunk:
                     self.is_first_chunk = False
                     console_logger.info(f"Received First audio chunk of size: {len(audio_chunk)/ 1024:.2f} KB")  
 
                 self.total_audio_size += len(audio_chunk)
                 self.total_audio_chunks += 1
-                ap.add_audio([audio_chunk])
+                ap.add_encoded_audio([audio_chunk])
 
         except Exception as e:  
             traceback.print_exc() 
@@ -226,6 +295,9 @@ class AgentProxySocketsSingleApp:
 
         console_logger.info(f'Total audio size received in KB: {self.total_audio_size / 1024:.2f} KB')  
         console_logger.info(f"Total audio chunks received: {self.total_audio_chunks}")
+        # Each recording runs on its own event loop, so queued conversation writes must land before it ends
+        await utils_persistence.conversation_writer.flush()
+
         ap.add_audio_complete()  
         ap.wait_for_completion()  
 
@@ -245,7 +317,40 @@ class AgentProxySockets:
         console_logger.info(f"Server url: {self.server_url}")
 
         self.ws = None
+        # Reads the server's "stop" while recording, sent when it detects the end of speech
+        self.control_task = None
+        self.endpoint_detected = False
+
+        self.loop = None
+        self.ap = None
+        self.barged_in = False
     
+    async def receive_control(self):
+        message = await self.ws.recv()
+        if message == "stop":
+            console_logger.info("Server detected the end of speech")
+            self.endpoint_detected = True
+        else:
+            console_logger.info(f"Received unexpected message from server while recording: {message}")
+
+    def is_endpoint_detected(self) -> bool:
+        """
+        Returns True once the server has detected the end of the user's speech, recording can stop.
+        """
+        return self.endpoint_detected
+
+    def barge_in(self):
+        """
+        Cancels the response being played, when the user starts speaking over it. Called from another thread.
+        Closing the connection cancels the response on the server.
+        """
+        console_logger.info("Barge-in, cancelling the response")
+        self.barged_in = True
+        if self.ws is not None and self.loop is not None and not self.loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self.ws.close(), self.loop)
+        if self.ap is not None:
+            self.ap.stop()
+
     console_tracer.start_as_current_span("AgentProxySockets - add_audio")
     async def add_audio(self, frames):
         if not self.ws:
@@ -253,6 +358,8 @@ class AgentProxySockets:
             console_logger.info(f"Connected to server: {self.server_url}")
             await self.ws.send("start")
             await self.ws.send(f"device_id:{self.device_id}")
+            await self.ws.send(f"codec:{audio_output_codec}")
+            self.control_task = asyncio.create_task(self.receive_control())
 
         self.total_audio_chunks_sent += 1
         
@@ -270,9 +377,18 @@ class AgentProxySockets:
     async def generate_audio_response(self):
         console_logger.info("Send data complete now, wating for audio response from server")
         server_response = console_tracer.start_span("server_response_time")
-        ap: AudioPlayer = AudioPlayer(parent_context=context_api.get_current())  
+        self.loop = asyncio.get_running_loop()
+        ap: AudioPlayer = AudioPlayer(parent_context=context_api.get_current(), codec=audio_output_codec)  
+        self.ap = ap
         play_filler_music(ap, 1)         
         try:
+            if self.control_task and not self.control_task.done():
+                # The recording was stopped by the user; the response is read below
+                self.control_task.cancel()
+                try:
+                    await self.control_task
+                except asyncio.CancelledError:
+                    pass
             while True:
                 audio_chunk = await self.ws.recv()
                 if isinstance(audio_chunk, bytes):
@@ -283,17 +399,18 @@ class AgentProxySockets:
 
                     self.total_audio_size += len(audio_chunk)
                     self.total_audio_chunks += 1
-                    ap.add_audio([audio_chunk])
+                    ap.add_encoded_audio([audio_chunk])
                 else:
                     console_logger.info(f"Received non-bytes message from server: {audio_chunk}")
 
             
         except websockets.exceptions.ConnectionClosedOK:
-            # The server is expected to close the connection once done
+            # The server is expected to close the connection once done, or the client closed it on a barge-in
             pass
         except Exception as e:  
-            traceback.print_exc() 
-            console_logger.error(f"Error generating audio chunks: {e}")
+            if not self.barged_in:
+                traceback.print_exc() 
+                console_logger.error(f"Error generating audio chunks: {e}")
         finally:
             if self.ws:
                 await self.ws.close()
@@ -1,20 +1,64 @@
 import pyaudio
+import subprocess  # For the ffmpeg decoder of compressed audio
 import threading  # For handling threads
 import queue  # For creating and managing queues
 from opentelemetry import context as context_api
 from server import utils_logger
 console_logger, console_tracer = utils_logger.get_logger_tracer()
 
+# ffmpeg input format of each compressed codec the server can stream, see server/utils_codecs.py
+decoder_input_formats = {
+    "opus": "ogg",
+    "amr": "amr",
+    "mp3": "mp3",
+}
+
+class AudioDecoder:
+    """
+    Decodes a compressed audio stream to 8 kHz 16 bit mono PCM with an ffmpeg subprocess, as it arrives.
+    """
+    def __init__(self, codec, on_pcm):
+        self.on_pcm = on_pcm  # Called with each decoded PCM chunk, from the reader thread
+        self.process = subprocess.Popen(
+            ["ffmpeg", "-hide_banner", "-loglevel", "error",
+             "-f", decoder_input_formats[codec], "-i", "pipe:0",
+             "-f", "s16le", "-ac", "1", "-ar", "8000", "pipe:1"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        self.reader_thread = threading.Thread(target=self.read_pcm, daemon=True)
+        self.reader_thread.start()
+
+    def read_pcm(self):
+        # 1600 bytes is 100 ms of audio
+        while chunk := self.process.stdout.read1(1600):
+            self.on_pcm(chunk)
+
+    def add_audio(self, audio_data):
+        for chunk in audio_data:
+            self.process.stdin.write(chunk)
+        self.process.stdin.flush()
+
+    def close(self):
+        """
+        Ends the input and waits until all of it has been decoded.
+        """
+        self.process.stdin.close()
+        self.reader_thread.join()
+        self.process.wait()
+
 class AudioPlayer:
     """
     A class to handle audio playback using PyAudio.
     """
-    def __init__(self, parent_context=None):
+    def __init__(self, parent_context=None, codec="pcm"):
         self.audio_queue = queue.Queue()  # Queue to store audio chunks
         self.playback_complete = threading.Event()  # Event to signal playback completion
         self.audio_added = threading.Event()  # Event to signal that audio has been added to the queue
         self.audio_size_in_bytes = 0
         self.parent_context = parent_context  # Store the parent context
+        # Server audio in a compressed codec is decoded before playback
+        self.decoder = AudioDecoder(codec, self.audio_queue.put) if codec != "pcm" else None
 
         # Initialize PyAudio
         self.p = pyaudio.PyAudio()
@@ -68,6 +112,15 @@ class AudioPlayer:
             self.audio_queue.put(chunk)
         
 
+    def add_encoded_audio(self, audio_data):
+        """
+        Method to add server audio, in the codec the player was created for, to the queue.
+        """
+        if self.decoder:
+            self.decoder.add_audio(audio_data)
+        else:
+            self.add_audio(audio_data)
+
     def wait_for_completion(self):
         """
         Method to wait for the audio playback thread to complete.
@@ -79,4 +132,17 @@ class AudioPlayer:
         """
         Method to signal that audio has been added
         """
-        self.audio_added.set()  # Signal that all audio has been added
\ No newline at end of file
+        if self.decoder:
+            self.decoder.close()
+        self.audio_added.set()  # Signal that all audio has been added
+
+    def stop(self):
+        """
+        Method to stop playback right away, dropping the audio that has not been played yet
+        """
+        self.playback_complete.set()
+        while not self.audio_queue.empty():
+            try:
+                self.audio_queue.get_nowait()
+            except queue.Empty:
+                break
\ No newline at end of file
@@ -2,11 +2,20 @@ import dotenv
 from pathlib import Path 
 dotenv.load_dotenv(dotenv_path=Path(__file__).parent.parent / 'server' / '.env' )
 
-from typing import Tuple, Any, Optional, AsyncGenerator
+import os
+import re
+import time
+import asyncio
+from typing import Tuple, Any, Dict, List, Optional, AsyncGenerator, Awaitable
   
 from server import utils_langchain
 from server import utils_db  
+from server import utils_db_async
+from server import utils_persistence
+from server import utils_chat_window
+from server import utils_session
 from server import utils_voice_llm  
+from server import utils_codecs
 from server import utils_logger
 from server import utils_speech
 console_logger, console_tracer = utils_logger.get_logger_tracer()
@@ -15,7 +24,7 @@ from opentelemetry.instrumentation.langchain import LangchainInstrumentor
 LangchainInstrumentor().instrument()   
 
 @console_tracer.start_as_current_span("fetch_device_session_details")
-def fetch_device_session_details(device_id: str, user_input: str) -> Tuple[str, Any, Any]:  
+async def fetch_device_session_details(device_id: str, user_input: str) -> Tuple[str, Any, Any]:  
     """  
     Retrieves session and conversation details for a given device.  
   
@@ -27,12 +36,21 @@ def fetch_device_session_details(device_id: str, user_input: str) -> Tuple[str,
         Tuple[str, Any, Any]: A tuple containing session ID, conversation object, and chat history.  
     """  
     console_logger.debug(f'Getting conversation for device_id: {device_id}')  
-    session_id: str = utils_db.get_session_id(device_id)        
-    conversation: Any = utils_db.get_conversation_or_create_new(  
-        session_id=session_id,  
-        device_id=device_id,  
-        title=user_input  
-    )  
+    # The Redis chat window is the primary source of chat history, Cosmos DB is only read on a miss
+    session_id, window = await utils_session.get_session(device_id)
+    if window is not None:
+        conversation: Any = utils_db.create_new_conversation(device_id = device_id, session_id = session_id, title = user_input)
+        conversation["messages"] = window
+    else:
+        # The previous turn may still be in the write-behind queue
+        await utils_persistence.conversation_writer.wait_for_device(device_id)
+        conversation = await utils_db_async.get_conversation_or_create_new(  
+            session_id=session_id,  
+            device_id=device_id,  
+            title=user_input  
+        )  
+        if session_id and conversation["messages"]:
+            await utils_chat_window.seed_chat_window(device_id, conversation["messages"])
 
     console_logger.debug(f'Getting langchain conversation for conversation: {session_id}')  
       
@@ -41,11 +59,245 @@ def fetch_device_session_details(device_id: str, user_input: str) -> Tuple[str,
       
     return session_id, conversation, chat_history  
 
+pre_llm_branch_timeout: float = float(os.getenv("PRE_LLM_BRANCH_TIMEOUT", "10"))
+# Recognizing a long utterance takes longer than a lookup, so the transcript branch has its own bound
+stt_timeout: float = float(os.getenv("STT_TIMEOUT", "30"))
+
+async def run_pre_llm_branch(name: str, awaitable: Awaitable[Any], timeout: float = pre_llm_branch_timeout) -> Any:
+    """
+    Runs one branch of the pre-LLM fan-out in its own span, bounded by a timeout.
+
+    Args:
+        name (str): The branch name, used for the span name.
+        awaitable (Awaitable[Any]): The branch to run.
+        timeout (float): Seconds to wait before the branch is cancelled.
+
+    Returns:
+        Any: The branch result.
+
+    Raises:
+        asyncio.TimeoutError: If the branch does not complete within `timeout` seconds.
+    """
+    with console_tracer.start_as_current_span(f"pre_llm_{name}") as span:
+        try:
+            return await asyncio.wait_for(awaitable, timeout=timeout)
+        except asyncio.TimeoutError:
+            console_logger.error(f"Pre-LLM branch '{name}' timed out after {timeout} seconds")
+            span.set_attribute("timed_out", True)
+            raise
+
+async def get_device_info_or_default(device_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Device info only personalizes the prompt, so a slow device lookup must not fail the turn.
+    """
+    try:
+        return await run_pre_llm_branch("device_info", utils_db_async.get_device_info(device_id))
+    except asyncio.TimeoutError:
+        return None
+
+async def get_device_stt_languages(device_id: str) -> List[str]:
+    """
+    Returns the candidate STT languages of a device from its (cached) profile, see utils_speech.get_stt_languages.
+    """
+    device_info = await get_device_info_or_default(device_id)
+    return utils_speech.get_stt_languages(device_info.get("language") if device_info else None)
+
+async def prepare_conversation_turn(
+    device_id: str,
+    user_input: Optional[str] = None,
+    user_audio_input: Optional[str] = None,
+    audio_format: str = "wav"
+) -> Dict[str, Any]:
+    """
+    Runs the pre-LLM steps of a turn as a dependency-aware concurrent fan-out.
+
+    Session and conversation lookup and the device lookup start together; (for audio input) the
+    transcription follows the device lookup, which gives it the device's language, and overlaps the
+    conversation lookup. Tool routing needs both the chat history and the query, so it waits on those
+    two branches only. The time to the LLM call is the slowest chain rather than the sum of all steps.
+    The transcription is bounded by STT_TIMEOUT, the other branches by PRE_LLM_BRANCH_TIMEOUT.
+
+    Args:
+        device_id (str): The unique identifier for the device.
+        user_input (Optional[str], optional): The user's text input. Defaults to None.
+        user_audio_input (Optional[str], optional): b64encoded utf 8 string of the user's audio.
+        audio_format (str, optional): Format of user_audio_input, "wav" or "amr". Defaults to "wav".
+
+    Returns:
+        Dict[str, Any]: session_id, conversation, chat_history, device_info, transcript, requery and agent_executor.
+    """
+    device_info_task = asyncio.create_task(get_device_info_or_default(device_id))
+
+    async def get_transcript() -> str:
+        if user_input or not user_audio_input:
+            return ""
+        # The device's language narrows recognition, so it is resolved first; it is usually cached
+        device_info = await device_info_task
+        languages = utils_speech.get_stt_languages(device_info.get("language") if device_info else None)
+        return await utils_speech.speech_to_text_from_base64_async(user_audio_input, audio_format=audio_format, languages=languages)
+
+    conversation_task = asyncio.create_task(run_pre_llm_branch("conversation", fetch_device_session_details(device_id, user_input=user_input)))
+    transcript_task = asyncio.create_task(run_pre_llm_branch("transcript", get_transcript(), timeout=stt_timeout))
+
+    async def get_agent_executor() -> Any:
+        _, _, chat_history = await conversation_task
+        transcript = await transcript_task
+        requery = user_input if user_input else transcript
+
+        tool_filter_message = ""
+        if(len(chat_history) >= 2):
+            tool_filter_message += chat_history[-2]["role"] + ": " + chat_history[-2]["content"] + "\n"
+            tool_filter_message += chat_history[-1]["role"] + ": " + chat_history[-1]["content"] + "\n"
+
+        tool_filter_message += f"human: {requery}"
+        return await run_pre_llm_branch("agent_executor", asyncio.to_thread(utils_langchain.get_agent_executor, tool_filter_message))
+
+    branches = [
+        conversation_task,
+        transcript_task,
+        device_info_task,
+        asyncio.create_task(get_agent_executor()),
+    ]
+    try:
+        (session_id, conversation, chat_history), transcript, device_info, agent_executor = await asyncio.gather(*branches)
+    except BaseException:
+        # gather does not cancel the remaining branches when one of them fails
+        for branch in branches:
+            branch.cancel()
+        raise
+
+    return {
+        "session_id": session_id,
+        "conversation": conversation,
+        "chat_history": chat_history,
+        "device_info": device_info,
+        "transcript": transcript,
+        "requery": user_input if user_input else transcript,
+        "agent_executor": agent_executor,
+    }
+
+
+# Speculative start: the pre-LLM steps of a turn run on the partial transcript while the user is still speaking
+speculative_start_enabled: bool = os.getenv("SPECULATIVE_START_ENABLED", "False").lower() == "true"
+# A partial transcript is stable, and starts a speculation, once it has not changed for this long
+speculative_stable_ms: float = float(os.getenv("SPECULATIVE_STABLE_MS", "300"))
+speculation_stats: Dict[str, float] = {"started": 0, "hits": 0, "misses": 0, "discarded": 0, "discarded_ms": 0.0}
+
+def normalize_transcript(text: str) -> str:
+    """
+    Normalizes a transcript for comparing a partial hypothesis with the final text, which adds punctuation and casing.
+    """
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+class SpeculativeTurn:
+    """
+    Prepares a turn (session, conversation, device info and tool routing, see prepare_conversation_turn)
+    from the stable partial transcript while the user is still speaking.
+
+    Every new partial hypothesis restarts a timer; when it fires, a speculation starts on that hypothesis
+    and any earlier one with a different text is cancelled. `resolve` returns the prepared turn if the
+    final transcript matches the speculation, otherwise the speculation is discarded and its running
+    time is recorded as its cost.
+    """
+    def __init__(self, device_id: str) -> None:
+        self.device_id = device_id
+        self.loop = asyncio.get_running_loop()
+        self.text: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        self.started_at: float = 0.0
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.closed: bool = False
+
+    def update(self, hypothesis: str) -> None:
+        """
+        Receives a partial hypothesis. Thread-safe, called from the speech SDK's thread.
+        """
+        self.loop.call_soon_threadsafe(self._schedule, hypothesis)
+
+    def _schedule(self, hypothesis: str) -> None:
+        if self.closed:
+            return
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = self.loop.call_later(speculative_stable_ms / 1000, self._start, hypothesis)
+
+    def _start(self, hypothesis: str) -> None:
+        self.timer = None
+        if not normalize_transcript(hypothesis):
+            return
+        if self.text is not None and normalize_transcript(hypothesis) == normalize_transcript(self.text):
+            return
+        self.discard()
+        console_logger.info(f"Speculatively preparing the turn for: {hypothesis}")
+        self.text = hypothesis
+        self.started_at = time.perf_counter()
+        self.task = self.loop.create_task(prepare_conversation_turn(self.device_id, user_input=hypothesis))
+        # A discarded speculation may fail after nobody awaits it
+        self.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        speculation_stats["started"] += 1
+
+    def discard(self) -> None:
+        """
+        Cancels the running speculation, if any, and records its cost.
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.task is None:
+            return
+        self.task.cancel()
+        speculation_stats["discarded"] += 1
+        speculation_stats["discarded_ms"] += (time.perf_counter() - self.started_at) * 1000
+        self.task = None
+        self.text = None
+
+    def close(self) -> None:
+        """
+        Discards the speculation and ignores later partial hypotheses, for an utterance that is abandoned.
+        """
+        self.closed = True
+        self.discard()
+
+    async def resolve(self, final_text: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the prepared turn if the final transcript matches the speculation, with the final text as the query.
+
+        Args:
+            final_text (str): The final transcript.
+
+        Returns:
+            Optional[Dict[str, Any]]: The prepared turn, or None if there was no matching speculation.
+        """
+        head_start_ms = (time.perf_counter() - self.started_at) * 1000
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.task is None or normalize_transcript(final_text) != normalize_transcript(self.text):
+            if self.task is not None:
+                speculation_stats["misses"] += 1
+            self.discard()
+            return None
+        try:
+            turn = await self.task
+        except Exception as e:
+            console_logger.error(f"Speculative turn preparation failed: {e}")
+            speculation_stats["misses"] += 1
+            self.task = None
+            return None
+        speculation_stats["hits"] += 1
+        console_logger.info(f"Speculative turn used, started {head_start_ms:.0f} ms before the final transcript")
+        turn["requery"] = final_text
+        self.task = None
+        return turn
 
 async def get_conversation_response_streaming(  
     device_id: str,  
     user_input: Optional[str] = None,  
-    user_audio_input: Optional[str] = None  
+    user_audio_input: Optional[str] = None,  
+    audio_format: str = "wav",  
+    audio_codec: Optional[str] = None,  
+    prepared_turn: Optional[Dict[str, Any]] = None,  
+    cancellation: Optional[asyncio.Event] = None  
 )  -> AsyncGenerator[bytes, None]:  
     """  
     Processes user input (text or audio) and generates a streaming response from the conversation.  
@@ -54,6 +306,10 @@ async def get_conversation_response_streaming(
         device_id (str): The unique identifier for the device.  
         user_input (Optional[str], optional): The user's text input. Defaults to None.  
         user_audio_input (Optional[str], optional): b64encoded utf 8 sring  - base64.b64encode(wav_reader.read()).decode('utf-8')
+        audio_format (str, optional): Format of user_audio_input, "wav" or "amr". Defaults to "wav".
+        audio_codec (Optional[str], optional): The audio encoding requested by the client, see utils_codecs. Defaults to raw PCM.
+        prepared_turn (Optional[Dict[str, Any]], optional): A turn already prepared by a speculative start, see SpeculativeTurn.
+        cancellation (Optional[asyncio.Event], optional): Cancels the response when set, for example on a client barge-in.
   
     Returns:  
         str: The assistant's text response.  
@@ -61,22 +317,20 @@ async def get_conversation_response_streaming(
     with console_tracer.start_as_current_span("get_conversation_response_streaming") as span:
         first_audio_chunk_span = console_tracer.start_span("network_first_audio_chunk")
         console_logger.warning(f'get_conversation_response_streaming called with device_id: {device_id}')  
-        transcript = ""
     
-        session_id, conversation, chat_history = fetch_device_session_details(device_id, user_input=user_input)  
-
-        device_info = utils_db.get_device_info(device_id)
-        
-        requery: str = ""  
-        if user_input:  
-            requery = user_input
-        elif user_audio_input:  
-            transcript = utils_speech.speech_to_text_from_base64(user_audio_input)
-            requery = transcript
+        turn = prepared_turn
+        if turn is None:
+            turn = await prepare_conversation_turn(device_id, user_input=user_input, user_audio_input=user_audio_input, audio_format=audio_format)
+        conversation = turn["conversation"]
+        chat_history = turn["chat_history"]
+        device_info = turn["device_info"]
+        transcript: str = turn["transcript"]
+        requery: str = turn["requery"]
+        agent_executor = turn["agent_executor"]
     
         console_logger.info(f'Executing the query: {requery}')  
     
-        audio_generator: utils_voice_llm.TextToGPTAudioStreamGenerator = utils_voice_llm.TextToGPTAudioStreamGenerator()  
+        audio_generator: utils_voice_llm.TextToGPTAudioStreamGenerator = utils_voice_llm.TextToGPTAudioStreamGenerator(codec=utils_codecs.get_audio_codec(audio_codec))  
         total_audio_size: int = 0  
         first_audio_chunk: bool = True
     
@@ -84,28 +338,18 @@ async def get_conversation_response_streaming(
             "input": requery,   
             "device_id": device_id,  
             "session_id": conversation["id"], 
-            "user_language": device_info["language"],
+            "user_language": device_info["language"] if device_info else "English",
             "device_info": device_info,
             "chat_history": chat_history  
         }
 
-        tool_filter_message = ""
-        if(len(chat_history) >= 2):
-            tool_filter_message += chat_history[-2]["role"] + ": " + chat_history[-2]["content"] + "\n"
-            tool_filter_message += chat_history[-1]["role"] + ": " + chat_history[-1]["content"] + "\n"
-        
-        tool_filter_message += f"human: {requery}"
-        # Initialize Agent Executor  
-        agent_executor = utils_langchain.get_agent_executor(tool_filter_message) 
         tool_names = [structured_tool.name for structured_tool in agent_executor.tools] 
         
         total_audtio_chunks_on_network = 0;
         console_logger.debug(f'Agent args: {agent_args}')
+        audio_chunks = audio_generator.generate_audio_chunks(agent_executor, agent_args, cancellation=cancellation)
         try:  
-            async for audio_chunk in audio_generator.generate_audio_chunks(  
-                agent_executor,  
-                agent_args
-            ):  
+            async for audio_chunk in audio_chunks:  
                 if first_audio_chunk:  
                     first_audio_chunk_span.end()
                     console_logger.info("First audio chunk sent back over network of size: %s bytes", len(audio_chunk)) 
@@ -115,17 +359,22 @@ async def get_conversation_response_streaming(
                 yield audio_chunk
         except Exception as e:  
             console_logger.error(f"Error generating audio chunks: {e}")  
+        finally:
+            # Stops the pipeline right away if this response is abandoned, for example when the client disconnects
+            await audio_chunks.aclose()
+        if audio_generator.cancelled:
+            console_logger.info(f'Response cancelled after {total_audtio_chunks_on_network} audio chunks')
+            span.set_attribute("cancelled", True)
     
         text_response: str = audio_generator.get_full_response()  
-        utils_db.add_messages_to_conversation(  
-            conversation,  
-            [  
-                {"role": "user", "content": transcript},  
-                {"role": "requery", "content": requery},  
-                {"role": "tools", "content": tool_names},
-                {"role": "assistant", "content": text_response}  
-            ]  
-        )  
+        turn_messages = [  
+            {"role": "user", "content": transcript},  
+            {"role": "requery", "content": requery},  
+            {"role": "tools", "content": tool_names},
+            {"role": "assistant", "content": text_response}  
+        ]
+        await utils_chat_window.append_to_chat_window(device_id, turn_messages)
+        await utils_persistence.save_conversation_turn(conversation, turn_messages)
     
         console_logger.info(f'Full response: {text_response}')  
         console_logger.info(f'Total audio chunks on network: {total_audtio_chunks_on_network}')  
@@ -6,10 +6,21 @@ from typing import  Optional
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 from server import agent_base
+from server import utils_langchain
+from server import utils_db_async
+from server import utils_redis
+from server import utils_persistence
+from server import utils_cache
+from server import utils_tts_pool
+from server import utils_tts_cache
+from server import utils_filler
+from server import utils_codecs
+from server import utils_voice_llm
 from server import utils_speech
-import pydub
-import io
+from server import utils_framing
 import uuid
+import time
+import asyncio
 load_dotenv() 
 
 from opentelemetry import context as context_api
@@ -23,26 +34,10 @@ class QueryInput(BaseModel):
     device_id: str
     user_input: Optional[str] = Field(default=None),  
     user_audio_input: Optional[str] = Field(default="text")  
-
-@console_tracer.start_as_current_span("convert_amr_to_wav")
-def convert_amr_to_wav(amr_input_base64_utf8 :str) -> str:
-    console_logger.debug(f"Converting amr to wav received bytes : {len(amr_input_base64_utf8)}")
-    buffer_input = io.BytesIO(base64.b64decode(amr_input_base64_utf8))
-    buffer_input.name = "temp.amr"
-    buffer_output = io.BytesIO()
-    buffer_output.name = "temp.wav"
-    audio = pydub.AudioSegment.from_file(buffer_input)   
-    audio.export(buffer_output, format= "wav")
-    buffer_output.seek(0)
-    encoded_output = base64.b64encode(buffer_output.getvalue()).decode('utf-8')
-    buffer_output.close()
-    buffer_input.close()
-    return encoded_output
-
-@console_tracer.start_as_current_span("convert_wav_to_text")
-def convert_wav_to_text(wav_base64_utf8 :str) -> str:
-    query_text = utils_speech.speech_to_text_from_base64(wav_base64_utf8)
-    return query_text
+    # Audio encoding of the response: pcm (default), opus, amr or mp3, see utils_codecs
+    audio_codec: Optional[str] = Field(default=None)
+    # Response framing: json (default, base64 audio in JSON objects) or binary, see utils_framing
+    framing: Optional[str] = Field(default=None)
 
 app = FastAPI()
 
@@ -50,6 +45,40 @@ app = FastAPI()
 async def root():
     return {"message": "Hello World"}
 
+@app.get("/metrics")
+async def metrics():
+    return {
+        "persistence": utils_persistence.conversation_writer.get_stats(),
+        "redis_pool": utils_redis.get_async_pool_stats(),
+        "tts_pool": utils_tts_pool.synthesizer_pool.get_stats(),
+        "stt_recognizers": utils_speech.recognizer_stock.get_stats(),
+        "speculation": agent_base.speculation_stats,
+        "tts_cache": utils_tts_cache.tts_cache.get_stats(),
+        "device_cache": utils_cache.device_cache.get_stats(),
+        "embedding_cache": utils_langchain.embedding_function.cache.get_stats(),
+        "agent_executors": utils_langchain.get_agent_executor_stats(),
+    }
+
+@app.on_event("startup")
+async def startup():
+    if utils_langchain.tool_router_mode == "local":
+        await asyncio.to_thread(utils_langchain.tool_router.load)
+    if os.getenv("AGENT_EXECUTOR_PREWARM", "False").lower() == "true":
+        await asyncio.to_thread(utils_langchain.prewarm_agent_executors)
+    tts_pool_prewarm = int(os.getenv("TTS_POOL_PREWARM", "2"))
+    if tts_pool_prewarm > 0:
+        await asyncio.to_thread(utils_tts_pool.synthesizer_pool.prewarm, utils_voice_llm.tts_voice_name, utils_voice_llm.tts_output_format, tts_pool_prewarm)
+    if utils_filler.filler_audio_enabled:
+        await utils_filler.prewarm_filler_audio(utils_voice_llm.tts_voice_name, list(utils_codecs.audio_codecs.values()))
+
+@app.on_event("shutdown")
+async def shutdown():
+    await utils_persistence.conversation_writer.close(timeout=utils_persistence.persistence_shutdown_timeout)
+    await utils_db_async.close_cosmos_client()
+    await utils_redis.close_async_redis_client()
+    await asyncio.to_thread(utils_tts_pool.synthesizer_pool.close)
+    await asyncio.to_thread(utils_speech.recognizer_stock.close)
+
 async def get_audio_stream_base64(query_input: QueryInput, type:str = "wav") -> str:
     # Create a span for tracing this function
     with console_tracer.start_as_current_span("get_audio_stream_base64") as span:
@@ -58,6 +87,8 @@ async def get_audio_stream_base64(query_input: QueryInput, type:str = "wav") ->
         span.set_attribute("device_id", query_input.device_id)
         span.set_attribute("has_text_input", query_input.user_input is not None)
         span.set_attribute("audio_input_size", len(query_input.user_audio_input) if query_input.user_audio_input else 0)
+        framing = utils_framing.get_stream_framing(query_input.framing)
+        span.set_attribute("framing", framing)
         
         request_id = str(uuid.uuid4())
         span.set_attribute("request_id", request_id)
@@ -67,26 +98,47 @@ async def get_audio_stream_base64(query_input: QueryInput, type:str = "wav") ->
         try:
             query_text = ""
             user_audio_input = query_input.user_audio_input
+            prepared_turn = None
             if(query_input.user_input and query_input.user_input.strip()):
                 query_text = query_input.user_input
             elif query_input.user_audio_input and len(query_input.user_audio_input) > 0:
-                if type == "amr":
-                    span.add_event("Converting AMR to WAV")
-                    user_audio_input = convert_amr_to_wav(query_input.user_audio_input)
-                    span.set_attribute("conversion_performed", True)
+                # The audio is recognized inside the pre-LLM fan-out, alongside the session and conversation lookups
+                prepared_turn = await agent_base.prepare_conversation_turn(query_input.device_id, user_audio_input=user_audio_input, audio_format=type)
 
-                query_text = convert_wav_to_text(user_audio_input) 
+                if framing == utils_framing.framing_binary:
+                    yield utils_framing.encode_text_frame(utils_framing.FRAME_TRANSCRIPT, prepared_turn["transcript"])
 
             span.add_event("Starting streaming response")
             chunk_count = 0
+            audio_size = 0
+            response_start = time.perf_counter()
+            first_chunk_ms = None
             async for audio_chunk in agent_base.get_conversation_response_streaming(
                 device_id=query_input.device_id,
                 user_input=query_text,
-                user_audio_input=user_audio_input
+                user_audio_input=user_audio_input,
+                audio_format=type,
+                audio_codec=query_input.audio_codec,
+                prepared_turn=prepared_turn
             ):
                 chunk_count += 1
-                object_audio = json.dumps({"type":"audio", "audio": base64.b64encode(audio_chunk).decode('utf-8')})
-                yield object_audio
+                audio_size += len(audio_chunk)
+                if first_chunk_ms is None:
+                    first_chunk_ms = (time.perf_counter() - response_start) * 1000
+                if framing == utils_framing.framing_binary:
+                    yield utils_framing.encode_frame(utils_framing.FRAME_AUDIO, audio_chunk)
+                else:
+                    object_audio = json.dumps({"type":"audio", "audio": base64.b64encode(audio_chunk).decode('utf-8')})
+                    yield object_audio
+
+            if framing == utils_framing.framing_binary:
+                yield utils_framing.encode_json_frame(utils_framing.FRAME_METRICS, {
+                    "request_id": request_id,
+                    "audio_chunks": chunk_count,
+                    "audio_bytes": audio_size,
+                    "first_audio_ms": first_chunk_ms,
+                    "total_ms": (time.perf_counter() - response_start) * 1000,
+                })
                 
             span.set_attribute("total_chunks", chunk_count)
             span.add_event("Completed streaming response")
@@ -98,7 +150,7 @@ async def get_audio_stream_base64(query_input: QueryInput, type:str = "wav") ->
             span.set_status("ERROR", error_msg)
             raise
 
-async def get_audio_stream(device_id: str, streaming_stt : utils_speech.StreamingSTT) -> str:
+async def get_audio_stream(device_id: str, streaming_stt : utils_speech.StreamingSTT, audio_codec: Optional[str] = None, speculation: Optional[agent_base.SpeculativeTurn] = None, cancellation: Optional[asyncio.Event] = None) -> str:
     # Create a span for tracing this function
     with console_tracer.start_as_current_span("get_audio_stream") as span:
         # Add relevant attributes to the span
@@ -108,16 +160,34 @@ async def get_audio_stream(device_id: str, streaming_stt : utils_speech.Streamin
         
         try:
             with console_tracer.start_as_current_span("tts") as span_tts:
-                streaming_stt.wait_for_completion()  # wait for the audio to be added
+                await streaming_stt.wait_for_completion_async()  # wait for the audio to be recognized
                 query_text = streaming_stt.get_text()
 
+            if cancellation is not None and cancellation.is_set():
+                # Cancelled while the speech was still being recognized
+                if speculation:
+                    speculation.discard()
+                span.add_event("Cancelled before the response started")
+                return
+
+            prepared_turn = await speculation.resolve(query_text) if speculation else None
+            span.set_attribute("speculation_hit", prepared_turn is not None)
+
             span.add_event("Starting streaming response")
             chunk_count = 0
+            speech_ended_at = streaming_stt.get_speech_ended_at()
             async for audio_chunk in agent_base.get_conversation_response_streaming(
                 device_id=device_id,
                 user_input=query_text,
-                user_audio_input=None
+                user_audio_input=None,
+                audio_codec=audio_codec,
+                prepared_turn=prepared_turn,
+                cancellation=cancellation
             ):
+                if chunk_count == 0 and speech_ended_at is not None:
+                    first_audio_ms = (time.monotonic() - speech_ended_at) * 1000
+                    span.set_attribute("first_audio_ms_from_end_of_speech", first_audio_ms)
+                    console_logger.info(f"First audio chunk {first_audio_ms:.0f} ms after the end of speech")
                 chunk_count += 1
                 yield audio_chunk
                 
@@ -131,79 +201,198 @@ async def get_audio_stream(device_id: str, streaming_stt : utils_speech.Streamin
             span.set_status("ERROR", error_msg)
             raise
 
+def get_stream_media_type(query_input: QueryInput) -> str:
+    """
+    Returns the media type of a response stream: binary frames, or the audio of the negotiated codec.
+    """
+    if utils_framing.get_stream_framing(query_input.framing) == utils_framing.framing_binary:
+        return "application/octet-stream"
+    return utils_codecs.get_audio_codec(query_input.audio_codec).media_type
+
 @app.get("/voice_chat_stream_amr")
 async def chat_stream_amr(query_input: QueryInput):
     console_logger.info(f"Received User input: {query_input.user_input}")
-    return StreamingResponse(get_audio_stream_base64(query_input = query_input, type= "amr"), status_code=200 , media_type='audio/wav')
+    return StreamingResponse(get_audio_stream_base64(query_input = query_input, type= "amr"), status_code=200 , media_type=get_stream_media_type(query_input))
 
 @app.get("/voice_chat_stream_wav")
 async def chat_stream_wav(query_input: QueryInput):
     console_logger.info(f"Received User input: {query_input.user_input}")
-    return StreamingResponse(get_audio_stream_base64(query_input = query_input, type="wav"), status_code=200 , media_type='audio/wav')
+    return StreamingResponse(get_audio_stream_base64(query_input = query_input, type="wav"), status_code=200 , media_type=get_stream_media_type(query_input))
+
+class VoiceChatSocket:
+    """
+    One connection of the websocket voice chat protocol.
+
+    Client text messages: "device_id:<id>", "codec:<name>" and "multi_turn" configure the connection,
+    "start" begins a recording, "stop" ends it, and "barge_in" cancels the response being streamed
+    and begins a new recording. Binary messages are the recording, 16 kHz 16 bit mono PCM.
+    Server text messages: "stop" when the end of speech is detected (see utils_vad), and "end" after
+    each complete response in multi-turn mode. Without "multi_turn" the connection is closed after
+    the first response.
+    """
+    def __init__(self, websocket: WebSocket) -> None:
+        self.websocket = websocket
+        self.device_id: Optional[str] = None
+        self.audio_codec: Optional[str] = None
+        self.multi_turn = False
+        self.recording = False
+        self.finished = False
+        self.streaming_stt: Optional[utils_speech.StreamingSTT] = None
+        self.speculation: Optional[agent_base.SpeculativeTurn] = None
+        self.response_task: Optional[asyncio.Task] = None
+        self.cancellation: Optional[asyncio.Event] = None
+
+    async def run(self) -> None:
+        """
+        Receives messages until the client disconnects, while responses stream in their own task so that
+        a barge-in is received mid-response.
+        """
+        receive_task = None
+        disconnected = False
+        try:
+            while not self.finished:
+                if receive_task is None:
+                    receive_task = asyncio.create_task(self.websocket.receive())
+                waiting = {receive_task} if self.response_task is None else {receive_task, self.response_task}
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+                if self.response_task in done:
+                    self.response_task = None
+                    # Close connection after one full start/stop cycle
+                    self.finished = not self.multi_turn
+                if receive_task in done:
+                    message = receive_task.result()
+                    receive_task = None
+                    if message["type"] == "websocket.disconnect":
+                        console_logger.info("Client disconnected.")
+                        disconnected = True
+                        break
+                    await self.handle_message(message)
+        except WebSocketDisconnect:
+            console_logger.info("Client disconnected unexpectedly.")
+            disconnected = True
+        finally:
+            if receive_task is not None:
+                receive_task.cancel()
+            # An abandoned response stops generating text and audio right away
+            await self.cancel_response()
+            # An utterance cut off by the disconnect must not keep preparing turns from late partial hypotheses
+            if self.speculation:
+                self.speculation.close()
+            if self.streaming_stt:
+                await self.streaming_stt.stop_async()
+            if not disconnected:
+                await self.websocket.close()
+                console_logger.info("Client connection closed.")
+
+    async def handle_message(self, message) -> None:
+        if message.get("bytes") is not None:
+            if not self.recording:
+                # Audio that was in flight when recording stopped
+                return
+            if self.streaming_stt is None:
+                await self.start_streaming_stt()
+            self.streaming_stt.add_audio([message["bytes"]])
+            if self.streaming_stt.is_endpoint_detected():
+                # Tell the client to stop sending; it may still send audio and "stop" that are already in flight
+                console_logger.info("Server: End of speech detected, recording stopped..")
+                await self.websocket.send_text("stop")
+                await self.stop_recording()
+            return
+
+        text_data = message.get("text") or ""
+        if text_data == "start" or text_data == "barge_in":
+            if text_data == "barge_in":
+                console_logger.info("Server: Barge-in, cancelling the response.")
+            await self.cancel_response()
+            console_logger.info("Server: Recording started.")
+            await self.start_recording()
+        elif text_data == "stop":
+            if self.recording:
+                console_logger.info("Server: Recording stopped..")
+                await self.stop_recording()
+        elif text_data == "multi_turn":
+            self.multi_turn = True
+        elif text_data.startswith("device_id:"):
+            self.device_id = text_data.split(":")[1].strip()
+            console_logger.info(f"Received device_id: {self.device_id}")
+            if self.recording and self.streaming_stt is None:
+                await self.start_streaming_stt()
+        elif text_data.startswith("codec:"):
+            self.audio_codec = text_data.split(":")[1].strip()
+            console_logger.info(f"Received audio codec: {self.audio_codec}")
+        else:
+            console_logger.info(f"Server: Received unexpected message: {text_data}")
+
+    async def start_recording(self) -> None:
+        self.recording = True
+        # The previous utterance is answered or cancelled by now; stop its recognition and speculation
+        streaming_stt, speculation = self.streaming_stt, self.speculation
+        self.streaming_stt = None
+        self.speculation = None
+        if speculation:
+            speculation.close()
+        if streaming_stt:
+            await streaming_stt.stop_async()
+        # Recognition starts once the device is known, in the device's language
+        if self.device_id is not None:
+            await self.start_streaming_stt()
+
+    async def start_streaming_stt(self) -> None:
+        languages = None
+        if self.device_id is not None:
+            languages = await agent_base.get_device_stt_languages(self.device_id)
+            if agent_base.speculative_start_enabled:
+                self.speculation = agent_base.SpeculativeTurn(self.device_id)
+        on_partial = self.speculation.update if self.speculation else None
+        self.streaming_stt = utils_speech.StreamingSTT(parent_context=context_api.get_current(), languages=languages, on_partial=on_partial)
+        self.streaming_stt.create_stream()
+
+    async def stop_recording(self) -> None:
+        self.recording = False
+        if self.streaming_stt is None:
+            await self.start_streaming_stt()
+        self.streaming_stt.add_audio_complete()
+        if self.device_id is None:
+            console_logger.warning("Server: Recording stopped before a device_id was received.")
+            self.finished = not self.multi_turn
+            return
+        self.cancellation = asyncio.Event()
+        self.response_task = asyncio.create_task(self.respond(self.streaming_stt, self.speculation, self.cancellation))
+
+    async def respond(self, streaming_stt: utils_speech.StreamingSTT, speculation: Optional[agent_base.SpeculativeTurn], cancellation: asyncio.Event) -> None:
+        try:
+            async for audio_chunk in get_audio_stream(device_id=self.device_id, streaming_stt=streaming_stt, audio_codec=self.audio_codec,
+                                                      speculation=speculation, cancellation=cancellation):
+                # Once cancelled, the stream ends after the chunks already produced; they are dropped
+                if cancellation.is_set():
+                    continue
+                try:
+                    await self.websocket.send_bytes(audio_chunk)
+                except Exception as e:
+                    console_logger.info(f"Server: Could not send the response, cancelling it: {e}")
+                    cancellation.set()
+            if self.multi_turn and not cancellation.is_set():
+                await self.websocket.send_text("end")
+        except Exception as e:
+            console_logger.error(f"Error streaming the response: {e}")
+
+    async def cancel_response(self) -> None:
+        """
+        Cancels the response being streamed, if any, and waits for its pipeline to stop.
+        """
+        if self.response_task is None:
+            return
+        self.cancellation.set()
+        await asyncio.wait({self.response_task})
+        self.response_task = None
 
 @console_tracer.start_as_current_span("voice_chat_stream_socket")
 @app.websocket("/ws/voice_chat_stream_socket")
 async def chat_stream_socket(websocket: WebSocket):
     """
-    WebSocket endpoint to receive audio chunks from the client,
-    save them to a file, and then send the file back.
+    WebSocket endpoint to receive the user's speech and stream the spoken response back, see VoiceChatSocket.
     """
     await websocket.accept()
     console_logger.info("Client connected.")
-    streaming_stt = utils_speech.StreamingSTT(parent_context=context_api.get_current())
-    streaming_stt.create_stream()
-
-    device_id = None
-
-    try:  
-    # Wait for a "start" text message from client  
-        audio_complete = False
-        while not audio_complete:  
-            msg = await websocket.receive_text()  
-            if msg == "start":  
-                # Begin accumulating audio data  
-                console_logger.info("Server: Recording started.")  
-
-                # In recording mode, read bytes until we get a "stop" message                  
-                while not audio_complete: 
-                    sub_msg = await websocket.receive()  
-                    
-                    # If client disconnects mid-recording  
-                    if sub_msg["type"] == "websocket.disconnect":  
-                        console_logger.info("Client disconnected.")  
-                        return  
-
-                    # If we receive binary audio data  
-                    if sub_msg.get("bytes"):  
-                        console_logger.debug(f"Received audio chunk of size: {len(sub_msg['bytes'])} bytes")
-                        streaming_stt.add_audio([sub_msg["bytes"]])
-                    # If we receive a text message (potentially "stop")  
-                    elif sub_msg.get("text"):  
-                        text_data = sub_msg["text"]  
-                        if text_data.startswith("device_id:") and ":" in text_data:
-                            device_id = text_data.split(":")[1].strip()
-                            console_logger.info(f"Received device_id: {device_id}")
-                        elif text_data == "stop":  
-                            console_logger.info("Server: Recording stopped..")  
-                            streaming_stt.add_audio_complete()
-                            audio_complete = True
-                        else:
-                            console_logger.info(f"Server: Received unexpected message: {text_data}")
-                    else:
-                        console_logger.info("Server: Received unexpected message type.")
-            else :  
-                console_logger.info(f"Server: Received unexpected message: {msg}")  
-
-        if device_id is not None:
-            console_logger.info(f"Received device_id: {device_id}")
-            async for audio_chunk in get_audio_stream(device_id=device_id, streaming_stt=streaming_stt):
-                await websocket.send_bytes(audio_chunk) 
-        
-    except WebSocketDisconnect:  
-        console_logger.info("Client disconnected unexpectedly.")  
-
-
-    # Close connection after one full start/stop cycle  
-    await websocket.close()  
-    console_logger.info("Client connection closed.") 
-    return
\ No newline at end of file
+    await VoiceChatSocket(websocket).run()
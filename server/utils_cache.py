@@ -0,0 +1,234 @@
+# Standard Library Imports
+from typing import Any, Callable, Dict, Optional
+from collections import OrderedDict
+import json
+import threading
+import time
+
+import os
+
+# Third-Party Imports
+import redis
+from opentelemetry import trace
+
+from server import utils_redis
+from server import utils_logger
+console_logger, console_tracer = utils_logger.get_logger_tracer()
+
+class LRUTTLCache:
+    """
+    A thread-safe in-process cache with least-recently-used eviction and a per-entry time to live.
+    With `max_bytes` set, entries are also evicted once the total size of the values (measured
+    with `len`) exceeds it.
+    """
+    def __init__(self, max_items: int, ttl_seconds: float, max_bytes: Optional[int] = None) -> None:
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _size(self, value: Any) -> int:
+        return len(value) if self.max_bytes is not None else 0
+
+    def _remove(self, key: str) -> None:
+        # Called with the lock held
+        _, value = self._entries.pop(key)
+        self._bytes -= self._size(value)
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Returns the cached value for `key`, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._bytes += self._size(value)
+            while len(self._entries) > self.max_items or (self.max_bytes is not None and self._bytes > self.max_bytes and len(self._entries) > 1):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value).encode("utf-8")
+
+def _json_loads(data: bytes) -> Any:
+    return json.loads(data)
+
+class TwoTierCache:
+    """
+    A read-through cache with an in-process LRU/TTL tier in front of a shared Redis tier.
+
+    The local tier absorbs repeat lookups on one worker without a network hop, the Redis tier
+    shares entries between workers. Redis failures are logged and the cache degrades to the
+    local tier only. Cached values are shared between callers and must be treated as read only.
+    """
+    def __init__(self,
+                 namespace: str,
+                 max_items: int,
+                 local_ttl_seconds: float,
+                 redis_ttl_seconds: int,
+                 serializer: Callable[[Any], bytes] = _json_dumps,
+                 deserializer: Callable[[bytes], Any] = _json_loads,
+                 max_bytes: Optional[int] = None) -> None:
+        self.namespace = namespace
+        self.local = LRUTTLCache(max_items=max_items, ttl_seconds=local_ttl_seconds, max_bytes=max_bytes)
+        self.redis_ttl_seconds = redis_ttl_seconds
+        self.serializer = serializer
+        self.deserializer = deserializer
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def redis_key(self, key: str) -> str:
+        return f"cache:{self.namespace}:{key}"
+
+    def _record(self, result: str) -> None:
+        trace.get_current_span().set_attribute(f"cache.{self.namespace}.result", result)
+
+    async def get(self, key: str) -> Optional[Any]:
+        """
+        Returns the cached value for `key` from the local tier, then Redis, or None on a miss.
+        Redis hits are promoted into the local tier.
+        """
+        value = self.local.get(key)
+        if value is not None:
+            self.local_hits += 1
+            self._record("local_hit")
+            return value
+
+        try:
+            data = await utils_redis.get_async_redis_client().get(self.redis_key(key))
+        except redis.RedisError as e:
+            console_logger.error(f"Redis error while reading cache '{self.namespace}' key '{key}': {e}")
+            data = None
+
+        if data is None:
+            self.misses += 1
+            self._record("miss")
+            return None
+
+        value = self.deserializer(data)
+        self.local.set(key, value)
+        self.redis_hits += 1
+        self._record("redis_hit")
+        return value
+
+    def get_sync(self, key: str) -> Optional[Any]:
+        """
+        Same as `get`, for synchronous code running outside the event loop (for example in worker threads).
+        """
+        value = self.local.get(key)
+        if value is not None:
+            self.local_hits += 1
+            self._record("local_hit")
+            return value
+
+        try:
+            data = utils_redis.get_sync_redis_client().get(self.redis_key(key))
+        except redis.RedisError as e:
+            console_logger.error(f"Redis error while reading cache '{self.namespace}' key '{key}': {e}")
+            data = None
+
+        if data is None:
+            self.misses += 1
+            self._record("miss")
+            return None
+
+        value = self.deserializer(data)
+        self.local.set(key, value)
+        self.redis_hits += 1
+        self._record("redis_hit")
+        return value
+
+    def set_sync(self, key: str, value: Any) -> None:
+        """
+        Same as `set`, for synchronous code running outside the event loop.
+        """
+        self.local.set(key, value)
+        try:
+            utils_redis.get_sync_redis_client().set(self.redis_key(key), self.serializer(value), ex=self.redis_ttl_seconds)
+        except redis.RedisError as e:
+            console_logger.error(f"Redis error while writing cache '{self.namespace}' key '{key}': {e}")
+
+    async def set(self, key: str, value: Any) -> None:
+        """
+        Stores `value` in both tiers.
+        """
+        self.local.set(key, value)
+        try:
+            await utils_redis.get_async_redis_client().set(self.redis_key(key), self.serializer(value), ex=self.redis_ttl_seconds)
+        except redis.RedisError as e:
+            console_logger.error(f"Redis error while writing cache '{self.namespace}' key '{key}': {e}")
+
+    async def invalidate(self, key: str) -> None:
+        """
+        Removes `key` from both tiers. Called after the underlying record is written.
+        """
+        self.local.invalidate(key)
+        try:
+            await utils_redis.get_async_redis_client().delete(self.redis_key(key))
+        except redis.RedisError as e:
+            console_logger.error(f"Redis error while invalidating cache '{self.namespace}' key '{key}': {e}")
+
+    def invalidate_sync(self, key: str) -> None:
+        """
+        Removes `key` from both tiers from synchronous code.
+        """
+        self.local.invalidate(key)
+        try:
+            utils_redis.get_sync_redis_client().delete(self.redis_key(key))
+        except redis.RedisError as e:
+            console_logger.error(f"Redis error while invalidating cache '{self.namespace}' key '{key}': {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.local_hits + self.redis_hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": (self.local_hits + self.redis_hits) / lookups if lookups else 0.0,
+            "local": self.local.get_stats(),
+        }
+
+# Device profiles change rarely, but other workers only learn about a write through the Redis tier,
+# so the local TTL is kept short to bound how long a worker can serve a stale profile.
+device_cache = TwoTierCache(
+    namespace="device",
+    max_items=int(os.getenv("DEVICE_CACHE_MAX_ITEMS", "10000")),
+    local_ttl_seconds=float(os.getenv("DEVICE_CACHE_LOCAL_TTL", "30")),
+    redis_ttl_seconds=int(os.getenv("DEVICE_CACHE_REDIS_TTL", "600")),
+)
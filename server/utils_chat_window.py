@@ -0,0 +1,69 @@
+# Standard Library Imports
+from typing import Any, Dict, List
+import json
+
+import os
+
+# Third-Party Imports
+import redis
+
+from server import utils_db
+from server import utils_redis
+from server import utils_logger
+console_logger, console_tracer = utils_logger.get_logger_tracer()
+
+# The window holds exactly the messages get_langchain_chat_from_conversation uses for chat history
+chat_window_size: int = abs(utils_db.max_history)
+chat_window_roles = ("user", "assistant")
+
+def get_session_timeout() -> int:
+    # The window expires together with the session key, see utils_session
+    return int(os.getenv("SESSION_TIMOUT", 60))
+
+def get_chat_window_key(device_id: str) -> str:
+    # The window of the device's current session. The device id is the hash tag, so on Redis Cluster
+    # the window shares a slot with the session key (the bare device id) and one script can use both.
+    return f"chat_window:{{{device_id}}}"
+
+def to_window_messages(messages: List[Dict[str, Any]]) -> List[bytes]:
+    return [json.dumps({"role": message["role"], "content": message["content"]}).encode("utf-8")
+            for message in messages if message.get("role") in chat_window_roles]
+
+def from_window_messages(window: List[bytes]) -> List[Dict[str, Any]]:
+    return [json.loads(message) for message in window]
+
+async def write_chat_window(device_id: str, messages: List[Dict[str, Any]], replace: bool) -> None:
+    key = get_chat_window_key(device_id)
+    window_messages = to_window_messages(messages)
+    if not window_messages and not replace:
+        return
+    try:
+        async with utils_redis.get_async_redis_client().pipeline(transaction=True) as pipe:
+            if replace:
+                pipe.delete(key)
+            if window_messages:
+                pipe.rpush(key, *window_messages)
+                pipe.ltrim(key, -chat_window_size, -1)
+                pipe.expire(key, get_session_timeout())
+            await pipe.execute()
+    except redis.RedisError as e:
+        # A stale window would serve wrong history, so drop it and let the next turn read Cosmos DB
+        console_logger.error(f"Redis error while writing chat window for device_id '{device_id}': {e}")
+        try:
+            await utils_redis.get_async_redis_client().delete(key)
+        except redis.RedisError:
+            pass
+
+@console_tracer.start_as_current_span("seed_chat_window")
+async def seed_chat_window(device_id: str, messages: List[Dict[str, Any]]) -> None:
+    """
+    Replaces the window with the tail of a conversation read from Cosmos DB.
+    """
+    await write_chat_window(device_id, messages, replace=True)
+
+@console_tracer.start_as_current_span("append_to_chat_window")
+async def append_to_chat_window(device_id: str, messages: List[Dict[str, Any]]) -> None:
+    """
+    Appends the messages of a turn to the window, keeping only the most recent `chat_window_size`.
+    """
+    await write_chat_window(device_id, messages, replace=False)
@@ -0,0 +1,187 @@
+# Standard Library Imports
+from typing import Callable, Dict, List, Optional, Tuple
+import functools
+import struct
+
+# Third-Party Imports
+import azure.cognitiveservices.speech as speechsdk
+
+from server import utils_logger
+console_logger, console_tracer = utils_logger.get_logger_tracer()
+
+# An audio frame and its duration in milliseconds. Stream headers are frames of 0 ms.
+AudioFrame = Tuple[bytes, float]
+
+def split_pcm_frames(audio: bytes, bytes_per_ms: int, frame_ms: int = 20) -> List[AudioFrame]:
+    """
+    Splits 16 bit PCM into frames of `frame_ms`, on sample boundaries.
+    """
+    frame_bytes = frame_ms * bytes_per_ms
+    return [(audio[start:start + frame_bytes], len(audio[start:start + frame_bytes]) / bytes_per_ms) for start in range(0, len(audio), frame_bytes)]
+
+OGG_PAGE_HEADER = struct.Struct("<4sBBqIIIB")
+
+def split_ogg_pages(audio: bytes) -> List[AudioFrame]:
+    """
+    Splits an Ogg Opus stream into its pages. The duration of a page comes from its granule position,
+    which Opus counts in 48 kHz samples.
+    """
+    frames: List[AudioFrame] = []
+    start = 0
+    granule = 0
+    while start + OGG_PAGE_HEADER.size <= len(audio):
+        capture, _, _, page_granule, _, _, _, segments = OGG_PAGE_HEADER.unpack_from(audio, start)
+        table_end = start + OGG_PAGE_HEADER.size + segments
+        if capture != b"OggS" or table_end > len(audio):
+            break
+        end = table_end + sum(audio[start + OGG_PAGE_HEADER.size:table_end])
+        duration_ms = 0.0
+        # A granule position of -1 marks a page on which no packet ends
+        if page_granule >= 0:
+            duration_ms = max(0, page_granule - granule) / 48
+            granule = page_granule
+        frames.append((audio[start:end], duration_ms))
+        start = end
+    if start < len(audio):
+        frames.append((audio[start:], 0.0))
+    return frames
+
+# Size in bytes of an AMR-WB frame, including its table of contents byte, by frame type
+AMR_WB_FRAME_BYTES: Dict[int, int] = {0: 18, 1: 24, 2: 33, 3: 37, 4: 41, 5: 47, 6: 51, 7: 59, 8: 61, 9: 6, 14: 1, 15: 1}
+AMR_WB_HEADER = b"#!AMR-WB\n"
+
+def split_amr_wb_frames(audio: bytes) -> List[AudioFrame]:
+    """
+    Splits an AMR-WB storage format stream into its 20 ms frames.
+    """
+    frames: List[AudioFrame] = []
+    start = 0
+    if audio.startswith(AMR_WB_HEADER):
+        frames.append((AMR_WB_HEADER, 0.0))
+        start = len(AMR_WB_HEADER)
+    while start < len(audio):
+        frame_bytes = AMR_WB_FRAME_BYTES.get((audio[start] >> 3) & 0x0F)
+        if frame_bytes is None or start + frame_bytes > len(audio):
+            break
+        frames.append((audio[start:start + frame_bytes], 20.0))
+        start += frame_bytes
+    if start < len(audio):
+        frames.append((audio[start:], 0.0))
+    return frames
+
+# MPEG audio layer III bitrates in kbps by bitrate index, and sample rates in Hz by sample rate index
+MP3_BITRATES: Dict[int, List[int]] = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES: Dict[int, List[int]] = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+def split_mp3_frames(audio: bytes) -> List[AudioFrame]:
+    """
+    Splits an MP3 stream into its frames, read from the MPEG frame headers.
+    """
+    frames: List[AudioFrame] = []
+    start = 0
+    while start + 4 <= len(audio):
+        header = audio[start:start + 4]
+        version = (header[1] >> 3) & 0x03
+        bitrate_index = header[2] >> 4
+        sample_rate_index = (header[2] >> 2) & 0x03
+        if (header[0] != 0xFF or header[1] & 0xE0 != 0xE0 or (header[1] >> 1) & 0x03 != 1
+                or version not in MP3_SAMPLE_RATES or bitrate_index in (0, 15) or sample_rate_index == 3):
+            break
+        mpeg1 = version == 3
+        bitrate = MP3_BITRATES[1 if mpeg1 else 2][bitrate_index] * 1000
+        sample_rate = MP3_SAMPLE_RATES[version][sample_rate_index]
+        samples = 1152 if mpeg1 else 576
+        frame_bytes = samples // 8 * bitrate // sample_rate + ((header[2] >> 1) & 0x01)
+        if start + frame_bytes > len(audio):
+            break
+        frames.append((audio[start:start + frame_bytes], 1000 * samples / sample_rate))
+        start += frame_bytes
+    if start < len(audio):
+        frames.append((audio[start:], 0.0))
+    return frames
+
+def group_frames(frames: List[AudioFrame], chunk_ms: float) -> List[AudioFrame]:
+    """
+    Groups consecutive frames into chunks of about `chunk_ms`, so that audio is only ever split on a
+    frame boundary. Stream headers go with the first chunk.
+    """
+    chunks: List[AudioFrame] = []
+    chunk: List[bytes] = []
+    duration_ms = 0.0
+    for frame, frame_ms in frames:
+        chunk.append(frame)
+        duration_ms += frame_ms
+        if duration_ms >= chunk_ms:
+            chunks.append((b"".join(chunk), duration_ms))
+            chunk = []
+            duration_ms = 0.0
+    if chunk:
+        chunks.append((b"".join(chunk), duration_ms))
+    return chunks
+
+class AudioCodec:
+    """
+    An audio output encoding a client can ask for, synthesized natively by the Speech service.
+
+    Args:
+        name (str): The name clients use to request the codec.
+        output_format (speechsdk.SpeechSynthesisOutputFormat): The synthesis output format.
+        media_type (str): The media type of the audio stream.
+        split_frames (Callable[[bytes], List[AudioFrame]]): Splits audio of the format into frames,
+            the points at which the audio can be cut.
+        stream_header (bytes): Header the service writes at the start of every synthesis. It is kept
+            on the first sentence of a response and stripped from the following ones, so the response
+            is one continuous stream.
+        pcm_bytes_per_ms (int): Bytes per millisecond for raw 16 bit PCM, 0 for compressed formats.
+    """
+    def __init__(self,
+                 name: str,
+                 output_format: speechsdk.SpeechSynthesisOutputFormat,
+                 media_type: str,
+                 split_frames: Callable[[bytes], List[AudioFrame]],
+                 stream_header: bytes = b"",
+                 pcm_bytes_per_ms: int = 0) -> None:
+        self.name = name
+        self.output_format = output_format
+        self.media_type = media_type
+        self.split_frames = split_frames
+        self.stream_header = stream_header
+        self.pcm_bytes_per_ms = pcm_bytes_per_ms
+
+    def split_chunks(self, audio: bytes, chunk_ms: float) -> List[AudioFrame]:
+        """
+        Splits audio of the format into chunks of about `chunk_ms`, on frame boundaries.
+        """
+        return group_frames(self.split_frames(audio), chunk_ms)
+
+    def strip_stream_header(self, audio_chunk: bytes) -> bytes:
+        if self.stream_header and audio_chunk.startswith(self.stream_header):
+            return audio_chunk[len(self.stream_header):]
+        return audio_chunk
+
+# Raw PCM is 128 kbps; Opus is about 16 kbps, AMR-WB 24 kbps and MP3 32 kbps.
+# The Speech service has no AMR-NB output, AMR-WB is offered for "amr" instead.
+# Ogg Opus needs no stripping: a new Ogg stream per sentence is a valid chained Ogg stream.
+audio_codecs: Dict[str, AudioCodec] = {
+    "pcm": AudioCodec("pcm", speechsdk.SpeechSynthesisOutputFormat.Raw8Khz16BitMonoPcm, "audio/L16;rate=8000;channels=1",
+                      functools.partial(split_pcm_frames, bytes_per_ms=16), pcm_bytes_per_ms=16),
+    "opus": AudioCodec("opus", speechsdk.SpeechSynthesisOutputFormat.Ogg16Khz16BitMonoOpus, "audio/ogg;codecs=opus", split_ogg_pages),
+    "amr": AudioCodec("amr", speechsdk.SpeechSynthesisOutputFormat.AmrWb16000Hz, "audio/amr-wb", split_amr_wb_frames, stream_header=AMR_WB_HEADER),
+    "mp3": AudioCodec("mp3", speechsdk.SpeechSynthesisOutputFormat.Audio16Khz32KBitRateMonoMp3, "audio/mpeg", split_mp3_frames),
+}
+default_audio_codec: str = "pcm"
+
+def get_audio_codec(name: Optional[str]) -> AudioCodec:
+    """
+    Returns the codec a client asked for, or raw PCM for older clients that do not ask or ask for an unknown codec.
+    """
+    if not name:
+        return audio_codecs[default_audio_codec]
+    codec = audio_codecs.get(name.strip().lower())
+    if codec is None:
+        console_logger.warning(f"Unsupported audio codec '{name}' requested, falling back to {default_audio_codec}")
+        return audio_codecs[default_audio_codec]
+    return codec
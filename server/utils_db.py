@@ -10,35 +10,12 @@ from datetime import datetime, timezone
 from azure.cosmos import CosmosClient , ContainerProxy, exceptions , DatabaseProxy
 import redis  
   
+from server import utils_cache
+from server import utils_redis
 from server import utils_logger
 console_logger, console_tracer = utils_logger.get_logger_tracer()
 max_history = int(os.getenv("MAX_MESSAGE_HISTORY", "-6"))
 
-@console_tracer.start_as_current_span("get_redis_client")
-def get_redis_client() -> redis.Redis:
-    """  
-    Initializes and returns a Redis client.  
-    The Redis host, port, and password are fetched from environment variables.  
-    If not set, defaults are used.  
-    """     
-    console_logger.debug("Initializing Redis client")  
-    try:  
-        redis_client = redis.Redis(  
-            host=os.getenv("REDIS_HOST", "localhost"),  
-            port=os.getenv("REDIS_PORT", "6379"),  
-            password=os.getenv("REDIS_KEY", None),  
-            ssl=True,  
-            db=0,  
-        )  
-        redis_client.ping()  # Test the connection to Redis  
-        console_logger.info("Connected to Redis cache")  
-        return redis_client  
-    except redis.ConnectionError as e:  
-        console_logger.error(f"Redis connection error: {e}")  
-        raise
-
-# Initialize Redis client
-redis_client = get_redis_client()
 # Initialize Cosmos DB client
 
 @console_tracer.start_as_current_span("get_cosmos_db")
@@ -378,6 +355,7 @@ def update_device_language(device_id: str, language: str) -> bool:
           
         # Upsert the updated device back into the container  
         container.upsert_item(device)  
+        utils_cache.device_cache.invalidate_sync(device_id)
         console_logger.debug(f"Successfully updated device with ID: {device_id}")  
         return True  
   
@@ -573,6 +551,7 @@ def get_session_id(device_id: str) -> Optional[str]:
     console_logger.debug(f"Retrieving session ID for device_id: '{device_id}'.")  
     try:  
         # Attempt to get the session ID from Redis  
+        redis_client = utils_redis.get_sync_redis_client()
         session_id = redis_client.get(device_id)  
   
         if session_id is None:  
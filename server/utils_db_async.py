@@ -0,0 +1,738 @@
+# Standard Library Imports
+from typing import List, Dict, Any, Optional
+import asyncio
+import traceback
+
+import os
+import uuid
+from datetime import datetime, timezone
+
+# Third-Party Imports
+from azure.cosmos import exceptions
+from azure.cosmos.aio import CosmosClient, ContainerProxy, DatabaseProxy
+from opentelemetry import trace
+
+from server import utils_db
+from server import utils_cache
+from server import utils_logger
+console_logger, console_tracer = utils_logger.get_logger_tracer()
+
+# The async client owns an aiohttp session that is bound to the event loop it was first used on.
+# The server runs a single loop per worker, but the single-app bot spins up a new loop per recording,
+# so the client (and the container proxies opened from it) are re-created whenever the loop changes.
+_cosmos_client: Optional[CosmosClient] = None
+_cosmos_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_database: Optional[DatabaseProxy] = None
+_containers: Dict[str, ContainerProxy] = {}
+
+def get_cosmos_db() -> DatabaseProxy:
+    """
+    Returns the shared async Cosmos DB database proxy, creating the client on first use.
+    The Cosmos DB endpoint and key are fetched from environment variables.
+    Must be called from within a running event loop.
+    """
+    global _cosmos_client, _cosmos_client_loop, _database
+
+    loop = asyncio.get_running_loop()
+    if _database is not None and _cosmos_client_loop is loop:
+        return _database
+
+    if _cosmos_client is not None:
+        console_logger.info("Event loop changed, re-creating async Cosmos DB client")
+
+    console_logger.debug("Initializing async Cosmos DB client")
+    try:
+        _cosmos_client = CosmosClient(
+            url=os.getenv("COSMOS_DB_ENDPOINT", "NA"),
+            credential=os.getenv("COSMOS_DB_KEY", "NA")
+        )
+        _cosmos_client_loop = loop
+        _database = _cosmos_client.get_database_client(os.getenv("COSMOS_DB_NAME", "NA"))
+        _containers.clear()
+        console_logger.info("Connected to Cosmos DB (async)")
+        return _database
+    except exceptions.CosmosHttpResponseError as e:
+        console_logger.error(f"Cosmos DB connection error: {e}")
+        raise
+
+def get_container(container_env: str, default_name: str) -> ContainerProxy:
+    """
+    Returns the container proxy for the container configured in `container_env`.
+    Proxies are opened once per client and reused for every request.
+
+    Args:
+        container_env (str): Name of the environment variable holding the container name.
+        default_name (str): Container name used when the environment variable is not set.
+    """
+    database = get_cosmos_db()
+    container_name = os.getenv(container_env, default_name)
+    container = _containers.get(container_name)
+    if container is None:
+        container = database.get_container_client(container_name)
+        _containers[container_name] = container
+    return container
+
+async def close_cosmos_client() -> None:
+    """
+    Closes the shared async Cosmos DB client. Called on application shutdown.
+    """
+    global _cosmos_client, _cosmos_client_loop, _database
+    if _cosmos_client is None:
+        return
+    try:
+        await _cosmos_client.close()
+        console_logger.info("Async Cosmos DB client closed")
+    except Exception as e:
+        console_logger.error(f"An error occurred while closing the async Cosmos DB client: {e}")
+    finally:
+        _cosmos_client = None
+        _cosmos_client_loop = None
+        _database = None
+        _containers.clear()
+
+# Fields returned to callers (and to the LLM prompt). Projecting them keeps Cosmos system
+# properties such as _rid, _self, _etag and _ts out of the payload.
+DEVICE_FIELDS = ("id", "deviceId", "customerName", "purchaseDate", "bindingStatus", "batteryStatus",
+                 "networkStatus", "chargingStatus", "lastConnectedDate", "lastPulseDate", "language",
+                 "deviceStatus", "plan", "model")
+TRANSACTION_FIELDS = ("id", "deviceId", "dailyCollection", "weeklyCollection", "monthlyCollection", "last10Transactions")
+NOTIFICATION_FIELDS = ("id", "deviceId", "notification_id", "notificationType", "status", "notificationTime")
+KHATABOOK_FIELDS = ("id", "deviceId", "totalCollection", "last10Transactions")
+
+def build_projection_query(fields: tuple, where: str) -> str:
+    """
+    Builds a parameterized query that projects only the given fields.
+
+    Args:
+        fields (tuple): Top level document fields to return.
+        where (str): The WHERE clause, referencing parameters such as @device_id.
+    """
+    projection = ", ".join(f"c.{field}" for field in fields)
+    return f"SELECT {projection} FROM c WHERE {where}"
+
+class RequestCharge:
+    """
+    Response hook that accumulates the request units consumed by one Cosmos DB call.
+    Query responses can span several pages, so the charge of every page is added up.
+    """
+    def __init__(self, operation: str) -> None:
+        self.operation = operation
+        self.total: float = 0.0
+
+    def __call__(self, headers: Dict[str, str], *args: Any) -> None:
+        self.total += float(headers.get("x-ms-request-charge", 0) or 0)
+
+    def report(self) -> float:
+        """
+        Records the accumulated charge on the current span and in the log.
+        """
+        trace.get_current_span().set_attribute(f"cosmos.{self.operation}.request_charge", self.total)
+        console_logger.debug(f"Cosmos DB {self.operation} consumed {self.total:.2f} RUs")
+        return self.total
+
+async def read_item(container: ContainerProxy, item_id: str, partition_key: str, operation: str) -> Optional[Dict[str, Any]]:
+    """
+    Point reads a document by id and partition key. Returns None if the document does not exist.
+    """
+    charge = RequestCharge(operation)
+    try:
+        return await container.read_item(item=item_id, partition_key=partition_key, response_hook=charge)
+    except exceptions.CosmosResourceNotFoundError:
+        return None
+    finally:
+        charge.report()
+
+async def query_items(container: ContainerProxy, query: str, parameters: List[Dict[str, Any]], partition_key: str, operation: str) -> List[Any]:
+    """
+    Runs a parameterized, single partition query and returns all results.
+    """
+    charge = RequestCharge(operation)
+    console_logger.debug(f"Executing query: {query} with parameters: {parameters}")
+    try:
+        return [item async for item in container.query_items(
+            query=query,
+            parameters=parameters,
+            partition_key=partition_key,
+            response_hook=charge
+        )]
+    finally:
+        charge.report()
+
+async def upsert_item(container: ContainerProxy, item: Dict[str, Any], operation: str) -> Dict[str, Any]:
+    """
+    Upserts a document and reports the request charge.
+    """
+    charge = RequestCharge(operation)
+    try:
+        return await container.upsert_item(item, response_hook=charge)
+    finally:
+        charge.report()
+
+async def patch_item(container: ContainerProxy, item_id: str, partition_key: str, patch_operations: List[Dict[str, Any]], operation: str) -> Dict[str, Any]:
+    """
+    Applies partial document updates and reports the request charge.
+    """
+    charge = RequestCharge(operation)
+    try:
+        return await container.patch_item(item=item_id, partition_key=partition_key,
+                                          patch_operations=patch_operations, response_hook=charge)
+    finally:
+        charge.report()
+
+async def execute_item_batch(container: ContainerProxy, batch_operations: List[tuple], partition_key: str, operation: str) -> List[Dict[str, Any]]:
+    """
+    Executes a transactional batch within one partition and reports the request charge.
+    """
+    charge = RequestCharge(operation)
+    try:
+        return await container.execute_item_batch(batch_operations=batch_operations, partition_key=partition_key, response_hook=charge)
+    finally:
+        charge.report()
+
+# "bucketed" stores a small header document per conversation plus fixed-size message bucket documents,
+# "document" keeps every message in a single conversation document that is upserted on each turn
+conversation_storage_mode: str = os.getenv("CONVERSATION_STORAGE_MODE", "bucketed").lower()
+conversation_bucket_size: int = int(os.getenv("CONVERSATION_BUCKET_SIZE", "40"))
+# Cosmos DB accepts at most 10 operations per patch
+max_patch_operations: int = 10
+
+def get_bucket_id(session_id: str, bucket: int) -> str:
+    return f"{session_id}:{bucket}"
+
+def get_last_bucket(message_count: int, bucket_size: int) -> int:
+    """
+    Returns the index of the bucket holding the last of `message_count` messages, or -1 if there are none.
+    """
+    return (message_count - 1) // bucket_size
+
+def group_by_bucket(message_count: int, bucket_size: int, new_messages: List[Dict[str, Any]]) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Groups messages appended after `message_count` existing messages by the bucket their position falls into.
+    """
+    buckets: Dict[int, List[Dict[str, Any]]] = {}
+    for offset, message in enumerate(new_messages):
+        buckets.setdefault((message_count + offset) // bucket_size, []).append(message)
+    return buckets
+
+def is_bucketed_header(document: Dict[str, Any]) -> bool:
+    # Conversations written before bucketed storage keep their messages inline
+    return document.get("storage") == "bucketed" and "messages" not in document
+
+async def read_recent_messages(container: ContainerProxy, header: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Point reads message buckets from the newest backwards until they cover the last `max_history`
+    user/assistant messages, which is all get_langchain_chat_from_conversation uses.
+    """
+    needed_chat_messages = abs(utils_db.max_history)
+    session_id = header["id"]
+    message_count = header.get("messageCount", 0)
+    bucket_size = header.get("bucketSize", conversation_bucket_size)
+
+    messages: List[Dict[str, Any]] = []
+    chat_messages = 0
+    bucket = get_last_bucket(message_count, bucket_size)
+    while bucket >= 0 and chat_messages < needed_chat_messages:
+        bucket_document = await read_item(container, item_id = get_bucket_id(session_id, bucket),
+                                          partition_key = header["deviceId"], operation = "get_conversation_bucket")
+        if bucket_document is None:
+            console_logger.warning(f"Conversation bucket {bucket} is missing for session_id: {session_id}")
+            break
+        bucket_messages = bucket_document.get("messages", [])
+        chat_messages += sum(1 for message in bucket_messages if message.get("role") in ("user", "assistant"))
+        messages = bucket_messages + messages
+        bucket -= 1
+    return messages
+
+@console_tracer.start_as_current_span("get_device_info_async")
+async def get_device_info(device_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Retrieves device information using the provided device_id.
+    Reads through the device cache and only queries Cosmos DB on a miss.
+
+    Args:
+        device_id (str): The ID of the device to retrieve information for.
+
+    Returns:
+        Optional[Dict[str, Any]]: A dictionary containing device information if found, else None.
+    """
+    console_logger.debug(f"Getting data for device_id: {device_id}")
+    cached_device_info = await utils_cache.device_cache.get(device_id)
+    if cached_device_info is not None:
+        return cached_device_info
+
+    container = get_container("COSMOS_DB_CONTAINER_DEVICES", "devices")
+    query = build_projection_query(DEVICE_FIELDS, "c.deviceId = @device_id")
+    try:
+        device_info = await query_items(container, query, [{"name": "@device_id", "value": device_id}],
+                                        partition_key = device_id, operation = "get_device_info")
+
+        console_logger.debug(f"Retrieved device_info: {device_info}")
+        if not device_info:
+            return None
+
+        # Cache the first device info
+        await utils_cache.device_cache.set(device_id, device_info[0])
+        return device_info[0]
+    except Exception as e:
+        console_logger.error(f"An error occurred while fetching device info: {e}")
+        return None
+
+@console_tracer.start_as_current_span("get_transactions_async")
+async def get_transactions(device_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Retrieves transaction information from the database using the provided device_id.
+
+    Args:
+        device_id (str): The ID of the device to retrieve transactions for.
+
+    Returns:
+        Optional[Dict[str, Any]]: A dictionary containing transaction information if found, else None.
+    """
+    console_logger.debug(f"Fetching transactions for device_id: {device_id}")
+    container = get_container("COSMOS_DB_CONTAINER_TRANSACTIONS", "transactions")
+    query = build_projection_query(TRANSACTION_FIELDS, "c.deviceId = @device_id")
+    try:
+        transaction_info = await query_items(container, query, [{"name": "@device_id", "value": device_id}],
+                                             partition_key = device_id, operation = "get_transactions")
+
+        console_logger.debug(f"Retrieved transaction_info: {transaction_info}")
+        # Return the first transaction if available, else None
+        return transaction_info[0] if transaction_info else None
+    except Exception as e:
+        console_logger.error(f"An error occurred while fetching transactions: {e}")
+        return None
+
+@console_tracer.start_as_current_span("get_notifications_async")
+async def get_notifications(device_id: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Retrieves notification information from the database using the provided device_id.
+
+    Args:
+        device_id (str): The ID of the device to retrieve notifications for.
+
+    Returns:
+        Optional[List[Dict[str, Any]]]: A list of dictionaries containing notification information if found, else None.
+    """
+    console_logger.debug(f"Fetching notifications for device_id: {device_id}")
+    container = get_container("COSMOS_DB_CONTAINER_NOTIFICATIONS", "notifications")
+    query = build_projection_query(NOTIFICATION_FIELDS, "c.deviceId = @device_id")
+    try:
+        notifications = await query_items(container, query, [{"name": "@device_id", "value": device_id}],
+                                          partition_key = device_id, operation = "get_notifications")
+
+        console_logger.debug(f"Retrieved notifications: {notifications}")
+        # Return the list of notifications if available, else None
+        return notifications if notifications else None
+    except Exception as e:
+        console_logger.error(f"An error occurred while fetching notifications: {e}")
+        return None
+
+@console_tracer.start_as_current_span("get_conversation_async")
+async def get_conversation(session_id: str, device_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Retrieves a specific conversation from the database using the provided session_id and device_id.
+    The session id is the document id, so this is a point read rather than a query.
+    For bucketed conversations only the most recent messages used for chat history are loaded.
+
+    Args:
+        session_id (str): The unique session ID of the conversation to retrieve.
+        device_id (str): The ID of the device associated with the conversation.
+
+    Returns:
+        Optional[Dict[str, Any]]: A dictionary containing the conversation details if found, else None.
+    """
+    console_logger.debug(f"Fetching conversation for session_id: {session_id} and device_id: {device_id}")
+    container = get_container("COSMOS_DB_CONTAINER_CONVERSATIONS", "conversations")
+
+    try:
+        conversation = await read_item(container, item_id = session_id, partition_key = device_id, operation = "get_conversation")
+        if conversation is not None and is_bucketed_header(conversation):
+            conversation["messages"] = await read_recent_messages(container, conversation)
+
+        console_logger.debug(f"Retrieved conversations details: {conversation}")
+        return conversation
+    except Exception as e:
+        console_logger.error(f"An error occurred while fetching the conversation: {e}")
+        return None
+
+@console_tracer.start_as_current_span("get_conversation_or_create_new_async")
+async def get_conversation_or_create_new(session_id: str, device_id: str, title: str) -> Optional[Dict[str, Any]]:
+    """
+    Retrieves an existing conversation based on session_id and device_id.
+    If no conversation is found, creates a new conversation with the provided title.
+
+    Args:
+        session_id (str): The unique session ID for the conversation.
+        device_id (str): The ID of the device associated with the conversation.
+        title (str): The title of the conversation.
+
+    Returns:
+        Optional[Dict[str, Any]]: The existing conversation if found, otherwise the newly created conversation.
+    """
+    console_logger.debug(f"Attempting to retrieve conversation for session_id: '{session_id}' and device_id: '{device_id}'.")
+    session_info = await get_conversation(session_id, device_id)
+
+    if session_info:
+        return session_info
+    else:
+        return utils_db.create_new_conversation(device_id = device_id, session_id = session_id, title = title)
+
+@console_tracer.start_as_current_span("add_messages_to_conversation_async")
+async def add_messages_to_conversation(conversation: Dict[str, Any], messages: List[Dict[str, str]]) -> bool:
+    """
+    Adds a list of messages to an existing conversation and updates it in the database.
+
+    Args:
+        conversation (Dict[str, Any]): The conversation to which messages will be added.
+        messages (List[Dict[str, str]]): A list of messages, each containing 'content' and 'role'.
+
+    Returns:
+        bool: True if the operation was successful, False otherwise.
+    """
+    console_logger.debug(f"Adding {len(messages)} messages to conversation ID: {conversation['id']} for device ID: {conversation['deviceId']}.")
+    container = get_container("COSMOS_DB_CONTAINER_CONVERSATIONS", "conversations")
+    # Messages queued for a background write keep the time they were produced
+    new_messages = [{"content": message["content"], "role": message["role"], "timestamp": message.get("timestamp") or datetime.now(timezone.utc).isoformat()} for message in messages]
+    try:
+        # The in-memory conversation is only updated once the write succeeds, so a failed call can be retried
+        if conversation_storage_mode == "bucketed":
+            await append_messages_to_buckets(container, conversation, new_messages)
+        else:
+            if "_etag" not in conversation:
+                # Built from the Redis chat window or new in this session: load the stored document, if any, so the upsert keeps its full history
+                stored = await read_item(container, item_id = conversation["id"], partition_key = conversation["deviceId"], operation = "get_conversation")
+                if stored is not None:
+                    conversation.clear()
+                    conversation.update(stored)
+            await upsert_item(container, {**conversation, "messages": conversation.get("messages", []) + new_messages}, operation = "add_messages_to_conversation")
+        conversation.setdefault("messages", []).extend(new_messages)
+        return True
+    except Exception as e:
+        console_logger.error(f"An error occurred while adding messages to the conversation: {e}")
+        return False
+
+async def append_messages_to_buckets(container: ContainerProxy, conversation: Dict[str, Any], new_messages: List[Dict[str, Any]]) -> None:
+    """
+    Appends messages to a bucketed conversation in one transactional batch.
+
+    The header is point read to find the current message count, then the batch appends to the
+    latest bucket with patch operations, creates new buckets as they fill up and advances the
+    header. Write cost stays constant no matter how long the conversation gets. The header etag
+    guards against a concurrent writer; a conflicting batch fails as a whole and can be retried.
+    """
+    session_id = conversation["id"]
+    device_id = conversation["deviceId"]
+    header = await read_item(container, item_id = session_id, partition_key = device_id, operation = "get_conversation_header")
+
+    if header is not None and not is_bucketed_header(header):
+        # Conversation stored as a single document before bucketing was enabled: append in place, in one
+        # transactional batch, so a failed attempt writes nothing and can be retried. Only the first patch
+        # is guarded by the etag, since it changes the etag the later patches of the batch would see.
+        legacy_operations: List[tuple] = []
+        for start in range(0, len(new_messages), max_patch_operations):
+            patch = (session_id, [{"op": "add", "path": "/messages/-", "value": message} for message in new_messages[start:start + max_patch_operations]])
+            legacy_operations.append(("patch", patch, {"if_match_etag": header["_etag"]}) if start == 0 else ("patch", patch))
+        await execute_item_batch(container, legacy_operations, partition_key = device_id, operation = "add_messages_to_conversation")
+        return
+
+    message_count = header.get("messageCount", 0) if header else 0
+    bucket_size = header.get("bucketSize", conversation_bucket_size) if header else conversation_bucket_size
+    timestamp = datetime.now(timezone.utc).isoformat()
+
+    batch_operations: List[tuple] = []
+    if header is None:
+        batch_operations.append(("create", ({
+            "id": session_id,
+            "deviceId": device_id,
+            "title": conversation.get("title", ""),
+            "timestamp": conversation.get("timestamp", timestamp),
+            "storage": "bucketed",
+            "bucketSize": bucket_size,
+            "messageCount": len(new_messages),
+            "lastUpdated": timestamp,
+        },)))
+    else:
+        batch_operations.append(("patch", (session_id, [
+            {"op": "incr", "path": "/messageCount", "value": len(new_messages)},
+            {"op": "set", "path": "/lastUpdated", "value": timestamp},
+        ]), {"if_match_etag": header["_etag"]}))
+
+    for bucket, bucket_messages in group_by_bucket(message_count, bucket_size, new_messages).items():
+        is_new_bucket = bucket * bucket_size >= message_count
+        if is_new_bucket:
+            batch_operations.append(("create", ({
+                "id": get_bucket_id(session_id, bucket),
+                "deviceId": device_id,
+                "sessionId": session_id,
+                "bucket": bucket,
+                "messages": bucket_messages,
+            },)))
+        else:
+            for start in range(0, len(bucket_messages), max_patch_operations):
+                batch_operations.append(("patch", (get_bucket_id(session_id, bucket),
+                    [{"op": "add", "path": "/messages/-", "value": message} for message in bucket_messages[start:start + max_patch_operations]])))
+
+    await execute_item_batch(container, batch_operations, partition_key = device_id, operation = "add_messages_to_conversation")
+
+@console_tracer.start_as_current_span("raise_customer_ticket_async")
+async def raise_customer_ticket(device_id: str,
+                                title: str,
+                                description: str) -> bool:
+    """
+    Raises a customer support ticket for a specific device.
+
+    Args:
+        device_id (str): The unique identifier of the device associated with the ticket.
+        title (str): The title or summary of the issue.
+        description (str): A detailed description of the issue.
+
+    Returns:
+        bool: True if the ticket was created, False otherwise.
+
+    Raises:
+        ValueError: If any of the required parameters are empty.
+    """
+    # Input Validation
+    if not device_id.strip():
+        raise ValueError("device_id cannot be empty.")
+    if not title.strip():
+        raise ValueError("title cannot be empty.")
+    if not description.strip():
+        raise ValueError("description cannot be empty.")
+    try:
+        console_logger.debug(f'raising ticket for device id device_id: {device_id}')
+        container = get_container("COSMOS_DB_CONTAINER_TICKETS", "tickets")
+
+        # Create the ticket dictionary
+        ticket_id = str(uuid.uuid4())
+        ticket = {
+            "id": ticket_id,
+            "deviceId": device_id,
+            "title": title,
+            "description": description,
+        }
+
+        await upsert_item(container, ticket, operation = "raise_customer_ticket")
+        console_logger.debug("Successfully raised ticket with ID: %s", ticket_id)
+        return True
+    except exceptions.CosmosHttpResponseError as cosmos_err:
+        console_logger.error("Cosmos DB HTTP response error: %s", cosmos_err)
+    except Exception as e:
+        console_logger.error("An unexpected error occurred while raising ticket: %s", e)
+
+    return False
+
+@console_tracer.start_as_current_span("update_device_language_async")
+async def update_device_language(device_id: str, language: str) -> bool:
+    """
+    Updates the language setting for a specific device in the Cosmos DB.
+
+    Args:
+        device_id (str): The unique identifier of the device.
+        language (str): The language to set for the device.
+                        Must be one of ["English", "Hindi", "Marathi", "Kannada", "Tamil"].
+
+    Returns:
+        bool: True if the update was successful, False if it failed or the device was not found.
+
+    Raises:
+        ValueError: If `device_id` is empty or `language` is empty or not among the allowed languages.
+    """
+    # Allowed languages
+    allowed_languages = ["English", "Hindi", "Marathi", "Kannada", "Tamil"]
+
+    # Input Validation
+    if not device_id.strip():
+        raise ValueError("device_id cannot be empty.")
+    if not language.strip():
+        raise ValueError("language cannot be empty.")
+    if language.strip() not in allowed_languages:
+        raise ValueError(
+            f"language must be one of the following: {', '.join(allowed_languages)}."
+        )
+
+    try:
+        console_logger.debug(f"Updating device language for device_id: {device_id}, language: {language}")
+        container = get_container("COSMOS_DB_CONTAINER_DEVICES", "devices")
+
+        # Only the document id is needed to patch the device, so project just that
+        device_ids = await query_items(container, "SELECT VALUE c.id FROM c WHERE c.deviceId = @device_id",
+                                       [{"name": "@device_id", "value": device_id}],
+                                       partition_key = device_id, operation = "update_device_language_lookup")
+
+        console_logger.debug(f"Retrieved device ids: {device_ids}")
+
+        if not device_ids:
+            console_logger.warning(f"No device found with device_id: {device_id}")
+            return False
+
+        # Assume the first device is the target for update
+        await patch_item(container, item_id = device_ids[0], partition_key = device_id,
+                         patch_operations = [{"op": "set", "path": "/language", "value": language}],
+                         operation = "update_device_language")
+        await utils_cache.device_cache.invalidate(device_id)
+        console_logger.debug(f"Successfully updated device with ID: {device_id}")
+        return True
+
+    except exceptions.CosmosHttpResponseError as cosmos_err:
+        console_logger.error(f"Cosmos DB HTTP response error: {cosmos_err}")
+    except Exception as e:
+        console_logger.error(f"An unexpected error occurred while updating the language: {e}")
+
+    return False
+
+@console_tracer.start_as_current_span("update_device_notification_async")
+async def update_device_notification(device_id: str, notification_id: str, notification_time: str, status: str) -> bool:
+    """
+    Updates the status and notification time for a specific notification associated with a device in Cosmos DB.
+
+    Args:
+        device_id (str): The unique identifier of the device.
+        notification_id (str): The unique identifier of the notification to be updated.
+        notification_time (str): The new notification time to set.
+        status (str): The new status for the notification. Must be either "enabled" or "disabled".
+
+    Returns:
+        bool: True if the update was successful, False if it failed or the notification was not found.
+
+    Raises:
+        ValueError: If any argument is empty or `status` is not among the allowed statuses.
+    """
+    # Allowed statuses
+    allowed_statuses = ["enabled", "disabled"]
+
+    # Input Validation
+    if not device_id.strip():
+        raise ValueError("device_id cannot be empty.")
+    if not notification_id.strip():
+        raise ValueError("notification_id cannot be empty.")
+    if not notification_time.strip():
+        raise ValueError("notification_time cannot be empty.")
+    if not status.strip() or status.strip().lower() not in allowed_statuses:
+        raise ValueError(
+            f"status must be one of the following: {', '.join(allowed_statuses)}."
+        )
+
+    # Normalize status to lowercase to maintain consistency
+    status = status.strip().lower()
+
+    try:
+        console_logger.debug(f"Updating notification status for device_id: {device_id}, notification_id: {notification_id}")
+        container = get_container("COSMOS_DB_CONTAINER_NOTIFICATIONS", "notifications")
+
+        # Only the document id is needed to patch the notification, so project just that
+        notification_ids = await query_items(container,
+                                             "SELECT VALUE c.id FROM c WHERE c.deviceId = @device_id AND c.notification_id = @notification_id",
+                                             [{"name": "@device_id", "value": device_id},
+                                              {"name": "@notification_id", "value": notification_id}],
+                                             partition_key = device_id, operation = "update_device_notification_lookup")
+
+        console_logger.debug(f"Retrieved notification ids: {notification_ids}")
+
+        if not notification_ids:
+            console_logger.warning(f"No notification found with device_id: {device_id} and notification_id: {notification_id}")
+            return False
+
+        # Assume the first notification is the target for update
+        await patch_item(container, item_id = notification_ids[0], partition_key = device_id,
+                         patch_operations = [{"op": "set", "path": "/status", "value": status},
+                                             {"op": "set", "path": "/notificationTime", "value": notification_time}],
+                         operation = "update_device_notification")
+        console_logger.info(f"Successfully updated notification with ID: {notification_id}")
+        return True
+
+    except exceptions.CosmosHttpResponseError as cosmos_err:
+        console_logger.error(f"Cosmos DB HTTP response error: {cosmos_err}")
+    except Exception as e:
+        console_logger.error(f"An unexpected error occurred while updating the notification: {e}")
+
+    return False
+
+@console_tracer.start_as_current_span("get_khatabook_async")
+async def get_khatabook(device_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Retrieves khatabook information from the database using the provided device_id.
+
+    Args:
+        device_id (str): The ID of the device to retrieve khatabook for.
+
+    Returns:
+        Optional[Dict[str, Any]]: A dictionary containing khatabook information if found, else None.
+    """
+    console_logger.debug(f"Fetching khatabook for device_id: {device_id}")
+    container = get_container("COSMOS_DB_CONTAINER_KHATABOOK", "khatabook")
+    query = build_projection_query(KHATABOOK_FIELDS, "c.deviceId = @device_id")
+    try:
+        khatabook_info = await query_items(container, query, [{"name": "@device_id", "value": device_id}],
+                                           partition_key = device_id, operation = "get_khatabook")
+
+        console_logger.debug(f"Retrieved khatabook_info: {khatabook_info}")
+        # Return the first khatabook if available, else None
+        return khatabook_info[0] if khatabook_info else None
+    except Exception as e:
+        console_logger.error(f"An error occurred while fetching khatabook: {e}")
+        return None
+
+@console_tracer.start_as_current_span("update_khatabook_async")
+async def update_khatabook(device_id: str, receivedFrom: str, amount: int) -> str:
+    """
+    Updates the khatabook with given name/amount associated with a device in Cosmos DB.
+
+    Args:
+        device_id (str): The unique identifier of the device.
+        receivedFrom (str): name of the person who gave the amount.
+        amount (int): The amount given by the person.
+
+    Returns:
+        str: message indicating the khatabook update is successful or not.
+
+    Raises:
+        ValueError: If `device_id` or `receivedFrom` is empty, or if `amount` is 0.
+    """
+    # Input Validation
+    if not device_id.strip():
+        raise ValueError("device_id cannot be empty.")
+    if not receivedFrom.strip():
+        raise ValueError("receivedFrom cannot be empty.")
+    if amount == 0:
+        raise ValueError("amount cannot be zero.")
+
+    try:
+        console_logger.debug(f"Updating khatabook for device_id: {device_id}, received form : {receivedFrom}, amount: {amount}")
+        container = get_container("COSMOS_DB_CONTAINER_KHATABOOK", "khatabook")
+        query = build_projection_query(KHATABOOK_FIELDS, "c.deviceId = @device_id")
+
+        # Fetch khatabooks matching the device_id
+        khatabook_list = await query_items(container, query, [{"name": "@device_id", "value": device_id}],
+                                           partition_key = device_id, operation = "update_khatabook_lookup")
+
+        console_logger.debug(f"Retrieved khatabooks : {khatabook_list}")
+
+        if not khatabook_list:
+            console_logger.warning(f"No khatabook found with device_id: {device_id} ")
+            return 'no khatabook found for this device. please raise a ticket'
+
+        # Assume the first khatabook is the target for update
+        khatabook = khatabook_list[0]
+        khatabook["totalCollection"] += amount
+        khatabook["last10Transactions"].append({"receivedFrom": receivedFrom, "amount": amount, "transactionTime": datetime.now(timezone.utc).strftime("%Y:%m:%d %H:%M:%S")})
+
+        # sort khatabook["last10Transactions"] based on transactionTime descending order and retain max 10 transactions
+        khatabook["last10Transactions"] = sorted(khatabook["last10Transactions"], key = lambda x: x["transactionTime"], reverse = True)[:10]
+
+        # Patch only the changed fields so projected-away properties of the document are preserved
+        await patch_item(container, item_id = khatabook["id"], partition_key = device_id,
+                         patch_operations = [{"op": "set", "path": "/totalCollection", "value": khatabook["totalCollection"]},
+                                             {"op": "set", "path": "/last10Transactions", "value": khatabook["last10Transactions"]}],
+                         operation = "update_khatabook")
+        console_logger.info(f"Successfully updated khatabook for device id : {device_id}")
+
+        return f'Successfully updated khatabook with amout {amount} received from {receivedFrom}'
+
+    except exceptions.CosmosHttpResponseError as cosmos_err:
+        console_logger.error(f"Cosmos DB HTTP response error: {cosmos_err}")
+    except Exception as e:
+        traceback.print_exc()
+        console_logger.error(f"An unexpected error occurred while updating the khatabook: {e}")
+
+    return 'issue in updating the khatabook. please raise a ticket'
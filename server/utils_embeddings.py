@@ -0,0 +1,105 @@
+# Standard Library Imports
+from typing import List, Optional
+import hashlib
+import re
+import unicodedata
+
+import os
+
+# Third-Party Imports
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from server import utils_cache
+from server import utils_logger
+console_logger, console_tracer = utils_logger.get_logger_tracer()
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes text before hashing so that trivially different phrasings share a cache entry:
+    unicode NFKC, case folding and collapsed whitespace.
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip().casefold()
+
+def _float16_dumps(embedding: List[float]) -> bytes:
+    # float16 halves the Redis footprint (3 KB for a 1536 dimension vector) at no measurable cost to cosine ranking
+    return np.asarray(embedding, dtype=np.float16).tobytes()
+
+def _float16_loads(data: bytes) -> List[float]:
+    return np.frombuffer(data, dtype=np.float16).astype(np.float32).tolist()
+
+def get_embedding_cache() -> utils_cache.TwoTierCache:
+    """
+    Creates the embedding cache. Local tier size and both TTLs are configurable, Redis memory beyond
+    the TTL is bounded by the server's maxmemory eviction policy.
+    """
+    return utils_cache.TwoTierCache(
+        namespace="embedding",
+        max_items=int(os.getenv("EMBEDDING_CACHE_MAX_ITEMS", "5000")),
+        local_ttl_seconds=float(os.getenv("EMBEDDING_CACHE_LOCAL_TTL", "86400")),
+        redis_ttl_seconds=int(os.getenv("EMBEDDING_CACHE_REDIS_TTL", "604800")),
+        serializer=_float16_dumps,
+        deserializer=_float16_loads,
+    )
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves repeated texts from a two-tier (in-process LRU + Redis) cache.
+
+    Entries are keyed by a hash of the normalized text and the embedding deployment name, so
+    switching deployments never returns vectors from a different model.
+    """
+    def __init__(self, embeddings: Embeddings, deployment: str, cache: Optional[utils_cache.TwoTierCache] = None) -> None:
+        self.embeddings = embeddings
+        self.deployment = deployment
+        self.cache = cache if cache is not None else get_embedding_cache()
+
+    def cache_key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.deployment}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    @console_tracer.start_as_current_span("CachedEmbeddings - embed_documents")
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.cache_key(text) for text in texts]
+        embeddings = [self.cache.get_sync(key) for key in keys]
+
+        missing = [index for index, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            # Embed all misses in one request
+            new_embeddings = self.embeddings.embed_documents([texts[index] for index in missing])
+            for index, embedding in zip(missing, new_embeddings):
+                self.cache.set_sync(keys[index], embedding)
+                embeddings[index] = embedding
+
+        return embeddings
+
+    @console_tracer.start_as_current_span("CachedEmbeddings - embed_query")
+    def embed_query(self, text: str) -> List[float]:
+        key = self.cache_key(text)
+        embedding = self.cache.get_sync(key)
+        if embedding is None:
+            embedding = self.embeddings.embed_query(text)
+            self.cache.set_sync(key, embedding)
+        return embedding
+
+    @console_tracer.start_as_current_span("CachedEmbeddings - aembed_documents")
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.cache_key(text) for text in texts]
+        embeddings = [await self.cache.get(key) for key in keys]
+
+        missing = [index for index, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            new_embeddings = await self.embeddings.aembed_documents([texts[index] for index in missing])
+            for index, embedding in zip(missing, new_embeddings):
+                await self.cache.set(keys[index], embedding)
+                embeddings[index] = embedding
+
+        return embeddings
+
+    @console_tracer.start_as_current_span("CachedEmbeddings - aembed_query")
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self.cache_key(text)
+        embedding = await self.cache.get(key)
+        if embedding is None:
+            embedding = await self.embeddings.aembed_query(text)
+            await self.cache.set(key, embedding)
+        return embedding
@@ -0,0 +1,107 @@
+# Standard Library Imports
+from typing import Dict, List, Optional, Tuple
+import asyncio
+
+import os
+
+# Third-Party Imports
+import numpy as np
+import azure.cognitiveservices.speech as speechsdk
+
+from server import utils_codecs
+from server import utils_tts_cache
+from server import utils_tts_pool
+from server import utils_logger
+console_logger, console_tracer = utils_logger.get_logger_tracer()
+
+filler_audio_enabled: bool = os.getenv("FILLER_AUDIO_ENABLED", "True").lower() == "true"
+# Filler audio is streamed in chunks of about this duration, split on frame boundaries of the codec and
+# paced in real time, so that it can be cut off as soon as the answer's audio is ready
+filler_chunk_ms: int = 100
+# Filler audio is sent this far ahead of real time, to ride over network jitter
+filler_lead_ms: int = 200
+filler_fade_ms: int = 20
+
+# One phrase per device language, see utils_db.update_device_language
+filler_phrases: Dict[str, str] = {
+    "English": "One moment please, I am checking the details.",
+    "Hindi": "एक पल रुकिए, मैं जानकारी देख रही हूँ।",
+    "Marathi": "एक क्षण थांबा, मी माहिती तपासत आहे.",
+    "Kannada": "ಒಂದು ಕ್ಷಣ, ನಾನು ಮಾಹಿತಿಯನ್ನು ಪರಿಶೀಲಿಸುತ್ತಿದ್ದೇನೆ.",
+    "Tamil": "ஒரு நிமிடம், நான் தகவலைச் சரிபார்க்கிறேன்.",
+}
+
+# Rendered filler clips split into chunks, by phrase, voice and codec
+_filler_audio: Dict[Tuple[str, str, str], List[utils_codecs.AudioFrame]] = {}
+
+def synthesize(text: str, voice_name: str, output_format: speechsdk.SpeechSynthesisOutputFormat) -> Optional[bytes]:
+    """
+    Synthesizes `text` in one call with a pooled synthesizer. Blocking, run it in a worker thread.
+    """
+    pooled_synthesizer = utils_tts_pool.synthesizer_pool.checkout(voice_name, output_format)
+    try:
+        result = pooled_synthesizer.synthesizer.speak_text_async(text).get()
+        if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
+            return result.audio_data
+        console_logger.error(f"Filler synthesis failed: {result.reason}")
+        return None
+    finally:
+        utils_tts_pool.synthesizer_pool.checkin(pooled_synthesizer)
+
+async def get_filler_audio(language: str, voice_name: str, codec: utils_codecs.AudioCodec) -> Optional[List[utils_codecs.AudioFrame]]:
+    """
+    Returns the rendered filler clip for a language in the negotiated codec, from memory, the TTS cache
+    or a one-time synthesis, split into chunks that can be streamed one at a time.
+
+    Args:
+        language (str): The device language, falls back to English.
+        voice_name (str): The synthesis voice.
+        codec (utils_codecs.AudioCodec): The audio encoding negotiated with the client.
+
+    Returns:
+        Optional[List[utils_codecs.AudioFrame]]: The chunks of the clip and their durations, or None if synthesis failed.
+    """
+    phrase = filler_phrases.get(language, filler_phrases["English"])
+    key = (phrase, voice_name, codec.name)
+    chunks = _filler_audio.get(key)
+    if chunks is not None:
+        return chunks
+
+    cache_key = utils_tts_cache.get_tts_cache_key(phrase, voice_name, codec.output_format)
+    audio = await utils_tts_cache.tts_cache.get(cache_key)
+    if audio is None:
+        try:
+            audio = await asyncio.to_thread(synthesize, phrase, voice_name, codec.output_format)
+        except Exception as e:
+            console_logger.error(f"Error rendering {codec.name} filler audio for {language}: {e}")
+            return None
+        if audio is None:
+            return None
+        await utils_tts_cache.tts_cache.set(cache_key, audio)
+    chunks = split_filler_audio(audio, codec)
+    _filler_audio[key] = chunks
+    return chunks
+
+async def prewarm_filler_audio(voice_name: str, codecs: List[utils_codecs.AudioCodec]) -> None:
+    """
+    Renders the filler clip of every language in every codec ahead of the first request.
+    """
+    await asyncio.gather(*(get_filler_audio(language, voice_name, codec) for codec in codecs for language in filler_phrases))
+
+def split_filler_audio(audio: bytes, codec: utils_codecs.AudioCodec) -> List[utils_codecs.AudioFrame]:
+    """
+    Splits a clip into chunks of about `filler_chunk_ms`, so that it is only ever cut on a frame boundary.
+    """
+    return codec.split_chunks(audio, filler_chunk_ms)
+
+def fade_out(chunk: bytes, codec: utils_codecs.AudioCodec) -> Optional[bytes]:
+    """
+    Returns the first `filler_fade_ms` of a 16 bit PCM chunk with a linear fade to silence,
+    so that cutting the filler short does not click. Compressed chunks cannot be faded and
+    return None; they are cut on a frame boundary instead.
+    """
+    if not codec.pcm_bytes_per_ms:
+        return None
+    samples = np.frombuffer(chunk[:filler_fade_ms * codec.pcm_bytes_per_ms], dtype=np.int16)
+    faded = samples * np.linspace(1.0, 0.0, num=len(samples))
+    return faded.astype(np.int16).tobytes()
@@ -0,0 +1,106 @@
+# Standard Library Imports
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import struct
+
+from server import utils_logger
+console_logger, console_tracer = utils_logger.get_logger_tracer()
+
+# Binary stream framing used by the HTTP streaming endpoints when a client asks for framing="binary".
+# Every frame is a 1 byte frame type, a 4 byte big-endian payload length and the payload.
+FRAME_AUDIO: int = 0x01  # Payload is audio in the negotiated codec, see utils_codecs
+FRAME_TRANSCRIPT: int = 0x02  # Payload is the UTF-8 transcript of the user's speech
+FRAME_METRICS: int = 0x03  # Payload is a UTF-8 JSON object of response metrics
+FRAME_HEADER = struct.Struct(">BI")
+
+framing_json: str = "json"
+framing_binary: str = "binary"
+stream_framings = (framing_json, framing_binary)
+
+def get_stream_framing(name: Optional[str]) -> str:
+    """
+    Returns the framing a client asked for, or JSON for older clients that do not ask or ask for an unknown framing.
+    """
+    if not name:
+        return framing_json
+    framing = name.strip().lower()
+    if framing not in stream_framings:
+        console_logger.warning(f"Unsupported stream framing '{name}' requested, falling back to {framing_json}")
+        return framing_json
+    return framing
+
+def encode_frame(frame_type: int, payload: bytes) -> bytes:
+    return FRAME_HEADER.pack(frame_type, len(payload)) + payload
+
+def encode_text_frame(frame_type: int, text: str) -> bytes:
+    return encode_frame(frame_type, text.encode("utf-8"))
+
+def encode_json_frame(frame_type: int, value: Dict[str, Any]) -> bytes:
+    return encode_frame(frame_type, json.dumps(value).encode("utf-8"))
+
+class FrameDecoder:
+    """
+    Incrementally decodes a stream of binary frames, as chunks of it arrive.
+
+    Frames that lie entirely inside one received chunk are returned as memoryview slices of that
+    chunk, without copying. Only a frame split across chunks is copied, into a buffer of its exact size.
+    """
+    def __init__(self) -> None:
+        self._header = bytearray()
+        self._frame_type: Optional[int] = None
+        self._payload: Optional[bytearray] = None
+        self._payload_filled: int = 0
+
+    def feed(self, data: bytes) -> List[Tuple[int, memoryview]]:
+        """
+        Adds a received chunk and returns the frames that are complete.
+
+        Args:
+            data (bytes): The next chunk of the stream.
+
+        Returns:
+            List[Tuple[int, memoryview]]: The type and payload of each complete frame, in order.
+        """
+        view = memoryview(data)
+        frames: List[Tuple[int, memoryview]] = []
+        pos = 0
+        end = len(view)
+        while pos < end:
+            if self._payload is not None:
+                # Continue a frame split across chunks
+                count = min(len(self._payload) - self._payload_filled, end - pos)
+                self._payload[self._payload_filled:self._payload_filled + count] = view[pos:pos + count]
+                self._payload_filled += count
+                pos += count
+                if self._payload_filled == len(self._payload):
+                    frames.append((self._frame_type, memoryview(self._payload)))
+                    self._payload = None
+                continue
+
+            if self._header or end - pos < FRAME_HEADER.size:
+                # Header split across chunks
+                count = min(FRAME_HEADER.size - len(self._header), end - pos)
+                self._header += view[pos:pos + count]
+                pos += count
+                if len(self._header) < FRAME_HEADER.size:
+                    break
+                frame_type, length = FRAME_HEADER.unpack(self._header)
+                self._header.clear()
+            else:
+                frame_type, length = FRAME_HEADER.unpack_from(view, pos)
+                pos += FRAME_HEADER.size
+
+            if end - pos >= length:
+                frames.append((frame_type, view[pos:pos + length]))
+                pos += length
+            else:
+                self._frame_type = frame_type
+                self._payload = bytearray(length)
+                self._payload_filled = 0
+        return frames
+
+    def is_complete(self) -> bool:
+        """
+        Returns True if the stream ended on a frame boundary.
+        """
+        return self._payload is None and not self._header
@@ -1,5 +1,8 @@
 import os
+import threading
+from collections import OrderedDict
 from datetime import datetime
+from typing import Dict, FrozenSet, Iterable
 
 from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_community.vectorstores.azuresearch import AzureSearch
@@ -7,7 +10,9 @@ from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.tools import tool
 from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
 
-from server import utils_db  
+from server import utils_db_async
+from server import utils_embeddings
+from server import utils_tool_router
 from server import utils_logger
 console_logger, console_tracer = utils_logger.get_logger_tracer()
 
@@ -17,9 +22,13 @@ azure_embedding_deployment: str = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT",
 doc_index : str = os.getenv("AZURE_AI_SEARCH_INDEX_DOC", "NA")
 tool_index : str = os.getenv("AZURE_AI_SEARCH_INDEX_TOOL", "NA")
 
-embedding_function = AzureOpenAIEmbeddings(
-        azure_deployment= azure_embedding_deployment,
-        openai_api_version= azure_openai_api_version 
+# Shared by tool routing and both vector stores, so repeated phrasings are embedded once across the fleet
+embedding_function = utils_embeddings.CachedEmbeddings(
+        AzureOpenAIEmbeddings(
+            azure_deployment= azure_embedding_deployment,
+            openai_api_version= azure_openai_api_version 
+        ),
+        deployment= azure_embedding_deployment
     )
 
 llm_gpt_4o = AzureChatOpenAI(
@@ -45,6 +54,14 @@ vector_store_tool = AzureSearch(
             embedding_function=embedding_function,
     )
 
+# "local" routes tools in process and falls back to the Azure AI Search tool index on failure, "remote" always uses the index
+tool_router_mode: str = os.getenv("TOOL_ROUTER_MODE", "local").lower()
+tool_router = utils_tool_router.ToolRouter(
+    embedding_function=embedding_function,
+    deployment=azure_embedding_deployment,
+    persist_path=os.getenv("TOOL_ROUTER_EMBEDDINGS_PATH", None)
+)
+
 agent_system_prompt_instructions = """
     You are a helpful AI audio device assistant named SoundPod. generate feminine response. 
     Use the provided context to answer the user's question concisely and informatively. 
@@ -82,7 +99,7 @@ agent_prompt = ChatPromptTemplate.from_messages([
 ])
 
 @tool
-def get_device_info(device_id: str) -> str:
+async def get_device_info(device_id: str) -> str:
     """  
     Retrieves 
     device information (Device identifier, Device ID, Associated customer's name, Purchase,  Announcement Language, binding status, 
@@ -92,11 +109,11 @@ def get_device_info(device_id: str) -> str:
     Device status
     """
     console_logger.debug(f'get_device_info wrapper called with device_id: {device_id}')
-    deivce_info = utils_db.get_device_info(device_id = device_id)
+    deivce_info = await utils_db_async.get_device_info(device_id = device_id)
     return deivce_info
 
 @tool
-def get_transactions_info(device_id: str) -> str:
+async def get_transactions_info(device_id: str) -> str:
     """  
     Retrieve all transactions for a specified device.  
             - deviceId (str): Unique identifier of the device.  
@@ -109,11 +126,11 @@ def get_transactions_info(device_id: str) -> str:
                 - announcementTime (str): Timestamp 1-15 seconds after the transaction time.  
     """  
     console_logger.debug(f'get_transactions_info wrapper called with device_id: {device_id}')
-    transaction_info = utils_db.get_transactions(device_id = device_id)
+    transaction_info = await utils_db_async.get_transactions(device_id = device_id)
     return transaction_info
 
 @tool
-def get_notification_info(device_id: str) -> str:
+async def get_notification_info(device_id: str) -> str:
     """  
      Retrieve all notification/announcements for a specified device.  
     
@@ -127,7 +144,7 @@ def get_notification_info(device_id: str) -> str:
             - notificationTime (str): Scheduled time for the notification /annoncement using cron job format.  
     """  
     console_logger.debug(f'get_notification_info wrapper called with device_id: {device_id}')
-    notification_info = utils_db.get_notifications(device_id = device_id)
+    notification_info = await utils_db_async.get_notifications(device_id = device_id)
     return notification_info
 
 @tool
@@ -153,7 +170,7 @@ def get_troubleshooting_guide(query: str) -> str:
     return troubleshooting_docs
 
 @tool
-def raise_ticket(session_id:str, device_id: str, title:str, description:str) -> bool:
+async def raise_ticket(session_id:str, device_id: str, title:str, description:str) -> bool:
     """
     Scenarios:
     1. Create a support ticket for a specific device and user query.  
@@ -172,10 +189,10 @@ def raise_ticket(session_id:str, device_id: str, title:str, description:str) ->
     console_logger.debug(f'raise_ticket wrapper called with title: {title}')
     console_logger.debug(f'raise_ticket wrapper called with description: {description}')
     
-    return utils_db.raise_customer_ticket(device_id = device_id, title = title, description = description)
+    return await utils_db_async.raise_customer_ticket(device_id = device_id, title = title, description = description)
 
 @tool
-def update_device_language(device_id: str, language:str) -> bool:
+async def update_device_language(device_id: str, language:str) -> bool:
     """
     Updates the language setting for a specific device in the Cosmos DB.  
   
@@ -187,10 +204,10 @@ def update_device_language(device_id: str, language:str) -> bool:
     console_logger.debug(f'raise_ticket wrapper called with device_id: {device_id}')
     console_logger.debug(f'raise_ticket wrapper called with session_id: {language}')
     
-    return utils_db.update_device_language(device_id = device_id, language = language)
+    return await utils_db_async.update_device_language(device_id = device_id, language = language)
 
 @tool
-def update_device_notifications(device_id:str, notification_id: str, notification_time:str, status:str) -> bool:
+async def update_device_notifications(device_id:str, notification_id: str, notification_time:str, status:str) -> bool:
     """
     Updates the status and notification/announcement time for a specific notification/announcement associated with a device in Cosmos DB.  
   
@@ -205,10 +222,10 @@ def update_device_notifications(device_id:str, notification_id: str, notificatio
     console_logger.debug(f'update_device_notifications wrapper called with title: {notification_time}')
     console_logger.debug(f'update_device_notifications wrapper called with description: {status}')
     
-    return utils_db.update_device_notification(device_id = device_id, notification_id = notification_id, notification_time = notification_time, status = status)
+    return await utils_db_async.update_device_notification(device_id = device_id, notification_id = notification_id, notification_time = notification_time, status = status)
 
 @tool
-def get_khatabook(device_id: str) -> str:
+async def get_khatabook(device_id: str) -> str:
     """  
     user this function only when user specifically asks for khatabook/ledger/cash transaction entries.
     Retrieve all khatabook / ledger / cash transaction entries for a specified device.     
@@ -225,11 +242,11 @@ def get_khatabook(device_id: str) -> str:
     """  
     console_logger.debug(f'get_khatabook wrapper called with device_id: {device_id}')
 
-    khatabook_info = utils_db.get_khatabook(device_id = device_id)
+    khatabook_info = await utils_db_async.get_khatabook(device_id = device_id)
     return khatabook_info
 
 @tool
-def update_khatabook(device_id: str, receivedFrom:str, amount: int) -> str:
+async def update_khatabook(device_id: str, receivedFrom:str, amount: int) -> str:
     """  
     use this function only when user specifically asks questions like
         -  update khatabook / ledger / cash transaction entries for a specified device. 
@@ -247,7 +264,7 @@ def update_khatabook(device_id: str, receivedFrom:str, amount: int) -> str:
     console_logger.debug(f'update_khatabook wrapper called with device_id: {device_id}')
     console_logger.debug(f'update_khatabook wrapper called with receivedFrom: {receivedFrom}')
     console_logger.debug(f'update_khatabook wrapper called with amount: {amount}')
-    msg = utils_db.update_khatabook(device_id = device_id, receivedFrom = receivedFrom, amount = amount)
+    msg = await utils_db_async.update_khatabook(device_id = device_id, receivedFrom = receivedFrom, amount = amount)
     console_logger.debug(f'update_khatabook returned msg: {msg}')
     return msg
 
@@ -263,15 +280,81 @@ tool_map = {
     "update_khatabook": update_khatabook
 }
 
+@console_tracer.start_as_current_span("route_tools")
+def route_tools(query: str, k: int = 3) -> list[str]:
+    """
+    Returns the names of the `k` tools most relevant to the query.
+    Uses the in-process tool router, with the Azure AI Search tool index as fallback.
+    """
+    if tool_router_mode == "local":
+        try:
+            return tool_router.route(query = query, k = k)
+        except Exception as e:
+            console_logger.error(f"Local tool routing failed, falling back to Azure AI Search: {e}")
+
+    filtered_tools = vector_store_tool.similarity_search(query = query, k = k)
+    return [filtered_tool.metadata["tool"] for filtered_tool in filtered_tools]
+
+# Agent executors keyed by the set of tools they are bound to. Building one serializes the tool
+# schemas and binds them to the LLM, so each is built once and kept, least recently used first out
+# beyond AGENT_EXECUTOR_MAX_ITEMS. Executors hold no per-request state: inputs, chat history and
+# callbacks are passed on every invocation, so concurrent requests can safely share one.
+agent_executor_max_items: int = int(os.getenv("AGENT_EXECUTOR_MAX_ITEMS", "64"))
+agent_executors: "OrderedDict[FrozenSet[str], AgentExecutor]" = OrderedDict()
+agent_executors_lock = threading.Lock()
+agent_executor_stats: Dict[str, int] = {"hits": 0, "builds": 0, "evictions": 0}
+
+def get_agent_executor_for_tools(tool_names: Iterable[str]) -> AgentExecutor:
+    """
+    Returns the agent executor bound to the given tools, building and registering it on first use.
+    """
+    key = frozenset(tool_names)
+    with agent_executors_lock:
+        agent_executor = agent_executors.get(key)
+        if agent_executor is not None:
+            agent_executors.move_to_end(key)
+            agent_executor_stats["hits"] += 1
+            return agent_executor
+
+        tools = [tool_map[tool_name] for tool_name in sorted(key)]
+        agent = create_tool_calling_agent(llm_gpt_4o, tools, agent_prompt)
+        agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
+        agent_executors[key] = agent_executor
+        agent_executor_stats["builds"] += 1
+        while len(agent_executors) > agent_executor_max_items:
+            agent_executors.popitem(last=False)
+            agent_executor_stats["evictions"] += 1
+        console_logger.debug(f'Registered agent executor for tools: {sorted(key)}')
+    return agent_executor
+
+def get_agent_executor_stats() -> Dict[str, int]:
+    with agent_executors_lock:
+        return {"size": len(agent_executors), **agent_executor_stats}
+
+@console_tracer.start_as_current_span("prewarm_agent_executors")
+def prewarm_agent_executors(k: int = 3) -> int:
+    """
+    Builds the agent executors for the tool subsets the router is likely to return, so most requests
+    do not pay for it. Only subsets of routable tools can be returned, and most of their `k` sized
+    combinations never are, see ToolRouter.get_likely_tool_subsets.
+
+    Returns:
+        int: The number of registered agent executors.
+    """
+    try:
+        tool_subsets = tool_router.get_likely_tool_subsets(k = k)
+    except Exception as e:
+        console_logger.error(f"Could not compute the likely tool subsets, agent executors are not prewarmed: {e}")
+        return 0
+    for tool_names in tool_subsets[:agent_executor_max_items]:
+        get_agent_executor_for_tools(tool_names)
+    console_logger.info(f'Prewarmed {len(agent_executors)} agent executors')
+    return len(agent_executors)
+
 @console_tracer.start_as_current_span("get_agent_executor")
 def get_agent_executor(query: str):
-    filtered_tools = vector_store_tool.similarity_search(query = query, k = 3)
-    
-    tools = []
-    for filtered_tool in filtered_tools:
-        console_logger.info(f'filtered_tool: {filtered_tool.metadata["tool"]}')
-        tools.append(tool_map[filtered_tool.metadata["tool"]])
-
-    agent = create_tool_calling_agent(llm_gpt_4o, tools, agent_prompt)
-    agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
-    return agent_executor
\ No newline at end of file
+    tool_names = route_tools(query = query, k = 3)
+    for tool_name in tool_names:
+        console_logger.info(f'filtered_tool: {tool_name}')
+
+    return get_agent_executor_for_tools(tool_names)
\ No newline at end of file
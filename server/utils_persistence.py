@@ -0,0 +1,248 @@
+# Standard Library Imports
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, timezone
+import asyncio
+
+import os
+
+# Third-Party Imports
+from opentelemetry import trace
+
+from server import utils_db_async
+from server import utils_logger
+console_logger, console_tracer = utils_logger.get_logger_tracer()
+
+class ConversationWriteQueue:
+    """
+    Write-behind queue for conversation turns.
+
+    Turns are queued at the end of a response and written in the background, so the response is
+    no longer held open by the database write. Each device (the conversations partition key) has
+    a writer task that drains what is queued for the device, merges the turns of a conversation
+    into a single write and writes them strictly in order. Devices are written independently, so a
+    device whose writes are retried with exponential backoff does not hold up the writes of other devices.
+
+    The queue is bounded: when `max_size` turns are waiting to be written `enqueue` waits, which
+    pushes back on new turns instead of growing memory without limit. A turn stays queued until it
+    is written, so turns left over when an event loop ends (the single-app bot runs a loop per
+    recording) are not lost: the writers are restarted on the next loop that uses the queue.
+    """
+    def __init__(self,
+                 max_size: int,
+                 max_batch_size: int,
+                 max_retries: int,
+                 retry_base_delay: float,
+                 retry_max_delay: float) -> None:
+        self.max_size = max_size
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+
+        # Device id -> turns queued and not yet written, kept across event loops
+        self._device_writes: Dict[str, List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]] = {}
+        self._queued = 0
+        # Bound to the event loop the writers run on, re-created when another loop uses the queue
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._drained: Optional[asyncio.Event] = None
+        self._device_writers: Dict[str, asyncio.Task] = {}
+        # Device id -> number of queued or in-flight turns, used to give readers read-your-writes
+        self._pending: Dict[str, int] = {}
+        self._device_idle: Dict[str, asyncio.Event] = {}
+
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.failed = 0
+        self.resumed = 0
+
+    def _ensure_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        if self._queued:
+            console_logger.warning(f"Resuming {self._queued} conversation writes queued on a previous event loop")
+            self.resumed += self._queued
+        console_logger.debug("Starting conversation writers")
+        self._loop = loop
+        self._slots = asyncio.Semaphore(self.max_size - self._queued)
+        self._drained = asyncio.Event()
+        if not self._queued:
+            self._drained.set()
+        self._device_writers = {}
+        self._pending = {device_id: len(writes) for device_id, writes in self._device_writes.items()}
+        self._device_idle = {device_id: asyncio.Event() for device_id in self._pending}
+        for device_id in self._pending:
+            self._start_writer(device_id)
+
+    def _start_writer(self, device_id: str) -> None:
+        if device_id not in self._device_writers:
+            self._device_writers[device_id] = asyncio.create_task(self._run_device(device_id))
+
+    def _release_pending(self, device_id: str, turns: int) -> None:
+        self._pending[device_id] -= turns
+        if self._pending[device_id] <= 0:
+            del self._pending[device_id]
+            self._device_idle[device_id].set()
+
+    @console_tracer.start_as_current_span("ConversationWriteQueue - enqueue")
+    async def enqueue(self, conversation: Dict[str, Any], messages: List[Dict[str, Any]]) -> None:
+        """
+        Queues messages to be appended to a conversation.
+
+        Args:
+            conversation (Dict[str, Any]): The conversation the messages belong to.
+            messages (List[Dict[str, Any]]): Messages, each containing 'content' and 'role'.
+        """
+        self._ensure_loop()
+        device_id = conversation["deviceId"]
+        timestamp = datetime.now(timezone.utc).isoformat()
+        messages = [{**message, "timestamp": message.get("timestamp") or timestamp} for message in messages]
+
+        # Counted as pending while waiting for a slot, so the next turn of the device waits for this one
+        self._pending[device_id] = self._pending.get(device_id, 0) + 1
+        self._device_idle.setdefault(device_id, asyncio.Event()).clear()
+        try:
+            await self._slots.acquire()
+        except BaseException:
+            # Cancelled while waiting for a slot: the turn is not queued
+            self._release_pending(device_id, 1)
+            raise
+        self._device_writes.setdefault(device_id, []).append((conversation, messages))
+        self._queued += 1
+        self._drained.clear()
+        self.enqueued += 1
+        self._start_writer(device_id)
+        trace.get_current_span().set_attribute("persistence.queue_depth", self._queued)
+
+    async def wait_for_device(self, device_id: str) -> None:
+        """
+        Waits until all queued turns of a device are written, so the next turn of the device reads them.
+        Returns immediately when nothing is pending for the device.
+        """
+        if self._loop is not asyncio.get_running_loop() and device_id not in self._device_writes:
+            return
+        self._ensure_loop()
+        event = self._device_idle.get(device_id)
+        if event is not None and self._pending.get(device_id):
+            await event.wait()
+
+    async def flush(self) -> None:
+        """
+        Waits until every queued turn has been written, including turns queued on a previous event loop.
+        """
+        if self._loop is not asyncio.get_running_loop() and not self._queued:
+            return
+        self._ensure_loop()
+        await self._drained.wait()
+
+    async def close(self, timeout: float) -> None:
+        """
+        Flushes the queue, waiting at most `timeout` seconds, then stops the writers. Called on application shutdown.
+        """
+        if self._loop is not asyncio.get_running_loop():
+            return
+        try:
+            await asyncio.wait_for(self.flush(), timeout=timeout)
+        except asyncio.TimeoutError:
+            console_logger.error(f"Shutting down with {self._queued} conversation writes still queued")
+        tasks = list(self._device_writers.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._device_writers = {}
+        self._loop = None
+
+    async def _run_device(self, device_id: str) -> None:
+        try:
+            while self._device_writes.get(device_id):
+                writes = self._device_writes[device_id]
+                items = writes[:self.max_batch_size]
+                try:
+                    await self._write_batch(device_id, items)
+                except Exception as e:
+                    console_logger.error(f"Unexpected error in conversation writer for device {device_id}: {e}")
+                # Removed only once written or given up on, so turns of a loop that ends mid-write are resumed
+                del writes[:len(items)]
+                self._queued -= len(items)
+                for _ in items:
+                    self._slots.release()
+                if not self._queued:
+                    self._drained.set()
+        finally:
+            if not self._device_writes.get(device_id):
+                self._device_writes.pop(device_id, None)
+            self._device_writers.pop(device_id, None)
+
+    @console_tracer.start_as_current_span("ConversationWriteQueue - write_batch")
+    async def _write_batch(self, device_id: str, items: List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]) -> None:
+        # Merge consecutive turns of the same conversation into one write
+        writes: List[Tuple[Dict[str, Any], List[Dict[str, Any]], int]] = []
+        for conversation, messages in items:
+            if writes and writes[-1][0]["id"] == conversation["id"]:
+                previous_conversation, previous_messages, turns = writes[-1]
+                writes[-1] = (previous_conversation, previous_messages + messages, turns + 1)
+            else:
+                writes.append((conversation, messages, 1))
+
+        span = trace.get_current_span()
+        span.set_attribute("persistence.batch_turns", len(items))
+        span.set_attribute("persistence.batch_writes", len(writes))
+        self.batches += 1
+        for conversation, messages, turns in writes:
+            try:
+                if await self._write_with_retry(conversation, messages):
+                    self.written += turns
+                else:
+                    self.failed += turns
+                    console_logger.error(f"Giving up on {len(messages)} messages for conversation {conversation['id']} after {self.max_retries} retries")
+            finally:
+                self._release_pending(device_id, turns)
+
+    async def _write_with_retry(self, conversation: Dict[str, Any], messages: List[Dict[str, Any]]) -> bool:
+        delay = self.retry_base_delay
+        for attempt in range(self.max_retries + 1):
+            if await utils_db_async.add_messages_to_conversation(conversation, messages):
+                return True
+            if attempt < self.max_retries:
+                self.retries += 1
+                console_logger.warning(f"Retrying write for conversation {conversation['id']} in {delay:.1f} seconds")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.retry_max_delay)
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queued,
+            "max_size": self.max_size,
+            "pending_devices": len(self._pending),
+            "writing_devices": len(self._device_writers),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "batches": self.batches,
+            "retries": self.retries,
+            "failed": self.failed,
+            "resumed": self.resumed,
+        }
+
+persistence_mode: str = os.getenv("PERSISTENCE_MODE", "background").lower()
+persistence_shutdown_timeout: float = float(os.getenv("PERSISTENCE_SHUTDOWN_TIMEOUT", "30"))
+
+conversation_writer = ConversationWriteQueue(
+    max_size=int(os.getenv("PERSISTENCE_QUEUE_MAX_SIZE", "1000")),
+    max_batch_size=int(os.getenv("PERSISTENCE_MAX_BATCH_SIZE", "100")),
+    max_retries=int(os.getenv("PERSISTENCE_MAX_RETRIES", "5")),
+    retry_base_delay=float(os.getenv("PERSISTENCE_RETRY_BASE_DELAY", "0.5")),
+    retry_max_delay=float(os.getenv("PERSISTENCE_RETRY_MAX_DELAY", "10")),
+)
+
+async def save_conversation_turn(conversation: Dict[str, Any], messages: List[Dict[str, Any]]) -> None:
+    """
+    Persists the messages of a turn, in the background unless PERSISTENCE_MODE is "inline".
+    """
+    if persistence_mode == "inline":
+        await utils_db_async.add_messages_to_conversation(conversation, messages)
+    else:
+        await conversation_writer.enqueue(conversation, messages)
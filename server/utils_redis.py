@@ -0,0 +1,103 @@
+# Standard Library Imports
+from typing import Dict, Optional
+import asyncio
+import threading
+
+import os
+
+# Third-Party Imports
+import redis
+import redis.asyncio
+
+from server import utils_logger
+console_logger, console_tracer = utils_logger.get_logger_tracer()
+
+# Like the async Cosmos client, the asyncio Redis client is bound to the loop it was created on
+# and is re-created if a different loop (for example the single-app bot) starts using it.
+_async_client: Optional[redis.asyncio.Redis] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+_sync_client: Optional[redis.Redis] = None
+_sync_client_lock = threading.Lock()
+
+def get_async_redis_client() -> redis.asyncio.Redis:
+    """
+    Returns the shared asyncio Redis client, creating it on first use.
+    The Redis host, port, and password are fetched from environment variables.
+    Must be called from within a running event loop.
+    """
+    global _async_client, _async_client_loop
+
+    loop = asyncio.get_running_loop()
+    if _async_client is not None and _async_client_loop is loop:
+        return _async_client
+
+    console_logger.debug("Initializing async Redis client")
+    # A blocking pool caps the connections a worker opens; callers beyond the cap wait for a free
+    # connection (up to REDIS_POOL_TIMEOUT) instead of opening new TLS connections under load.
+    pool = redis.asyncio.BlockingConnectionPool(
+        connection_class=redis.asyncio.SSLConnection,
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=int(os.getenv("REDIS_PORT", "6379")),
+        password=os.getenv("REDIS_KEY", None),
+        db=0,
+        max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+        timeout=float(os.getenv("REDIS_POOL_TIMEOUT", "5")),
+        socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "5")),
+        socket_connect_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "5")),
+        health_check_interval=int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30")),
+    )
+    _async_client = redis.asyncio.Redis(connection_pool=pool)
+    _async_client_loop = loop
+    return _async_client
+
+def get_async_pool_stats() -> Dict[str, int]:
+    """
+    Returns the connection counts of the async client's pool. redis-py has no public API for them,
+    so they are read from pool internals when present and reported as -1 otherwise.
+    """
+    if _async_client is None:
+        return {"max_connections": 0, "in_use": 0, "idle": 0}
+    pool = _async_client.connection_pool
+    in_use = getattr(pool, "_in_use_connections", None)
+    available = getattr(pool, "_available_connections", None)
+    return {
+        "max_connections": pool.max_connections,
+        "in_use": len(in_use) if in_use is not None else -1,
+        "idle": len(available) if available is not None else -1,
+    }
+
+def get_sync_redis_client() -> redis.Redis:
+    """
+    Returns a shared synchronous Redis client for code that runs outside the event loop,
+    creating it on first use.
+    """
+    global _sync_client
+
+    with _sync_client_lock:
+        if _sync_client is None:
+            console_logger.debug("Initializing sync Redis client")
+            _sync_client = redis.Redis(
+                host=os.getenv("REDIS_HOST", "localhost"),
+                port=int(os.getenv("REDIS_PORT", "6379")),
+                password=os.getenv("REDIS_KEY", None),
+                ssl=True,
+                db=0,
+            )
+        return _sync_client
+
+async def close_async_redis_client() -> None:
+    """
+    Closes the shared asyncio Redis client. Called on application shutdown.
+    """
+    global _async_client, _async_client_loop
+    if _async_client is None:
+        return
+    try:
+        await _async_client.aclose(close_connection_pool=True)
+        console_logger.info("Async Redis client closed")
+    except Exception as e:
+        console_logger.error(f"An error occurred while closing the async Redis client: {e}")
+    finally:
+        _async_client = None
+        _async_client_loop = None
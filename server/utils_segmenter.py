@@ -0,0 +1,184 @@
+# Standard Library Imports
+from typing import List, Optional
+import time
+
+import os
+
+from server import utils_logger
+console_logger, console_tracer = utils_logger.get_logger_tracer()
+
+# Sentence terminators, including the Devanagari danda and double danda (Hindi, Marathi),
+# the Urdu full stop and the Ol Chiki and Meetei Mayek terminators
+STRONG_TERMINATORS = frozenset(".!?:।॥۔᱾꯫")
+# A newline always ends a chunk, whatever its length; the pipeline also sends one to flush the buffer
+FORCED_TERMINATORS = frozenset("\n")
+# Clause boundaries, used to cut a chunk early
+SOFT_TERMINATORS = frozenset(",;،")
+# Terminators that separate digits inside numbers: "1.5", "₹1,000", "10:30"
+NUMBER_SEPARATORS = frozenset(".,:")
+# Abbreviations commonly followed by a period mid-sentence, for example "Rs. 1,000"
+ABBREVIATIONS = frozenset(["rs", "mr", "mrs", "ms", "dr"])
+
+class SentenceSegmenter:
+    """
+    Incrementally splits streamed LLM text into chunks for speech synthesis.
+
+    Only text that has not been scanned yet is examined on each `feed`, so segmenting a response
+    is linear in its length. The first chunk is cut as early as sounds natural, because it gates
+    the first audio of the turn: at a sentence end, at a clause boundary once it has
+    `first_chunk_min_words` words, at a word boundary after `first_chunk_max_words` words, or at a
+    word boundary once `first_chunk_max_ms` has passed since the first text arrived. Later chunks
+    are only cut at sentence ends and are merged up to `min_chunk_chars`, which gives the speech
+    service longer, better-sounding input while the first chunk is playing; chunks over
+    `max_chunk_words` words are cut at the next clause boundary. A newline always ends a chunk.
+    A separator between two digits is never a boundary, so amounts like "₹1,000" or "2.5" are never split.
+
+    When the text stream pauses, the caller waits at most `get_first_chunk_timeout` seconds and then
+    calls `poll`, so the first chunk is cut on time even if no further text arrives.
+    """
+    def __init__(self,
+                 first_chunk_min_words: int,
+                 first_chunk_max_words: int,
+                 first_chunk_max_ms: float,
+                 min_chunk_chars: int,
+                 max_chunk_words: int) -> None:
+        self.first_chunk_min_words = first_chunk_min_words
+        self.first_chunk_max_words = first_chunk_max_words
+        self.first_chunk_max_ms = first_chunk_max_ms
+        self.min_chunk_chars = min_chunk_chars
+        self.max_chunk_words = max_chunk_words
+
+        self._buffer: str = ""
+        self._scan_pos: int = 0
+        self._words: int = 0
+        self._last_word_end: int = 0
+        self._first_chunk: bool = True
+        self._started_at: Optional[float] = None
+
+    def _is_number_separator(self, index: int) -> Optional[bool]:
+        """
+        Returns True if the separator at `index` sits between two digits, False if it does not,
+        and None if the next character has not arrived yet.
+        """
+        if self._buffer[index] not in NUMBER_SEPARATORS or index == 0 or not self._buffer[index - 1].isdigit():
+            return False
+        if index + 1 >= len(self._buffer):
+            return None
+        return self._buffer[index + 1].isdigit()
+
+    def _is_abbreviation(self, index: int) -> bool:
+        if self._buffer[index] != ".":
+            return False
+        start = index
+        while start > 0 and self._buffer[start - 1].isalpha():
+            start -= 1
+        return self._buffer[start:index].lower() in ABBREVIATIONS
+
+    def _cut(self, end: int) -> Optional[str]:
+        chunk = self._buffer[:end].strip()
+        self._buffer = self._buffer[end:]
+        self._scan_pos = 0
+        self._words = 0
+        self._last_word_end = 0
+        if not chunk:
+            return None
+        self._first_chunk = False
+        return chunk
+
+    def feed(self, text: str) -> List[str]:
+        """
+        Adds streamed text and returns the chunks that are complete.
+
+        Args:
+            text (str): The next piece of streamed text.
+
+        Returns:
+            List[str]: Complete chunks, in order. Usually empty or a single chunk.
+        """
+        if self._started_at is None and text.strip():
+            self._started_at = time.monotonic()
+        self._buffer += text
+
+        chunks: List[str] = []
+        while self._scan_pos < len(self._buffer):
+            index = self._scan_pos
+            char = self._buffer[index]
+
+            if char in FORCED_TERMINATORS:
+                chunk = self._cut(index + 1)
+                if chunk is not None:
+                    chunks.append(chunk)
+                continue
+            elif char.isspace():
+                if index > 0 and not self._buffer[index - 1].isspace():
+                    self._words += 1
+                    self._last_word_end = index
+            elif char in STRONG_TERMINATORS or char in SOFT_TERMINATORS:
+                is_number = self._is_number_separator(index)
+                if is_number is None:
+                    # Wait for the next character before deciding
+                    break
+                if not is_number and not self._is_abbreviation(index):
+                    chunk = self._boundary(index + 1, strong = char in STRONG_TERMINATORS)
+                    if chunk is not None:
+                        chunks.append(chunk)
+                        continue
+
+            self._scan_pos = index + 1
+
+            if self._first_chunk and self._last_word_end and self._words >= self.first_chunk_min_words and (
+                    self._words >= self.first_chunk_max_words or self._first_chunk_overdue()):
+                chunk = self._cut(self._last_word_end)
+                if chunk is not None:
+                    chunks.append(chunk)
+
+        return chunks
+
+    def _first_chunk_overdue(self) -> bool:
+        return self._started_at is not None and (time.monotonic() - self._started_at) * 1000 >= self.first_chunk_max_ms
+
+    def get_first_chunk_timeout(self) -> Optional[float]:
+        """
+        Returns the seconds until the first chunk is overdue, or None if there is no first chunk to wait for.
+        """
+        if not self._first_chunk or self._started_at is None:
+            return None
+        remaining = self.first_chunk_max_ms / 1000 - (time.monotonic() - self._started_at)
+        return remaining if remaining > 0 else None
+
+    def poll(self) -> Optional[str]:
+        """
+        Returns the first chunk if it is overdue, for a text stream that paused before a boundary.
+        """
+        if self._first_chunk and self._last_word_end and self._words >= self.first_chunk_min_words and self._first_chunk_overdue():
+            return self._cut(self._last_word_end)
+        return None
+
+    def _boundary(self, end: int, strong: bool) -> Optional[str]:
+        if self._first_chunk:
+            if strong or self._words >= self.first_chunk_min_words:
+                return self._cut(end)
+            return None
+        if strong and len(self._buffer[:end].strip()) >= self.min_chunk_chars:
+            return self._cut(end)
+        if not strong and self._words >= self.max_chunk_words:
+            return self._cut(end)
+        return None
+
+    def flush(self) -> Optional[str]:
+        """
+        Returns whatever text is left once the stream has ended.
+        """
+        return self._cut(len(self._buffer))
+
+def get_sentence_segmenter() -> SentenceSegmenter:
+    """
+    Creates a segmenter with the chunking policy from the environment.
+    """
+    return SentenceSegmenter(
+        first_chunk_min_words=int(os.getenv("SEGMENTER_FIRST_CHUNK_MIN_WORDS", "3")),
+        first_chunk_max_words=int(os.getenv("SEGMENTER_FIRST_CHUNK_MAX_WORDS", "12")),
+        first_chunk_max_ms=float(os.getenv("SEGMENTER_FIRST_CHUNK_MAX_MS", "600")),
+        min_chunk_chars=int(os.getenv("SEGMENTER_MIN_CHUNK_CHARS", "60")),
+        max_chunk_words=int(os.getenv("SEGMENTER_MAX_CHUNK_WORDS", "40")),
+    )
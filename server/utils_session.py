@@ -0,0 +1,79 @@
+# Standard Library Imports
+from typing import Any, Dict, List, Optional, Tuple
+import uuid
+
+# Third-Party Imports
+import redis
+from opentelemetry import trace
+
+from server import utils_chat_window
+from server import utils_redis
+from server import utils_logger
+console_logger, console_tracer = utils_logger.get_logger_tracer()
+
+# Gets the session ID of a device or creates one, refreshes the session expiry and, for an existing
+# session, returns its chat window and refreshes the window expiry as well - all in one round trip.
+# A new session starts with an empty window. Both keys are declared, and share a cluster slot, see
+# utils_chat_window.get_chat_window_key.
+#   KEYS[1]: device id (session key)
+#   KEYS[2]: chat window key of the device
+#   ARGV[1]: session ID to use if the device has none
+#   ARGV[2]: session timeout in seconds
+SESSION_SCRIPT = """
+local session_id = redis.call('GET', KEYS[1])
+local created = 0
+if not session_id then
+    session_id = ARGV[1]
+    created = 1
+end
+redis.call('SET', KEYS[1], session_id, 'EX', ARGV[2])
+local window = {}
+if created == 0 then
+    window = redis.call('LRANGE', KEYS[2], 0, -1)
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+else
+    redis.call('DEL', KEYS[2])
+end
+return {session_id, created, window}
+"""
+
+# Scripts are registered per client, and the async client is re-created when the event loop changes
+_session_script: Optional[Tuple[Any, Any]] = None
+
+def get_session_script() -> Any:
+    global _session_script
+    client = utils_redis.get_async_redis_client()
+    if _session_script is None or _session_script[0] is not client:
+        _session_script = (client, client.register_script(SESSION_SCRIPT))
+    return _session_script[1]
+
+@console_tracer.start_as_current_span("get_session")
+async def get_session(device_id: str) -> Tuple[Optional[str], Optional[List[Dict[str, Any]]]]:
+    """
+    Retrieves the session ID for a device, creating a new one if the device has no active session,
+    and refreshes the session expiry. Replaces the two blocking round trips of utils_db.get_session_id
+    with one non-blocking script call that also returns the chat window.
+
+    Args:
+        device_id (str): The unique identifier of the device.
+
+    Returns:
+        Tuple[Optional[str], Optional[List[Dict[str, Any]]]]: The session ID (None if Redis is unavailable)
+        and the session's chat window (None for a new session or when the window is missing).
+    """
+    console_logger.debug(f"Retrieving session ID for device_id: '{device_id}'.")
+    span = trace.get_current_span()
+    try:
+        session_id, created, window = await get_session_script()(
+            keys=[device_id, utils_chat_window.get_chat_window_key(device_id)],
+            args=[str(uuid.uuid4()), utils_chat_window.get_session_timeout()],
+        )
+    except redis.RedisError as e:
+        console_logger.error(f"Redis error while retrieving/setting session ID for device_id: '{device_id}': {e}")
+        return None, None
+
+    session_id = session_id.decode("utf-8")
+    console_logger.debug(f"{'Generated new' if created else 'Found existing'} session ID: '{session_id}' for device_id: '{device_id}'.")
+    span.set_attribute("session.created", bool(created))
+    span.set_attribute("chat_window.result", "hit" if window else "miss")
+    return session_id, utils_chat_window.from_window_messages(window) if window else None
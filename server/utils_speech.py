@@ -1,11 +1,20 @@
 import azure.cognitiveservices.speech as speechsdk  
 import base64  
-import tempfile  
-import gc
+import io
 import os
 import threading  # For handling threads
-import queue  # For creating and managing queues
-from opentelemetry import context as context_api
+import time
+import wave
+import asyncio
+import contextvars
+import functools
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+import pydub
+from opentelemetry import trace
+from server import utils_vad
 from server import utils_logger
 console_logger, console_tracer = utils_logger.get_logger_tracer()
 
@@ -19,61 +28,315 @@ language_config_list = region=os.getenv("AUTO_DETECT_SOURCE_LANGUAGE_CONFIG", "e
 console_logger.info(f"Language config list: {language_config_list}")
 auto_detect_source_language_config = speechsdk.languageconfig.AutoDetectSourceLanguageConfig(languages=language_config_list)
 
-def base64_to_audio_file(base64_string: str, file_extension: str = ".wav") -> str:  
-    """  
-    Decode a Base64-encoded string and save it as a temporary audio file.  
-  
-    Args:  
-        base64_string (str): The Base64-encoded audio data.  
-        file_extension (str, optional): The file extension for the temporary audio file.  
-                                        Defaults to ".wav".  
-  
-    Returns:  
-        str: The file path to the temporary audio file.  
-    """  
-    audio_bytes = base64.b64decode(base64_string)  
-    with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp_file:  
-        tmp_file.write(audio_bytes)  
-        temp_file_path = tmp_file.name  
-    return temp_file_path  
-
-@console_tracer.start_as_current_span("speech_to_text_from_base64")
-def speech_to_text_from_base64(base64_audio: str) -> str:  
+# Confidence scores are only returned in the detailed output format
+speech_config.output_format = speechsdk.OutputFormat.Detailed
+
+# "device": recognize in the locale of the device's language, see utils_db.update_device_language, and fall back
+# to auto-detection over the configured list when the result has low confidence. "auto": always auto-detect.
+stt_language_mode: str = os.getenv("STT_LANGUAGE_MODE", "device").lower()
+stt_min_confidence: float = float(os.getenv("STT_MIN_CONFIDENCE", "0.5"))
+device_stt_locales: Dict[str, str] = {
+    "English": "en-IN",
+    "Hindi": "hi-IN",
+    "Marathi": "mr-IN",
+    "Kannada": "kn-IN",
+    "Tamil": "ta-IN",
+}
+
+def get_stt_languages(device_language: Optional[str]) -> List[str]:
+    """
+    Returns the candidate languages to recognize a device's speech in: its own locale, or the configured
+    auto-detection list if the language is unknown or the language mode is "auto".
+    """
+    if stt_language_mode == "device" and device_language in device_stt_locales:
+        return [device_stt_locales[device_language]]
+    return list(language_config_list)
+
+def get_fallback_languages(languages: Sequence[str]) -> Optional[List[str]]:
+    """
+    Returns the auto-detection list to retry low-confidence results of a narrowed language set with, if any.
+    """
+    if tuple(languages) == tuple(language_config_list):
+        return None
+    return list(language_config_list)
+
+def get_confidence(result: speechsdk.SpeechRecognitionResult) -> Optional[float]:
+    try:
+        return json.loads(result.json)["NBest"][0]["Confidence"]
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+_auto_detect_configs: Dict[Tuple[str, ...], speechsdk.languageconfig.AutoDetectSourceLanguageConfig] = {
+    tuple(language_config_list): auto_detect_source_language_config,
+}
+
+def get_auto_detect_config(languages: Optional[Sequence[str]] = None) -> speechsdk.languageconfig.AutoDetectSourceLanguageConfig:
+    """
+    Returns the shared language auto-detection config of a language set, by default the configured one.
+    """
+    key = tuple(languages) if languages else tuple(language_config_list)
+    config = _auto_detect_configs.get(key)
+    if config is None:
+        config = speechsdk.languageconfig.AutoDetectSourceLanguageConfig(languages=list(key))
+        _auto_detect_configs[key] = config
+    return config
+
+# Decoding and recognition block a thread for the length of the call; they run in this bounded
+# executor so that a burst of uploads cannot take every thread of the default executor
+stt_executor = ThreadPoolExecutor(max_workers=int(os.getenv("STT_EXECUTOR_WORKERS", "4")), thread_name_prefix="stt")
+# "sdk" (default): AMR uploads are pushed to the recognizer as a compressed stream and decoded in-process
+# by the Speech SDK, which needs the GStreamer plugins the DockerFile installs. "pydub": AMR is decoded to
+# PCM by pydub's ffmpeg subprocess, a fallback for hosts without GStreamer.
+stt_amr_decode: str = os.getenv("STT_AMR_DECODE", "sdk").lower()
+
+# Input audio of a recognizer: ("amr",) for compressed AMR-NB, or ("pcm", sample rate, bits per sample, channels)
+InputFormat = Tuple[Any, ...]
+StockKey = Tuple[Tuple[str, ...], InputFormat]
+
+def get_audio_stream_format(input_format: InputFormat) -> speechsdk.audio.AudioStreamFormat:
+    if input_format[0] == "amr":
+        return speechsdk.audio.AudioStreamFormat(compressed_stream_format=speechsdk.AudioStreamContainerFormat.AMRNB)
+    _, samples_per_second, bits_per_sample, channels = input_format
+    return speechsdk.audio.AudioStreamFormat(samples_per_second=samples_per_second, bits_per_sample=bits_per_sample, channels=channels)
+
+def decode_audio(audio_bytes: bytes, audio_format: str = "wav") -> Tuple[InputFormat, bytes]:
+    """
+    Prepares uploaded audio for a push stream, in memory.
+
+    Args:
+        audio_bytes (bytes): The uploaded audio file.
+        audio_format (str): "wav" or "amr".
+
+    Returns:
+        Tuple[InputFormat, bytes]: The stream input format and the audio to push.
+    """
+    if audio_format == "amr":
+        if stt_amr_decode == "sdk":
+            return ("amr",), audio_bytes
+        buffer_input = io.BytesIO(audio_bytes)
+        buffer_input.name = "input.amr"
+        audio = pydub.AudioSegment.from_file(buffer_input, format="amr")
+        return ("pcm", audio.frame_rate, audio.sample_width * 8, audio.channels), audio.raw_data
+
+    with wave.open(io.BytesIO(audio_bytes), "rb") as wav_reader:
+        input_format = ("pcm", wav_reader.getframerate(), wav_reader.getsampwidth() * 8, wav_reader.getnchannels())
+        return input_format, wav_reader.readframes(wav_reader.getnframes())
+
+def create_recognizer(audio_config: speechsdk.audio.AudioConfig, languages: Optional[Sequence[str]] = None) -> speechsdk.SpeechRecognizer:
+    """
+    Creates a recognizer for a single language, without language identification, or auto-detecting over several.
+    """
+    if languages and len(languages) == 1:
+        return speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_config, language=languages[0])
+    return speechsdk.SpeechRecognizer(speech_config=speech_config,
+                                      audio_config=audio_config,
+                                      auto_detect_source_language_config=get_auto_detect_config(languages))
+
+class OneShotRecognizer:
+    """
+    A SpeechRecognizer reading from its own push stream, built and connected ahead of the request
+    that uses it. A recognizer's audio input is fixed when it is created, so each one recognizes a
+    single utterance.
+    """
+    def __init__(self, key: StockKey) -> None:
+        self.key = key
+        languages, input_format = key
+        self.stream = speechsdk.audio.PushAudioInputStream(stream_format=get_audio_stream_format(input_format))
+        self.recognizer = create_recognizer(speechsdk.audio.AudioConfig(stream=self.stream), languages)
+        self.connection = speechsdk.Connection.from_recognizer(self.recognizer)
+        self.connected = False
+        self.connection.connected.connect(self._connected)
+        self.connection.disconnected.connect(self._disconnected)
+        self.created_at = time.monotonic()
+
+    def open(self) -> None:
+        """
+        Opens the service connection ahead of recognition, paying the connection setup and TLS
+        handshake outside the request path.
+        """
+        self.connection.open(False)
+
+    def close(self) -> None:
+        try:
+            self.connection.close()
+        except Exception as e:
+            console_logger.error(f"Error closing speech recognizer connection: {e}")
+        self.connected = False
+
+    def _connected(self, evt) -> None:
+        self.connected = True
+
+    def _disconnected(self, evt) -> None:
+        self.connected = False
+
+class RecognizerStock:
+    """
+    Keeps up to `stock_size` connected one-shot recognizers ready per language set and input
+    format. Taking one schedules its replacement in the background; recognizers older than
+    `max_age` seconds, or not connected to the service, are discarded instead of used.
+    """
+    def __init__(self, stock_size: int, max_age: float) -> None:
+        self.stock_size = stock_size
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._ready: Dict[StockKey, Deque[OneShotRecognizer]] = {}
+        self._pending: Dict[StockKey, int] = {}
+
+        self.takes = 0
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        self.fallbacks = 0
+        self.total_setup_seconds = 0.0
+        self.total_recognition_seconds = 0.0
+        # Recognitions and total recognition seconds per language set
+        self._by_language: Dict[str, List[float]] = {}
+        self._streaming_by_language: Dict[str, List[float]] = {}
+
+    def take(self, key: StockKey) -> Tuple[OneShotRecognizer, bool]:
+        """
+        Returns a ready recognizer for `key`, or builds one if none is ready. Blocking.
+
+        Returns:
+            Tuple[OneShotRecognizer, bool]: The recognizer and whether it came from the stock.
+        """
+        recognizer = None
+        with self._lock:
+            self.takes += 1
+            ready = self._ready.setdefault(key, deque())
+            while ready:
+                candidate = ready.popleft()
+                if candidate.connected and time.monotonic() - candidate.created_at < self.max_age:
+                    recognizer = candidate
+                    break
+                self.discarded += 1
+                stt_executor.submit(candidate.close)
+            if recognizer is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        self.replenish(key)
+        if recognizer is not None:
+            return recognizer, True
+        return OneShotRecognizer(key), False
+
+    def replenish(self, key: StockKey) -> None:
+        """
+        Schedules building recognizers for `key` until its stock is full.
+        """
+        if self.stock_size <= 0:
+            return
+        with self._lock:
+            missing = self.stock_size - len(self._ready.get(key, ())) - self._pending.get(key, 0)
+            if missing <= 0:
+                return
+            self._pending[key] = self._pending.get(key, 0) + missing
+        for _ in range(missing):
+            stt_executor.submit(self._build, key)
+
+    def _build(self, key: StockKey) -> None:
+        try:
+            recognizer = OneShotRecognizer(key)
+            recognizer.open()
+        except Exception as e:
+            console_logger.error(f"Error building speech recognizer: {e}")
+            recognizer = None
+        with self._lock:
+            self._pending[key] -= 1
+            if recognizer is not None:
+                self._ready.setdefault(key, deque()).append(recognizer)
+
+    def record_timings(self, languages: Sequence[str], setup_seconds: float, recognition_seconds: float) -> None:
+        with self._lock:
+            self.total_setup_seconds += setup_seconds
+            self.total_recognition_seconds += recognition_seconds
+            record_recognition_latency(self._by_language, languages, recognition_seconds)
+
+    def record_streaming_latency(self, languages: Sequence[str], seconds: float) -> None:
+        """
+        Records the time from the start of a streaming recognition to its end.
+        """
+        with self._lock:
+            record_recognition_latency(self._streaming_by_language, languages, seconds)
+
+    def record_fallback(self) -> None:
+        with self._lock:
+            self.fallbacks += 1
+
+    def close(self) -> None:
+        with self._lock:
+            recognizers = [recognizer for ready in self._ready.values() for recognizer in ready]
+            self._ready.clear()
+        for recognizer in recognizers:
+            recognizer.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "takes": self.takes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / self.takes if self.takes else 0.0,
+                "discarded": self.discarded,
+                "fallbacks": self.fallbacks,
+                "avg_setup_ms": 1000 * self.total_setup_seconds / self.takes if self.takes else 0.0,
+                "avg_recognition_ms": 1000 * self.total_recognition_seconds / self.takes if self.takes else 0.0,
+                "ready": sum(len(ready) for ready in self._ready.values()),
+                "by_language": get_recognition_latency_stats(self._by_language),
+                "streaming_by_language": get_recognition_latency_stats(self._streaming_by_language),
+            }
+
+def record_recognition_latency(by_language: Dict[str, List[float]], languages: Sequence[str], recognition_seconds: float) -> None:
+    totals = by_language.setdefault(",".join(languages), [0, 0.0])
+    totals[0] += 1
+    totals[1] += recognition_seconds
+
+def get_recognition_latency_stats(by_language: Dict[str, List[float]]) -> Dict[str, Any]:
+    return {label: {"count": count, "avg_recognition_ms": 1000 * total / count} for label, (count, total) in by_language.items()}
+
+recognizer_stock = RecognizerStock(
+    stock_size=int(os.getenv("STT_RECOGNIZER_STOCK", "2")),
+    max_age=float(os.getenv("STT_RECOGNIZER_MAX_AGE", "60")),
+)
+
+def recognize_audio(input_format: InputFormat, audio: bytes, languages: Sequence[str]) -> Tuple[str, Optional[float]]:  
     """  
-    Convert a Base64-encoded audio string to text using Azure Speech-to-Text services.  
-  
-    This function performs the following steps:  
-    1. Decodes the Base64 string to an audio file.  
-    2. Configures Azure Speech SDK with the necessary credentials.  
-    3. Recognizes speech from the audio file.  
-    4. Cleans up temporary resources.  
+    Recognizes one utterance of audio with a ready recognizer from `recognizer_stock`. Recognizer setup
+    (taking or building the recognizer and pushing the audio) and recognition are timed separately.
   
     Args:  
-        base64_audio (str): The Base64-encoded audio data.  
+        input_format (InputFormat): The format of `audio`, see decode_audio.  
+        audio (bytes): The audio to recognize.  
+        languages (Sequence[str]): Candidate languages.  
   
     Returns:  
-        str: The recognized text from the audio. Returns an empty string if recognition fails.  
+        Tuple[str, Optional[float]]: The recognized text, empty if recognition failed, and its confidence.  
     """  
-      
-    # Convert Base64 string to a temporary audio file  
-    audio_file_path = base64_to_audio_file(base64_audio)  
-      
+    span = trace.get_current_span()
+    label = ",".join(languages)
+    one_shot = None
     try:  
-        # Set up the audio configuration  
-        audio_config = speechsdk.AudioConfig(filename=audio_file_path)  
-          
-        # Initialize the speech recognizer  
-        speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, 
-                                                       audio_config=audio_config,
-                                                       auto_detect_source_language_config=auto_detect_source_language_config)  
-          
-        console_logger.info("Recognizing speech...")  
-        result = speech_recognizer.recognize_once()  
+        setup_start = time.perf_counter()
+        one_shot, stock_hit = recognizer_stock.take((tuple(languages), input_format))
+        one_shot.stream.write(audio)
+        one_shot.stream.close()
+        recognition_start = time.perf_counter()
+
+        console_logger.info(f"Recognizing speech in {label}...")  
+        result = one_shot.recognizer.recognize_once_async().get()
+        recognition_end = time.perf_counter()
+
+        setup_ms = (recognition_start - setup_start) * 1000
+        recognition_ms = (recognition_end - recognition_start) * 1000
+        recognizer_stock.record_timings(languages, recognition_start - setup_start, recognition_end - recognition_start)
+        span.add_event("stt_recognition", {"languages": label, "stock_hit": stock_hit, "setup_ms": setup_ms, "recognition_ms": recognition_ms})
+        console_logger.info(f"STT setup: {setup_ms:.0f} ms (stock hit: {stock_hit}), recognition in {label}: {recognition_ms:.0f} ms")
           
         # Check the result  
         if result.reason == speechsdk.ResultReason.RecognizedSpeech:  
-            console_logger.info(f"Recognized Text: {result.text}")  
-            return result.text  
+            confidence = get_confidence(result)
+            console_logger.info(f"Recognized Text: {result.text}, confidence: {confidence}")  
+            return result.text, confidence
           
         elif result.reason == speechsdk.ResultReason.NoMatch:  
             console_logger.warning("No speech could be recognized.")  
@@ -88,26 +351,99 @@ def speech_to_text_from_base64(base64_audio: str) -> str:
         console_logger.exception("An error occurred during speech recognition.")  
       
     finally:  
-        # Clean up resources  
-        del speech_recognizer  
-        gc.collect()  
-        if os.path.exists(audio_file_path):  
-            os.remove(audio_file_path)  
+        if one_shot is not None:
+            one_shot.close()
       
-    return ""  
+    return "", None
+
+def is_low_confidence(text: str, confidence: Optional[float]) -> bool:
+    return not text or (confidence is not None and confidence < stt_min_confidence)
+
+def recognize_with_fallback(input_format: InputFormat, audio: bytes, languages: Sequence[str]) -> str:
+    """
+    Recognizes `audio` in `languages`, and again with auto-detection if a narrowed language set
+    gives no result or a low-confidence one.
+    """
+    text, confidence = recognize_audio(input_format, audio, languages)
+    fallback_languages = get_fallback_languages(languages)
+    if fallback_languages is None or not is_low_confidence(text, confidence):
+        return text
+
+    console_logger.info(f"Low confidence ({confidence}) recognizing in {','.join(languages)}, retrying with auto-detection")
+    recognizer_stock.record_fallback()
+    trace.get_current_span().set_attribute("stt.fallback", True)
+    fallback_text, fallback_confidence = recognize_audio(input_format, audio, fallback_languages)
+    if fallback_text and (not text or (fallback_confidence or 0.0) > (confidence or 0.0)):
+        return fallback_text
+    return text
+
+@console_tracer.start_as_current_span("speech_to_text")
+def speech_to_text(audio_bytes: bytes, audio_format: str = "wav", languages: Optional[Sequence[str]] = None) -> str:  
+    """  
+    Convert an uploaded audio file to text using Azure Speech-to-Text services, entirely in memory.  
+  
+    Args:  
+        audio_bytes (bytes): The uploaded audio file.  
+        audio_format (str, optional): "wav" or "amr". Defaults to "wav".  
+        languages (Optional[Sequence[str]], optional): Candidate languages, see get_stt_languages. Defaults to the configured list.  
+  
+    Returns:  
+        str: The recognized text from the audio. Returns an empty string if recognition fails.  
+    """  
+    try:
+        input_format, audio = decode_audio(audio_bytes, audio_format)
+    except Exception as e:
+        console_logger.exception("An error occurred decoding the audio for speech recognition.")
+        return ""
+    return recognize_with_fallback(input_format, audio, languages if languages else language_config_list)
+
+def speech_to_text_from_base64(base64_audio: str, audio_format: str = "wav", languages: Optional[Sequence[str]] = None) -> str:  
+    """  
+    Convert a Base64-encoded audio string to text, see speech_to_text.  
+    """  
+    return speech_to_text(base64.b64decode(base64_audio), audio_format=audio_format, languages=languages)
+
+async def speech_to_text_from_base64_async(base64_audio: str, audio_format: str = "wav", languages: Optional[Sequence[str]] = None) -> str:
+    """
+    Runs speech_to_text_from_base64 in the bounded STT executor, keeping the caller's trace context.
+    """
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, speech_to_text_from_base64, base64_audio, audio_format, languages)
+    return await asyncio.get_running_loop().run_in_executor(stt_executor, call)
 
 class StreamingSTT:
     """
     A class to convert streamin audio to text using Azure Speech-to-Text services.
+
+    Audio is written to the recognizer's push stream as it is received. Completion can be awaited
+    with `wait_for_completion_async`, which is resolved from the recognizer's session_stopped and
+    canceled callbacks and never blocks the event loop.
+
+    With a narrowed language set, see get_stt_languages, the audio is also kept so that a
+    low-confidence transcript can be recognized again with auto-detection.
     """
-    def __init__(self, parent_context=None):
+    # Format of the push stream, the SDK default
+    input_format: InputFormat = ("pcm", 16000, 16, 1)
+
+    def __init__(self, parent_context=None, languages: Optional[Sequence[str]] = None, on_partial: Optional[Callable[[str], None]] = None):
         self.parent_context = parent_context  # Store the parent context
-        self.audio_queue = queue.Queue()  # Queue to store audio chunks
-        self.stt_complete = threading.Event()  # Event to signal transcription is complete
-        self.audio_added = threading.Event()  # Event to signal that all the audio chunks are added to the queue
+        # Called from the SDK's thread with the hypothesis of the whole utterance so far, see agent_base.SpeculativeTurn
+        self.on_partial = on_partial
+        self.languages: List[str] = list(languages) if languages else list(language_config_list)
+        self.fallback_languages = get_fallback_languages(self.languages)
+        self.audio: Optional[bytearray] = bytearray() if self.fallback_languages else None
+        self.confidence: Optional[float] = None  # Lowest confidence of the recognized segments
+        self.started_at: Optional[float] = None
+        # Ends the audio stream after trailing silence, see utils_vad
+        self.endpoint_detector = utils_vad.get_endpoint_detector(self.input_format[1])
+        self.audio_added = threading.Event()  # Event to signal that all the audio chunks are added to the stream
         self.recognition_done = threading.Event()  # Event to signal that speech recognition is done
+        self.recognition_stopped = False
         self.audio_size_in_bytes = 0
         self.tts_recognition= None
+        # Future resolved on the waiting event loop when recognition is done, see wait_for_completion_async
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.completed: Optional[asyncio.Future] = None
         
         # setup the audio stream
         self.stream = speechsdk.audio.PushAudioInputStream()
@@ -116,13 +452,7 @@ class StreamingSTT:
         audio_config = speechsdk.audio.AudioConfig(stream=self.stream)
 
         # instantiate the speech recognizer with push stream input
-        self.speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, 
-                                                            audio_config=audio_config,
-                                                             auto_detect_source_language_config=speechsdk.languageconfig.AutoDetectSourceLanguageConfig(languages=language_config_list))  
-
-         # start push stream writer thread
-        self.push_stream_writer_thread = threading.Thread(target=self.push_stream_writer)
-        self.push_stream_writer_thread.start()
+        self.speech_recognizer = create_recognizer(audio_config, self.languages)
         console_logger.info("StreamingSTT.__init__ complete")
         
     def create_stream(self):
@@ -130,13 +460,22 @@ class StreamingSTT:
         def session_stopped_cb(evt):
             """callback that signals to stop continuous recognition upon receiving an event `evt`"""
             console_logger.info('StreamingSTT - SESSION STOPPED: {}'.format(evt))
-            self.recognition_done.set()
+            self.set_recognition_done()
         
+        def canceled_cb(evt):
+            """callback that ends the wait if recognition is canceled, for example on a connection error"""
+            console_logger.info('StreamingSTT - CANCELED: {}'.format(evt))
+            self.set_recognition_done()
+
         def text_recognized_cb(evt):
             """callback that signals to stop continuous recognition upon receiving an event `evt`"""
             console_logger.info('StreamingSTT - TEXT RECOGNIZED: {}'.format(evt))
-            self.tts_recognition.end()
+            if self.tts_recognition:
+                self.tts_recognition.end()
             self.text += evt.result.text
+            confidence = get_confidence(evt.result)
+            if confidence is not None and (self.confidence is None or confidence < self.confidence):
+                self.confidence = confidence
 
         def text_recognition_started_cb(evt):
             """callback that signals to stop continuous recognition upon receiving an event `evt`"""
@@ -144,69 +483,135 @@ class StreamingSTT:
             self.tts_recognition = console_tracer.start_span("tts_recognition")
 
 
-        self.speech_recognizer.recognizing.connect(lambda evt: console_logger.info('StreamingSTT - recognizing: {}'.format(evt)))
+        def text_recognizing_cb(evt):
+            """callback that forwards the partial hypothesis of the utterance"""
+            console_logger.info('StreamingSTT - recognizing: {}'.format(evt))
+            if self.on_partial:
+                self.on_partial(self.text + evt.result.text)
+
+        self.speech_recognizer.recognizing.connect(text_recognizing_cb)
         self.speech_recognizer.recognized.connect(text_recognized_cb)
         self.speech_recognizer.session_started.connect(text_recognition_started_cb)
         self.speech_recognizer.session_stopped.connect(session_stopped_cb)
-        # self.speech_recognizer.canceled.connect(lambda evt: console_logger.info('StreamingSTT - CANCELED {}'.format(evt)))
+        self.speech_recognizer.canceled.connect(canceled_cb)
 
         # start continuous speech recognition
+        self.started_at = time.perf_counter()
         self.speech_recognizer.start_continuous_recognition()
         console_logger.info("StreamingSTT - create_stream complete")
-    
-    def push_stream_writer(self):
-        """
-        Method to play audio chunks from the queue.
-        """
-        # Activate the parent context in this thread
-        token = context_api.attach(self.parent_context) if self.parent_context else None
-
-        with console_tracer.start_as_current_span("push_stream_writer") as span:
-            while not self.stt_complete.is_set(): #this is like While True
-                try:
-                    audio_chunk = self.audio_queue.get(timeout=0.1)
-                    #console_logger.info(f"StreamingSTT - Writing to stream Audio chunk size: {len(audio_chunk)} bytes")
-                    self.audio_size_in_bytes += len(audio_chunk)
-                    self.stream.write(audio_chunk)
-                except queue.Empty:
-                    if self.audio_added.is_set() and self.audio_queue.empty():
-                        # If all audio has been added and queue is empty, we're done
-                        break
-                    continue
-
-            self.stream.close()
-            console_logger.info("StreamingSTT push_stream_writer completed.")
-
-            # Detach the context when done
-            if token:
-                context_api.detach(token)
+
+    def set_recognition_done(self) -> None:
+        """
+        Marks recognition as done, from an SDK callback thread, and resolves the awaiting future if any.
+        """
+        self.recognition_done.set()
+        if self.completed is not None:
+            self.loop.call_soon_threadsafe(self._resolve_completed)
+
+    def _resolve_completed(self) -> None:
+        if not self.completed.done():
+            self.completed.set_result(None)
 
     def add_audio(self, audio_data):
         """
-        Method to add audio data to the queue.
+        Method to write audio data to the recognizer's stream.
         """
+        if self.audio_added.is_set():
+            return
         for chunk in audio_data:
-            #console_logger.info(f"StreamingSTT - Adding Audio chunk size: {len(chunk)} bytes to queue")
-            self.audio_queue.put(chunk)
+            self.audio_size_in_bytes += len(chunk)
+            self.stream.write(chunk)
+            if self.audio is not None:
+                self.audio += chunk
+            if self.endpoint_detector and self.endpoint_detector.process(chunk):
+                self.add_audio_complete()
+                return
         
     def add_audio_complete(self):
         """
         Method to signal that audio has been added
         """
+        if self.audio_added.is_set():
+            return
         self.audio_added.set()  # Signal that all audio has been added
+        self.stream.close()
+        console_logger.info(f"StreamingSTT - audio stream closed after {self.audio_size_in_bytes} bytes.")
+
+    def is_endpoint_detected(self) -> bool:
+        """
+        Returns True if the stream was ended by the end of speech, rather than by the client.
+        """
+        return self.endpoint_detector is not None and self.endpoint_detector.endpoint_detected
+
+    def get_speech_ended_at(self) -> Optional[float]:
+        """
+        Returns the time.monotonic() of the end of the user's speech, if it was detected.
+        """
+        return self.endpoint_detector.speech_ended_at if self.endpoint_detector else None
 
     def wait_for_completion(self):
         """
-        Method to wait for the audio playback thread to complete.
+        Method to wait for recognition to complete. Blocking, see wait_for_completion_async.
         """
          # wait until all input processed
         self.recognition_done.wait()
 
         # stop recognition and clean up
+        self.recognition_stopped = True
         self.speech_recognizer.stop_continuous_recognition()
-        self.push_stream_writer_thread.join()
+        self.recognition_complete()
         console_logger.info(f"StreamingSTT - wait_for_completion completed.")
 
+    async def wait_for_completion_async(self) -> None:
+        """
+        Waits for recognition to complete without blocking the event loop.
+        """
+        if self.completed is None:
+            self.loop = asyncio.get_running_loop()
+            self.completed = self.loop.create_future()
+            # The callback may have fired before the future existed
+            if self.recognition_done.is_set():
+                self.completed.set_result(None)
+        await self.completed
+
+        # stop recognition and clean up
+        self.recognition_stopped = True
+        stop_future = self.speech_recognizer.stop_continuous_recognition_async()
+        await self.loop.run_in_executor(stt_executor, stop_future.get)
+        context = contextvars.copy_context()
+        await self.loop.run_in_executor(stt_executor, functools.partial(context.run, self.recognition_complete))
+        console_logger.info(f"StreamingSTT - wait_for_completion_async completed.")
+
+    async def stop_async(self) -> None:
+        """
+        Stops the recognition of an abandoned utterance: closes the audio stream and stops the recognizer
+        without waiting for the transcript, and drops the audio kept for the fallback.
+        """
+        self.on_partial = None
+        self.audio = None
+        self.add_audio_complete()
+        if self.recognition_stopped:
+            return
+        self.recognition_stopped = True
+        stop_future = self.speech_recognizer.stop_continuous_recognition_async()
+        await asyncio.get_running_loop().run_in_executor(stt_executor, stop_future.get)
+        console_logger.info(f"StreamingSTT - recognition stopped.")
+
+    def recognition_complete(self) -> None:
+        """
+        Records the recognition latency of the language set, and recognizes the kept audio again with
+        auto-detection if the transcript has low confidence. Blocking.
+        """
+        if self.started_at is not None:
+            recognizer_stock.record_streaming_latency(self.languages, time.perf_counter() - self.started_at)
+        if self.audio is None or not self.audio or not is_low_confidence(self.text, self.confidence):
+            return
+        console_logger.info(f"StreamingSTT - low confidence ({self.confidence}) in {','.join(self.languages)}, retrying with auto-detection")
+        recognizer_stock.record_fallback()
+        text, confidence = recognize_audio(self.input_format, bytes(self.audio), self.fallback_languages)
+        if text and (not self.text or (confidence or 0.0) > (self.confidence or 0.0)):
+            self.text, self.confidence = text, confidence
+        self.audio = None
+
     def get_text(self):
         return self.text  # Return the recognized text
-
@@ -0,0 +1,279 @@
+# Standard Library Imports
+from typing import List, Optional
+import hashlib
+import threading
+
+import os
+
+# Third-Party Imports
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from server import utils_logger
+console_logger, console_tracer = utils_logger.get_logger_tracer()
+
+def get_tool_documents() -> List[Document]:
+    """
+    Returns the tool descriptions used for tool routing, one document per tool.
+    The same documents are ingested into the Azure AI Search tool index by the setup scripts.
+    """
+    return [
+        # Document(page_content="""
+        #         Retrieves device information (Device identifier, Device ID, Associated customer's name, Purchase,  Announcement Language, binding status, 
+        #             Battery level, Network status, Charging state, Last connection timestamp,Last pulse timestamp, Conversation langauge)
+        #         Plan information (Plan description, plan cost)
+        #         Model Information(Model name, features, battery life, Network type, chaging connection type)
+        #         Device status
+        #         """,
+        #     metadata={"tool": "get_device_info"},
+        # ),
+        Document(id = "1",
+                page_content= """  
+                Retrieve all transactions for a specified device.  
+                        - deviceId (str): Unique identifier of the device.  
+                        - dailyCollection (float): Total transaction amount for the day.  
+                        - weeklyCollection (float): Total transaction amount for the week.  
+                        - monthlyCollection (float): Total transaction amount for the month.  
+                        - last10Transactions (list): List of the last 10 transactions:  
+                            - transactionTime (str): Timestamp in "yyyy:mm:dd hh:mm:ss" format.  
+                            - amount (float): Amount involved in the transaction (50-1000).  
+                            - announcementTime (str): Timestamp 1-15 seconds after the transaction time.  
+                """ ,
+            metadata={"tool": "get_transactions_info"},
+        ),
+        Document(id = "2",
+                page_content= """  
+                Retrieve all notification/announcements for a specified device.  
+                
+                Returns:  
+                    dict: Notification data with the following structure:  
+                
+                        - deviceId (str): Unique identifier of the device.  
+                        - notification_id (str): Unique identifier of the notification.
+                        - notificationType (str): Type/category of the notification.  
+                        - status (str): Current status of the notification.  
+                        - nnotificationTime (str): Scheduled time for the notification /annoncement using cron job format.  
+                """  ,
+            metadata={"tool": "get_notification_info"},
+        ),
+        Document(id = "3",
+                page_content= """  
+                Get troubleshooting guide for the given query.  
+                    common issues 
+                        - light blinking, 
+                        - no light, 
+                        - batter drain, 
+                        - repeat transaction, 
+                        - charger related, 
+                        - sound related 
+                        - key/button not working, 
+                        - damage to device etc 
+                        - bank transfers
+                        - collection settlements
+                        - upgrades to device, update to car payments etc
+                """  ,
+            metadata={"tool": "get_troubleshooting_guide"},
+        ),
+        Document(id = "4",
+                page_content= """  
+                Scenarios:
+                    1. Create a support ticket for a specific device and user query.  
+                    2. user followed all steps for troubleshooting but still facing issue.
+                    3. Disagreement with the information provided by the assistant.
+                    4. User wants to raise a ticket for a specific issue.
+                    
+                    Parameters:  
+                        device_id (str): The ID of the device for which the ticket is being raised.  
+                        session_id (str): The session ID associated with the conversation.  
+                        title (str) : should be a concise summary of the issue. this is created form chat history.
+                        description (str) :  should detailed summary of conversation. this is created form chat history.
+                """  ,
+            metadata={"tool": "raise_ticket"},
+        ),
+        Document(id = "5",
+                page_content= """  
+                Updates the language setting for a specific device in the Cosmos DB.  
+  
+                Args:  
+                    device_id (str): The unique identifier of the device.  
+                    language (str): The language to set for the device.   
+                """  ,
+            metadata={"tool": "update_device_language"},
+        ),
+        Document(id = "6",
+                page_content= """  
+                Updates the status and notification/announcement time for a specific notification/announcement associated with a device in Cosmos DB.  
+  
+                Args:  
+                    device_id (str): The unique identifier of the device.  
+                    notification_id (str): The unique identifier consisting of all digits. if you dont have it, get it from get_notification_info tool.
+                    notification_time (str): The new notification/ announcement time to set in cron format.  
+                    status (str): The new status for the notification/ announcement. Must be either "enabled" or "disabled".    
+                """  ,
+            metadata={"tool": "update_device_notifications"},
+        ),
+        Document(id = "7",
+                page_content= """  
+                user this function only when user specifically asks for khatabook/ledger/cash transaction entries.
+                Retrieve all khatabook / ledger / cash transaction entries for a specified device.     
+
+                Returns:  
+                    dict: Khatabook data with the following structure:  
+                
+                        - deviceId (str): Unique identifier of the device.  
+                        - khatabook_id (str): Unique identifier of the khatabook entry.
+                        - list of transactions (list): List of transactions:
+                            - transactionTime (str): Timestamp in "yyyy:mm:dd hh:mm:ss" format.
+                            - amount (float): Amount involved in the transaction (50-1000).
+                            - received_from: Name of the person from whom the amount was received.    
+                """  ,
+            metadata={"tool": "get_khatabook"},
+        ),
+        Document(id = "8",
+                page_content= """  
+                use this function only when user specifically asks questions like
+                    -  update khatabook / ledger / cash transaction entries for a specified device. 
+                    - add amount from received from in khatabook
+                    - received amount from received_from in khatabook
+                update khatabook / ledger / cash transaction entries for a specified device. 
+                Args:  
+                    device_id (str): The ID of the device for which the khatabook is being updated.  
+                    receivedFrom (str): The name of the person from whom the amount was received. 
+                        just keep the name, dont use titles like Mr, Mrs, etc. for names like Sharmaji, Guptaji, etc Just say Sharma, Gupta etc.
+                    amount (int): The amount involved in the transaction     
+
+                Returns:  
+                    string : description of khatabook update.
+                """  ,
+            metadata={"tool": "update_khatabook"},
+        ),
+    ]
+
+class ToolRouter:
+    """
+    Routes a query to the most relevant tools in process.
+
+    The tool descriptions are embedded once, either at startup or loaded from a persisted file,
+    and kept as a row-normalized NumPy matrix. A query is then scored against every tool with a
+    single matrix-vector product (cosine similarity), so routing costs only the query embedding
+    instead of a round trip to Azure AI Search.
+    """
+    def __init__(self, embedding_function: Embeddings, deployment: str, persist_path: Optional[str] = None) -> None:
+        self.embedding_function = embedding_function
+        self.deployment = deployment
+        self.persist_path = persist_path
+        self.tool_names: List[str] = []
+        self.tool_matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def _fingerprint(self, documents: List[Document]) -> str:
+        # Persisted embeddings are only valid for the same tool descriptions and embedding deployment
+        digest = hashlib.sha256(self.deployment.encode("utf-8"))
+        for document in documents:
+            digest.update(document.metadata["tool"].encode("utf-8"))
+            digest.update(document.page_content.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _load_persisted(self, fingerprint: str) -> bool:
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return False
+        try:
+            with np.load(self.persist_path, allow_pickle=False) as persisted:
+                if str(persisted["fingerprint"]) != fingerprint:
+                    console_logger.info(f"Persisted tool embeddings at {self.persist_path} are stale, re-embedding tools")
+                    return False
+                self.tool_names = [str(name) for name in persisted["tool_names"]]
+                self.tool_matrix = persisted["tool_matrix"].astype(np.float32)
+            console_logger.info(f"Loaded tool embeddings for {len(self.tool_names)} tools from {self.persist_path}")
+            return True
+        except Exception as e:
+            console_logger.error(f"An error occurred while loading persisted tool embeddings: {e}")
+            return False
+
+    def _persist(self, fingerprint: str) -> None:
+        if not self.persist_path:
+            return
+        try:
+            np.savez(self.persist_path,
+                     fingerprint=np.array(fingerprint),
+                     tool_names=np.array(self.tool_names),
+                     tool_matrix=self.tool_matrix)
+            console_logger.info(f"Persisted tool embeddings to {self.persist_path}")
+        except Exception as e:
+            console_logger.error(f"An error occurred while persisting tool embeddings: {e}")
+
+    @console_tracer.start_as_current_span("ToolRouter - load")
+    def load(self) -> bool:
+        """
+        Loads the tool embedding matrix, embedding the tool descriptions if no valid persisted copy exists.
+
+        Returns:
+            bool: True if the router is ready to route queries, False otherwise.
+        """
+        with self._lock:
+            if self.tool_matrix is not None:
+                return True
+
+            documents = get_tool_documents()
+            fingerprint = self._fingerprint(documents)
+            if self._load_persisted(fingerprint):
+                return True
+
+            try:
+                embeddings = np.asarray(self.embedding_function.embed_documents([document.page_content for document in documents]), dtype=np.float32)
+            except Exception as e:
+                console_logger.error(f"An error occurred while embedding tool descriptions: {e}")
+                return False
+
+            self.tool_names = [document.metadata["tool"] for document in documents]
+            self.tool_matrix = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+            console_logger.info(f"Embedded {len(self.tool_names)} tool descriptions for local routing")
+            self._persist(fingerprint)
+            return True
+
+    @console_tracer.start_as_current_span("ToolRouter - route")
+    def route(self, query: str, k: int = 3) -> List[str]:
+        """
+        Returns the names of the `k` tools most similar to the query, most similar first.
+
+        Raises:
+            RuntimeError: If the tool embeddings could not be loaded.
+        """
+        if self.tool_matrix is None and not self.load():
+            raise RuntimeError("Tool embeddings are not available for local routing")
+
+        query_vector = np.asarray(self.embedding_function.embed_query(query), dtype=np.float32)
+        scores = self.tool_matrix @ (query_vector / np.linalg.norm(query_vector))
+
+        k = min(k, len(self.tool_names))
+        top_k = np.argpartition(-scores, k - 1)[:k]
+        top_k = top_k[np.argsort(-scores[top_k])]
+        return [self.tool_names[index] for index in top_k]
+
+    def get_likely_tool_subsets(self, k: int = 3) -> List[List[str]]:
+        """
+        Returns tool subsets that `route` returns for typical queries: the top `k` tools for a query on
+        one tool (its own description) and for a query on two tools (the midpoint of their descriptions).
+
+        Raises:
+            RuntimeError: If the tool embeddings could not be loaded.
+        """
+        if self.tool_matrix is None and not self.load():
+            raise RuntimeError("Tool embeddings are not available for local routing")
+
+        count = len(self.tool_names)
+        k = min(k, count)
+        queries = [self.tool_matrix[i] for i in range(count)]
+        queries += [self.tool_matrix[i] + self.tool_matrix[j] for i in range(count) for j in range(i + 1, count)]
+
+        subsets: List[List[str]] = []
+        seen = set()
+        for query_vector in queries:
+            scores = self.tool_matrix @ query_vector
+            top_k = np.argsort(-scores)[:k]
+            key = frozenset(int(index) for index in top_k)
+            if key not in seen:
+                seen.add(key)
+                subsets.append([self.tool_names[index] for index in top_k])
+        return subsets
@@ -0,0 +1,114 @@
+# Standard Library Imports
+from typing import List, Set
+import asyncio
+import hashlib
+import re
+import unicodedata
+
+import os
+
+# Third-Party Imports
+import azure.cognitiveservices.speech as speechsdk
+
+from server import utils_cache
+from server import utils_codecs
+from server import utils_logger
+console_logger, console_tracer = utils_logger.get_logger_tracer()
+
+# Sentences longer than this are rarely repeated verbatim and are not cached
+tts_cache_max_sentence_chars: int = int(os.getenv("TTS_CACHE_MAX_SENTENCE_CHARS", "200"))
+# Canned phrases, cached on their first synthesis: the tool-call notice the system prompt asks for and any
+# others set in TTS_CACHE_PHRASES, separated by "|". The filler clips are cached by utils_filler.
+tts_cache_phrases_setting: str = os.getenv("TTS_CACHE_PHRASES", "wait a minute, I am checking for more information")
+# Any other sentence is only cached once it was synthesized this many times within TTS_CACHE_COUNT_TTL,
+# so one-off sentences carrying a user's balance or name are never written to the shared cache
+tts_cache_min_syntheses: int = int(os.getenv("TTS_CACHE_MIN_SYNTHESES", "3"))
+# Cached audio is streamed in chunks of about this duration, split on frame boundaries of its codec
+tts_cache_chunk_ms: int = 500
+
+def normalize_sentence(sentence: str) -> str:
+    """
+    Normalizes a sentence for the cache key: unicode NFKC and collapsed whitespace.
+    Case is kept, since it can change how the voice reads a word.
+    """
+    return " ".join(unicodedata.normalize("NFKC", sentence).split())
+
+def get_tts_cache_key(sentence: str, voice_name: str, output_format: speechsdk.SpeechSynthesisOutputFormat) -> str:
+    return hashlib.sha256(f"{voice_name}\x00{output_format.name}\x00{normalize_sentence(sentence)}".encode("utf-8")).hexdigest()
+
+def get_phrase_key(sentence: str) -> str:
+    """
+    Normalizes a sentence for matching against the canned phrases: case and the final punctuation are ignored.
+    """
+    return normalize_sentence(sentence).rstrip(".!?।॥,; ").casefold()
+
+def get_phrase_keys(phrases: List[str]) -> Set[str]:
+    """
+    Returns the keys of the canned phrases and of their clauses, since the segmenter may cut a phrase at a comma.
+    """
+    keys = set()
+    for phrase in phrases:
+        keys.add(get_phrase_key(phrase))
+        keys.update(get_phrase_key(clause) for clause in re.split(r"[,;]", phrase))
+    keys.discard("")
+    return keys
+
+tts_cache_phrases = frozenset(get_phrase_keys(tts_cache_phrases_setting.split("|")))
+
+def is_cacheable(sentence: str) -> bool:
+    """
+    Returns True if the audio of a sentence can be in the cache, so that it is worth looking up.
+    """
+    return len(sentence) <= tts_cache_max_sentence_chars
+
+def should_store(sentence: str, cache_key: str) -> bool:
+    """
+    Counts a synthesis of a cacheable sentence and returns True if its audio should be written to the cache:
+    it is a canned phrase, or it was synthesized at least `tts_cache_min_syntheses` times.
+
+    Args:
+        sentence (str): The synthesized sentence.
+        cache_key (str): Its cache key. Only the key is counted, never the text.
+
+    Returns:
+        bool: True if the audio should be cached.
+    """
+    if get_phrase_key(sentence) in tts_cache_phrases:
+        return True
+    count = (synthesis_counts.get(cache_key) or 0) + 1
+    synthesis_counts.set(cache_key, count)
+    return count >= tts_cache_min_syntheses
+
+_store_tasks: Set[asyncio.Task] = set()
+
+def store_in_background(cache_key: str, audio: bytes) -> None:
+    """
+    Writes audio to the cache in a background task, so the Redis write does not delay the response.
+    """
+    task = asyncio.create_task(tts_cache.set(cache_key, audio))
+    _store_tasks.add(task)
+    task.add_done_callback(_store_tasks.discard)
+
+def split_audio(audio: bytes, codec: utils_codecs.AudioCodec) -> List[bytes]:
+    return [chunk for chunk, _ in codec.split_chunks(audio, tts_cache_chunk_ms)]
+
+def _bytes_identity(value: bytes) -> bytes:
+    return value
+
+# Synthesized audio of repeated sentences, such as the fillers and canned replies the system prompt asks for.
+# The local tier is bounded by total audio size, the Redis tier by the TTL and the server's maxmemory eviction policy.
+tts_cache = utils_cache.TwoTierCache(
+    namespace="tts",
+    max_items=int(os.getenv("TTS_CACHE_MAX_ITEMS", "2000")),
+    max_bytes=int(os.getenv("TTS_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    local_ttl_seconds=float(os.getenv("TTS_CACHE_LOCAL_TTL", "86400")),
+    redis_ttl_seconds=int(os.getenv("TTS_CACHE_REDIS_TTL", "604800")),
+    serializer=_bytes_identity,
+    deserializer=_bytes_identity,
+)
+
+# Cache key -> number of recent syntheses, for sentences that are not canned phrases
+synthesis_counts = utils_cache.LRUTTLCache(
+    max_items=int(os.getenv("TTS_CACHE_COUNT_MAX_ITEMS", "20000")),
+    ttl_seconds=float(os.getenv("TTS_CACHE_COUNT_TTL", "86400")),
+)
@@ -0,0 +1,382 @@
+# Standard Library Imports
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from collections import deque
+import asyncio
+import threading
+import time
+
+import os
+
+# Third-Party Imports
+import azure.cognitiveservices.speech as speechsdk
+
+from server import utils_logger
+console_logger, console_tracer = utils_logger.get_logger_tracer()
+
+PoolKey = Tuple[str, speechsdk.SpeechSynthesisOutputFormat]
+
+class PooledSynthesizer:
+    """
+    A SpeechSynthesizer with an open service connection, reused across requests.
+
+    The synthesizer writes no audio output (audio_config=None); audio is delivered through the
+    synthesizing events. The SDK handlers are connected once, and forward to the callbacks of the
+    request that currently holds the synthesizer.
+    """
+    def __init__(self, key: PoolKey, speech_config: speechsdk.SpeechConfig) -> None:
+        self.key = key
+        self.synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+        self.connection = speechsdk.Connection.from_speech_synthesizer(self.synthesizer)
+        self.connected = False
+        self.healthy = True
+        self.last_used = time.monotonic()
+
+        self.on_synthesizing: Optional[Callable[[Any], None]] = None
+        self.on_completed: Optional[Callable[[Any], None]] = None
+        self.on_canceled: Optional[Callable[[Any], None]] = None
+
+        self.connection.connected.connect(self._connected)
+        self.connection.disconnected.connect(self._disconnected)
+        self.synthesizer.synthesizing.connect(self._synthesizing)
+        self.synthesizer.synthesis_completed.connect(self._completed)
+        self.synthesizer.synthesis_canceled.connect(self._canceled)
+
+    def open(self) -> None:
+        """
+        Opens the service connection ahead of the first synthesis, paying the connection setup
+        and TLS handshake outside the request path.
+        """
+        self.connection.open(True)
+        self.connected = True
+
+    def close(self) -> None:
+        try:
+            self.connection.close()
+        except Exception as e:
+            console_logger.error(f"Error closing speech synthesizer connection: {e}")
+        self.connected = False
+
+    def stop_speaking(self) -> None:
+        """
+        Stops a synthesis in progress, so that a cancelled request does not hand a busy synthesizer
+        back to the pool. Blocking.
+        """
+        try:
+            self.synthesizer.stop_speaking_async().get()
+        except Exception as e:
+            console_logger.error(f"Error stopping speech synthesis: {e}")
+            self.healthy = False
+
+    def _connected(self, evt) -> None:
+        self.connected = True
+
+    def _disconnected(self, evt) -> None:
+        self.connected = False
+
+    def _synthesizing(self, evt) -> None:
+        if self.on_synthesizing:
+            self.on_synthesizing(evt)
+
+    def _completed(self, evt) -> None:
+        if self.on_completed:
+            self.on_completed(evt)
+
+    def _canceled(self, evt) -> None:
+        details = evt.result.cancellation_details
+        if details.reason == speechsdk.CancellationReason.Error:
+            console_logger.error(f"Speech synthesis canceled: {details.error_details}")
+            self.healthy = False
+        if self.on_canceled:
+            self.on_canceled(evt)
+
+class SynthesizerPool:
+    """
+    A bounded pool of pre-connected SpeechSynthesizers keyed by voice name and output format.
+
+    Checkout returns an idle synthesizer of the requested key if one is available, otherwise
+    creates one while the key is below `max_size`, otherwise waits for a checkin. Synthesizers
+    that reported an error are discarded at checkin, disconnected ones are reconnected at
+    checkout, and synthesizers idle for longer than `idle_timeout` seconds are closed.
+
+    `checkout` waits on a threading.Condition and is meant for worker threads. `acheckout` waits
+    on an asyncio future that a checkin resolves, so waiting for a synthesizer holds no thread.
+    """
+    def __init__(self, max_size: int, idle_timeout: float, checkout_timeout: float) -> None:
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+
+        self._speech_configs: Dict[PoolKey, speechsdk.SpeechConfig] = {}
+        self._idle: Dict[PoolKey, List[PooledSynthesizer]] = {}
+        self._sizes: Dict[PoolKey, int] = {}
+        self._condition = threading.Condition()
+        # Async checkouts waiting for a synthesizer of a key, woken one per checkin
+        self._async_waiters: Dict[PoolKey, Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {}
+
+        self.checkouts = 0
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        self.evictions = 0
+        self.discarded = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def get_speech_config(self, key: PoolKey) -> speechsdk.SpeechConfig:
+        speech_config = self._speech_configs.get(key)
+        if speech_config is None:
+            voice_name, output_format = key
+            speech_config = speechsdk.SpeechConfig(subscription=os.getenv("AZURE_TTS_API_KEY", ""), region=os.getenv("AZURE_TTS_REGION", ""))
+            speech_config.set_speech_synthesis_output_format(output_format)
+            speech_config.speech_synthesis_voice_name = voice_name
+            self._speech_configs[key] = speech_config
+        return speech_config
+
+    def _create(self, key: PoolKey) -> PooledSynthesizer:
+        """
+        Creates a synthesizer in a slot already reserved for `key`, releasing the slot if that fails.
+        """
+        try:
+            pooled = PooledSynthesizer(key, self.get_speech_config(key))
+        except Exception:
+            with self._condition:
+                self._sizes[key] -= 1
+                self._notify(key)
+            raise
+        try:
+            pooled.open()
+        except Exception as e:
+            # The synthesizer still works, it connects on its first synthesis
+            console_logger.error(f"Error pre-connecting speech synthesizer for {key[0]}: {e}")
+        return pooled
+
+    def _reconnect(self, pooled: PooledSynthesizer) -> PooledSynthesizer:
+        if not pooled.connected:
+            self.reconnects += 1
+            try:
+                pooled.open()
+            except Exception as e:
+                console_logger.error(f"Error reconnecting speech synthesizer for {pooled.key[0]}: {e}")
+        return pooled
+
+    def _notify(self, key: PoolKey) -> None:
+        """
+        Wakes one waiter for `key` after a synthesizer or a slot became free. Called with the condition held.
+        """
+        self._condition.notify()
+        waiters = self._async_waiters.get(key)
+        while waiters:
+            loop, future = waiters.popleft()
+            if not future.done():
+                loop.call_soon_threadsafe(self._wake, key, future)
+                return
+
+    def _wake(self, key: PoolKey, future: asyncio.Future) -> None:
+        # Runs on the waiter's event loop; a waiter that gave up in the meantime passes the wakeup on
+        if future.done():
+            with self._condition:
+                self._notify(key)
+        else:
+            future.set_result(None)
+
+    def _take(self, key: PoolKey) -> Tuple[Optional[PooledSynthesizer], bool]:
+        """
+        Takes an idle synthesizer of `key`, or reserves a slot to create one. Called with the condition held.
+
+        Returns:
+            Tuple[Optional[PooledSynthesizer], bool]: The idle synthesizer, and whether a slot was reserved.
+        """
+        idle = self._idle.setdefault(key, [])
+        if idle:
+            # Most recently used first, its connection is the most likely to still be open
+            self.hits += 1
+            return idle.pop(), False
+        if self._sizes.get(key, 0) < self.max_size:
+            self._sizes[key] = self._sizes.get(key, 0) + 1
+            self.misses += 1
+            return None, True
+        return None, False
+
+    def _evict_idle(self) -> List[PooledSynthesizer]:
+        # Called with the condition held
+        now = time.monotonic()
+        evicted = []
+        for key, idle in self._idle.items():
+            keep = [pooled for pooled in idle if now - pooled.last_used < self.idle_timeout]
+            if len(keep) != len(idle):
+                evicted.extend(pooled for pooled in idle if pooled not in keep)
+                self._sizes[key] -= len(idle) - len(keep)
+                self._idle[key] = keep
+                for _ in range(len(idle) - len(keep)):
+                    self._notify(key)
+        self.evictions += len(evicted)
+        return evicted
+
+    def _record_wait(self, started: float) -> None:
+        # Called with the condition held
+        waited = time.monotonic() - started
+        if waited > 0.001:
+            self.waits += 1
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def is_under_pressure(self, voice_name: str, output_format: speechsdk.SpeechSynthesisOutputFormat) -> bool:
+        """
+        Returns True when a checkout for the key would wait: no synthesizer is idle and none can be created.
+        """
+        key = (voice_name, output_format)
+        with self._condition:
+            return bool(self._async_waiters.get(key)) or (not self._idle.get(key) and self._sizes.get(key, 0) >= self.max_size)
+
+    @console_tracer.start_as_current_span("SynthesizerPool - checkout")
+    def checkout(self, voice_name: str, output_format: speechsdk.SpeechSynthesisOutputFormat) -> PooledSynthesizer:
+        """
+        Takes a synthesizer for `voice_name` and `output_format` out of the pool. Must be returned with `checkin`.
+        Blocking, for worker threads; see `acheckout` for the event loop.
+
+        Raises:
+            TimeoutError: If no synthesizer becomes available within `checkout_timeout` seconds.
+        """
+        key = (voice_name, output_format)
+        started = time.monotonic()
+        with self._condition:
+            evicted = self._evict_idle()
+            self.checkouts += 1
+            while True:
+                pooled, create = self._take(key)
+                if pooled is not None or create:
+                    break
+                remaining = self.checkout_timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    self.total_wait_seconds += self.checkout_timeout
+                    raise TimeoutError(f"No speech synthesizer available for {voice_name} within {self.checkout_timeout} seconds")
+                self._condition.wait(remaining)
+            self._record_wait(started)
+
+        for stale in evicted:
+            stale.close()
+
+        if create:
+            return self._create(key)
+        return self._reconnect(pooled)
+
+    async def acheckout(self, voice_name: str, output_format: speechsdk.SpeechSynthesisOutputFormat) -> PooledSynthesizer:
+        """
+        Same as `checkout`, without blocking the event loop or holding a thread while waiting.
+        Connecting a new or disconnected synthesizer runs in a worker thread.
+
+        Raises:
+            TimeoutError: If no synthesizer becomes available within `checkout_timeout` seconds.
+        """
+        key = (voice_name, output_format)
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        with self._condition:
+            evicted = self._evict_idle()
+            self.checkouts += 1
+        if evicted:
+            await asyncio.to_thread(lambda: [stale.close() for stale in evicted])
+
+        while True:
+            future: Optional[asyncio.Future] = None
+            with self._condition:
+                pooled, create = self._take(key)
+                if pooled is not None or create:
+                    self._record_wait(started)
+                    break
+                future = loop.create_future()
+                self._async_waiters.setdefault(key, deque()).append((loop, future))
+
+            remaining = self.checkout_timeout - (time.monotonic() - started)
+            try:
+                await asyncio.wait_for(future, timeout=max(remaining, 0))
+            except BaseException as e:
+                with self._condition:
+                    waiters = self._async_waiters.get(key)
+                    if waiters and (loop, future) in waiters:
+                        waiters.remove((loop, future))
+                    if future.done() and not future.cancelled():
+                        # Woken just as the wait ended: pass the wakeup on
+                        self._notify(key)
+                    if isinstance(e, asyncio.TimeoutError):
+                        self.timeouts += 1
+                        self.total_wait_seconds += self.checkout_timeout
+                if isinstance(e, asyncio.TimeoutError):
+                    raise TimeoutError(f"No speech synthesizer available for {voice_name} within {self.checkout_timeout} seconds") from None
+                raise
+
+        connect = asyncio.ensure_future(asyncio.to_thread(self._create, key) if create else asyncio.to_thread(self._reconnect, pooled))
+        try:
+            return await asyncio.shield(connect)
+        except asyncio.CancelledError:
+            # The request was cancelled while connecting in a thread: return the synthesizer once it arrives
+            connect.add_done_callback(lambda future: future.cancelled() or future.exception() or self.checkin(future.result()))
+            raise
+
+    def checkin(self, pooled: PooledSynthesizer) -> None:
+        """
+        Returns a synthesizer to the pool. Unhealthy synthesizers are closed instead of reused.
+        """
+        pooled.on_synthesizing = None
+        pooled.on_completed = None
+        pooled.on_canceled = None
+        pooled.last_used = time.monotonic()
+        with self._condition:
+            if pooled.healthy:
+                self._idle.setdefault(pooled.key, []).append(pooled)
+            else:
+                self._sizes[pooled.key] -= 1
+                self.discarded += 1
+            self._notify(pooled.key)
+        if not pooled.healthy:
+            pooled.close()
+
+    def prewarm(self, voice_name: str, output_format: speechsdk.SpeechSynthesisOutputFormat, count: int) -> None:
+        """
+        Opens `count` synthesizers for a key ahead of the first request.
+        """
+        synthesizers = [self.checkout(voice_name, output_format) for _ in range(min(count, self.max_size))]
+        for pooled in synthesizers:
+            self.checkin(pooled)
+
+    def close(self) -> None:
+        with self._condition:
+            idle = [pooled for synthesizers in self._idle.values() for pooled in synthesizers]
+            for key, synthesizers in self._idle.items():
+                self._sizes[key] -= len(synthesizers)
+            self._idle = {}
+        for pooled in idle:
+            pooled.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "checkouts": self.checkouts,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / self.checkouts if self.checkouts else 0.0,
+                "reconnects": self.reconnects,
+                "evictions": self.evictions,
+                "discarded": self.discarded,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "async_waiters": sum(len(waiters) for waiters in self._async_waiters.values()),
+                "avg_wait_ms": 1000 * self.total_wait_seconds / self.checkouts if self.checkouts else 0.0,
+                "max_wait_ms": 1000 * self.max_wait_seconds,
+                "size": {key[0] + "/" + key[1].name: size for key, size in self._sizes.items()},
+                "idle": sum(len(idle) for idle in self._idle.values()),
+            }
+
+# Each response keeps up to TTS_LOOKAHEAD sentences in flight, so by default a key holds that many
+# synthesizers for each of the concurrent responses a worker is expected to serve
+tts_lookahead: int = max(1, int(os.getenv("TTS_LOOKAHEAD", "3")))
+tts_expected_concurrency: int = int(os.getenv("TTS_EXPECTED_CONCURRENCY", "8"))
+
+synthesizer_pool = SynthesizerPool(
+    max_size=int(os.getenv("TTS_POOL_MAX_SIZE", str(tts_lookahead * tts_expected_concurrency))),
+    idle_timeout=float(os.getenv("TTS_POOL_IDLE_TIMEOUT", "300")),
+    checkout_timeout=float(os.getenv("TTS_POOL_CHECKOUT_TIMEOUT", "10")),
+)
@@ -0,0 +1,103 @@
+# Standard Library Imports
+from typing import Optional
+import time
+
+import os
+
+# Third-Party Imports
+import numpy as np
+
+from server import utils_logger
+console_logger, console_tracer = utils_logger.get_logger_tracer()
+
+vad_enabled: bool = os.getenv("VAD_ENABLED", "True").lower() == "true"
+
+class EndpointDetector:
+    """
+    Detects the end of an utterance in streamed 16 bit mono PCM from frame energy and zero-crossing rate.
+
+    A frame is speech when its energy is above the threshold and its zero-crossing rate is low
+    enough to rule out hiss, or when it is well above the threshold. The threshold follows the
+    background noise: it is `noise_margin_db` above a running estimate of the noise floor, and never
+    below `min_energy_db`. The end of speech is detected once `min_speech_ms` of speech has been
+    heard, followed by `trailing_silence_ms` of silence.
+    """
+    def __init__(self,
+                 sample_rate: int,
+                 frame_ms: int,
+                 min_energy_db: float,
+                 noise_margin_db: float,
+                 max_zcr: float,
+                 min_speech_ms: int,
+                 trailing_silence_ms: int) -> None:
+        self.frame_bytes = sample_rate * frame_ms // 1000 * 2
+        self.frame_ms = frame_ms
+        self.min_energy_db = min_energy_db
+        self.noise_margin_db = noise_margin_db
+        self.max_zcr = max_zcr
+        self.min_speech_ms = min_speech_ms
+        self.trailing_silence_ms = trailing_silence_ms
+
+        self._remainder = b""
+        self._noise_floor_db: Optional[float] = None
+        self.speech_ms = 0
+        self.silence_ms = 0
+        self.speech_ended_at: Optional[float] = None  # time.monotonic() at the end of the last speech frame
+        self.endpoint_detected = False
+
+    def process(self, pcm: bytes) -> bool:
+        """
+        Adds received audio and returns True once the end of the utterance has been detected.
+        """
+        if self.endpoint_detected:
+            return True
+        data = self._remainder + pcm
+        usable = len(data) - len(data) % self.frame_bytes
+        self._remainder = data[usable:]
+        if usable == 0:
+            return False
+
+        frames = np.frombuffer(data[:usable], dtype=np.int16).reshape(-1, self.frame_bytes // 2).astype(np.float32)
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        energy_db = 20 * np.log10(np.maximum(rms, 1.0) / 32768)
+        zcr = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+
+        for frame_energy_db, frame_zcr in zip(energy_db, zcr):
+            threshold_db = self.min_energy_db
+            if self._noise_floor_db is not None:
+                threshold_db = max(threshold_db, self._noise_floor_db + self.noise_margin_db)
+            is_speech = frame_energy_db > threshold_db and (frame_zcr <= self.max_zcr or frame_energy_db > threshold_db + self.noise_margin_db)
+
+            if is_speech:
+                self.speech_ms += self.frame_ms
+                self.silence_ms = 0
+                self.speech_ended_at = time.monotonic()
+            else:
+                self.silence_ms += self.frame_ms
+                # Follow the noise floor quickly downwards and slowly upwards
+                if self._noise_floor_db is None or frame_energy_db < self._noise_floor_db:
+                    self._noise_floor_db = float(frame_energy_db)
+                else:
+                    self._noise_floor_db = 0.95 * self._noise_floor_db + 0.05 * float(frame_energy_db)
+
+            if self.speech_ms >= self.min_speech_ms and self.silence_ms >= self.trailing_silence_ms:
+                console_logger.info(f"End of speech detected after {self.speech_ms} ms of speech and {self.silence_ms} ms of silence")
+                self.endpoint_detected = True
+                return True
+        return False
+
+def get_endpoint_detector(sample_rate: int = 16000) -> Optional[EndpointDetector]:
+    """
+    Creates an endpoint detector with the settings from the environment, or None if VAD is disabled.
+    """
+    if not vad_enabled:
+        return None
+    return EndpointDetector(
+        sample_rate=sample_rate,
+        frame_ms=20,
+        min_energy_db=float(os.getenv("VAD_MIN_ENERGY_DB", "-50")),
+        noise_margin_db=float(os.getenv("VAD_NOISE_MARGIN_DB", "10")),
+        max_zcr=float(os.getenv("VAD_MAX_ZCR", "0.3")),
+        min_speech_ms=int(os.getenv("VAD_MIN_SPEECH_MS", "200")),
+        trailing_silence_ms=int(os.getenv("VAD_TRAILING_SILENCE_MS", "800")),
+    )
@@ -1,50 +1,104 @@
-import threading  
-import queue  
-import re  
 import os
-import time
-from typing import Dict, AsyncGenerator, Optional, Any
+from typing import Dict, AsyncGenerator, List, Optional, Any
 import asyncio  
+import functools
 import azure.cognitiveservices.speech as speechsdk
 from opentelemetry import context as context_api
   
 from langchain_core.runnables import Runnable  
+from server import utils_tts_pool
+from server import utils_segmenter
+from server import utils_tts_cache
+from server import utils_filler
+from server import utils_codecs
 from server import utils_logger
 console_logger, console_tracer = utils_logger.get_logger_tracer()
+
+tts_voice_name: str = os.getenv("AZURE_TTS_SYNTHESIS_VOICE_NAME", "hi-IN-AartiNeural")
+tts_output_format: speechsdk.SpeechSynthesisOutputFormat = utils_codecs.get_audio_codec(None).output_format
+tts_lookahead: int = utils_tts_pool.tts_lookahead
+tts_synthesis_attempts: int = max(1, int(os.getenv("TTS_SYNTHESIS_ATTEMPTS", "2")))
   
+class SentenceJob:
+    """
+    One sentence scheduled for synthesis, with its audio in production order.
+    """
+    def __init__(self, index: int, sentence: str, loop: asyncio.AbstractEventLoop) -> None:
+        self.index = index
+        self.sentence = sentence
+        self.source = "tts"
+        self.chunks: asyncio.Queue = asyncio.Queue()
+        self.audio: List[bytes] = []
+        # Resolved by the SDK completion callbacks with whether synthesis succeeded
+        self.completed: asyncio.Future = loop.create_future()
+        self.scheduled_at = loop.time()
+        self.first_chunk_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._loop = loop
+
+    def add_audio(self, audio_chunk: bytes) -> None:
+        if self.first_chunk_at is None:
+            self.first_chunk_at = self._loop.time()
+        self.audio.append(audio_chunk)
+        self.chunks.put_nowait(audio_chunk)
+
+    def resolve(self, succeeded: bool) -> None:
+        if not self.completed.done():
+            self.completed.set_result(succeeded)
+
+    def finish(self) -> None:
+        if self.finished_at is not None:
+            return
+        self.finished_at = self._loop.time()
+        self.chunks.put_nowait(None)
+
+    def first_chunk_ms(self) -> Optional[float]:
+        return 1000 * (self.first_chunk_at - self.scheduled_at) if self.first_chunk_at is not None else None
+
+    def total_ms(self) -> float:
+        return 1000 * ((self.finished_at or self._loop.time()) - self.scheduled_at)
+
 class TextToGPTAudioStreamGenerator:  
     """  
-    A class to handle the generation of audio streams from text using threading and asynchronous processing.  
+    A class to handle the generation of audio streams from text as an asyncio pipeline.  
       
     This class manages the flow of text generation, sentence segmentation, and audio chunk creation.  
-    It utilizes multiple threads to handle different stages of the pipeline and provides an async  
-    generator to yield audio chunks for playback.  
+    Each stage runs as a task on the caller's event loop and hands its output to the next stage  
+    through an asyncio.Queue, with None as the end-of-stream sentinel. Speech SDK callbacks arrive  
+    on SDK threads and are bridged into the loop with call_soon_threadsafe, so no stage polls or sleeps.  
     """  
     
     @console_tracer.start_as_current_span("TextToGPTAudioStreamGenerator - init")
-    def __init__(self) -> None:  
+    def __init__(self, codec: Optional[utils_codecs.AudioCodec] = None) -> None:  
         """  
-        Initializes the TextToGPTAudioStreamGenerator instance with necessary queues and threading events.  
+        Initializes the TextToGPTAudioStreamGenerator instance with the queues between the pipeline stages.  
+
+        Args:  
+            codec (Optional[utils_codecs.AudioCodec]): The audio encoding negotiated with the client. Defaults to raw PCM.  
         """  
         self.full_response: str = ""  
-        # Queues for text chunks, sentences, and audio chunks  
-        self.text_queue: queue.Queue = queue.Queue()  
-        self.sentence_queue: queue.Queue = queue.Queue()  
-        self.audio_queue: queue.Queue = queue.Queue()  
-  
-        # Events to signal completion of each stage  
-        self.text_generation_complete: threading.Event = threading.Event()  
-        self.sentence_generation_complete: threading.Event = threading.Event()  
-        self.audio_generation_complete: threading.Event = threading.Event()  
-        # self.audio_queue_iterator_complete: threading.Event = threading.Event()  
-
-        #initialize the speech synthesizer
-        pull_stream = speechsdk.audio.PullAudioOutputStream()
-        stream_config = speechsdk.audio.AudioOutputConfig(stream=pull_stream)
-        speech_config = speechsdk.SpeechConfig(subscription=os.getenv("AZURE_TTS_API_KEY", ""), region=os.getenv("AZURE_TTS_REGION", ""))
-        speech_config.set_speech_synthesis_output_format(speechsdk.SpeechSynthesisOutputFormat.Raw8Khz16BitMonoPcm)
-        speech_config.speech_synthesis_voice_name = os.getenv("AZURE_TTS_SYNTHESIS_VOICE_NAME", "hi-IN-AartiNeural")
-        self.speech_synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=stream_config)
+        # Queues for text chunks, sentences, and audio chunks, each terminated by None  
+        self.text_queue: asyncio.Queue = asyncio.Queue()  
+        self.sentence_queue: asyncio.Queue = asyncio.Queue()  
+        self.audio_queue: asyncio.Queue = asyncio.Queue()  
+
+        # The speech synthesizer is checked out of the shared pool when audio generation starts
+        self.voice_name: str = tts_voice_name
+        self.codec: utils_codecs.AudioCodec = codec if codec is not None else utils_codecs.get_audio_codec(None)
+        self.output_format: speechsdk.SpeechSynthesisOutputFormat = self.codec.output_format
+        self.stream_started: bool = False
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # Sentences synthesized ahead of the one being streamed, see generate_audio
+        self.lookahead: int = tts_lookahead
+        self.sentences_in_flight: int = 0
+        self.total_lookahead_reduced = 0
+        self.sentence_first_chunk_ms: List[float] = []
+        self.total_sentences_cached = 0
+        # Filler audio streamed while tools run, cut off when the answer's audio arrives
+        self.user_language: str = "English"
+        self.filler_task: Optional[asyncio.Task] = None
+        self.filler_next_chunk: Optional[bytes] = None
+        self.total_fillers = 0
         self.total_sentences = 0
         self.total_sentences_audio_complete = 0
         self.first_audio_chunk: bool = True
@@ -53,40 +107,119 @@ class TextToGPTAudioStreamGenerator:
         self.total_audio_chunks_yield = 0;
         self.first_audio_chunk_span= None
         self.parent_context = None
+        # Set when the response is cancelled, see cancel
+        self.cancelled: bool = False
+        self.stages: List[asyncio.Task] = []
 
-    def az_speech_synthesis_callback(self, evt):
+    def az_speech_synthesis_callback(self, job: "SentenceJob", evt):
         """
-        Callback function to handle speech synthesis events.
+        Callback function to handle speech synthesis events. Runs on an SDK thread.
         """
         # Activate the parent context in this thread
         token = context_api.attach(self.parent_context) if self.parent_context else None
 
         if evt.result.reason == speechsdk.ResultReason.SynthesizingAudio:
-            audio_chunk = evt.result.audio_data
-            if self.first_audio_chunk:  
-                self.first_audio_chunk = False  
-                self.first_audio_chunk_span.end()
-                console_logger.info(f'First audio chunk generated by tts of size: {len(audio_chunk)}')  
-            
-            self.audio_queue.put(audio_chunk)  
+            self.loop.call_soon_threadsafe(job.add_audio, evt.result.audio_data)  
             self.total_audio_chunks += 1
         
         # Detach the context when done
         if token:
             context_api.detach(token)
 
-    def az_speech_synthesis_completecallback(self, evt):
+    def az_speech_synthesis_completecallback(self, job: "SentenceJob", evt):
         # Activate the parent context in this thread
         token = context_api.attach(self.parent_context) if self.parent_context else None
 
         if evt.result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
             self.total_sentences_audio_complete += 1
             console_logger.info(f'total sentences : {self.total_sentences}, total_sentences_audio_complete : {self.total_sentences_audio_complete}')  
+        # Scheduled after the audio chunks of the sentence, so the chunks are queued before the sentence completes
+        self.loop.call_soon_threadsafe(job.resolve, True)
             
         # detach the context when done
         if token:
             context_api.detach(token)
 
+    def az_speech_synthesis_canceledcallback(self, job: "SentenceJob", evt):
+        console_logger.error(f"Speech synthesis canceled: {evt.result.cancellation_details.error_details}")
+        self.loop.call_soon_threadsafe(job.resolve, False)
+
+    def record_first_audio_chunk(self, audio_chunk: bytes, source: str) -> None:
+        if self.first_audio_chunk:  
+            self.first_audio_chunk = False  
+            self.first_audio_chunk_span.end()
+            console_logger.info(f'First audio chunk generated by {source} of size: {len(audio_chunk)}')  
+
+    def put_audio(self, audio_chunk: bytes) -> None:
+        """
+        Queues audio of the answer. Runs on the event loop. Stops a playing filler first, ending it
+        with a short fade so that the cut does not click.
+        """
+        if self.filler_task is not None and not self.filler_task.done():
+            self.filler_task.cancel()
+            faded_chunk = utils_filler.fade_out(self.filler_next_chunk, self.codec) if self.filler_next_chunk else None
+            if faded_chunk:
+                self.audio_queue.put_nowait(faded_chunk)
+            self.filler_next_chunk = None
+        self.audio_queue.put_nowait(audio_chunk)
+
+    def start_filler(self) -> None:
+        """
+        Starts the filler when a tool call begins and nothing else is being spoken.
+        """
+        if not utils_filler.filler_audio_enabled or self.sentences_in_flight or not self.sentence_queue.empty():
+            return
+        if self.filler_task is not None and not self.filler_task.done():
+            return
+        self.filler_task = asyncio.create_task(self.play_filler())
+
+    async def play_filler(self) -> None:
+        """
+        Streams the pre-rendered filler clip for the user's language in the negotiated codec, paced in real time.
+        """
+        chunks = await utils_filler.get_filler_audio(self.user_language, self.voice_name, self.codec)
+        if not chunks or self.sentences_in_flight:
+            return
+        console_logger.info(f'Streaming filler audio of {len(chunks)} chunks')  
+        self.total_fillers += 1
+        started = self.loop.time()
+        sent_ms = 0.0
+        for index, (audio_chunk, chunk_ms) in enumerate(chunks):
+            if index == 0 and self.stream_started:
+                # Keep the response one continuous stream for container formats
+                audio_chunk = self.codec.strip_stream_header(audio_chunk)
+            self.record_first_audio_chunk(audio_chunk, "filler")
+            self.audio_queue.put_nowait(audio_chunk)
+            self.stream_started = True
+            self.filler_next_chunk = chunks[index + 1][0] if index + 1 < len(chunks) else None
+            sent_ms += chunk_ms
+            send_next_at = started + (sent_ms - utils_filler.filler_lead_ms) / 1000
+            await asyncio.sleep(max(0.0, send_next_at - self.loop.time()))
+        self.filler_next_chunk = None
+
+    def cancel(self) -> None:
+        """
+        Cancels the response, for example when the client disconnects or barges in. Stops text
+        generation, synthesis and the filler, drops the text, sentences and audio still queued and
+        ends the audio stream. Runs on the event loop.
+        """
+        if self.cancelled:
+            return
+        self.cancelled = True
+        console_logger.info("Cancelling the response")
+        for stage in self.stages:
+            stage.cancel()
+        if self.filler_task is not None:
+            self.filler_task.cancel()
+        for pending in (self.text_queue, self.sentence_queue, self.audio_queue):
+            while not pending.empty():
+                pending.get_nowait()
+        self.audio_queue.put_nowait(None)
+
+    async def cancel_when_set(self, cancellation: asyncio.Event) -> None:
+        await cancellation.wait()
+        self.cancel()
+
     def get_full_response(self) -> str:  
         """  
         Retrieves the full accumulated text response.  
@@ -99,17 +232,24 @@ class TextToGPTAudioStreamGenerator:
     async def generate_tokens(self, llm_agent_executor: Runnable, argument_dictionary: Dict[str, Any]  ) -> None:  
         """  
         Generate text chunks and place in text queue.  
-        Runs in a separate thread.  
+        Runs as a task on the caller's event loop so async tools share the server's clients.  
         """  
-        # Activate the parent context in this thread
-        token = context_api.attach(self.parent_context) if self.parent_context else None
-
         # Start text generation  
         first_text_chunk: bool = True 
+        step_has_text: bool = False
         try:  
             async for event in llm_agent_executor.astream_events(argument_dictionary, version="v2"):  
                 kind: str = event.get("event", "")  
-                if kind == "on_chat_model_stream":  
+                if kind == "on_tool_start":
+                    if step_has_text:
+                        # The model spoke before calling the tool: flush that text to speech now instead of
+                        # holding it in the segmenter until the tool returns; it already serves as the filler
+                        self.text_queue.put_nowait("\n")
+                    else:
+                        self.start_filler()
+                elif kind == "on_tool_end":
+                    step_has_text = False
+                elif kind == "on_chat_model_stream":  
                     new_text: str = event['data']['chunk'].content
                     if not new_text:  
                         continue  
@@ -118,108 +258,195 @@ class TextToGPTAudioStreamGenerator:
                         first_text_chunk = False  
                         console_logger.info(f'First text chunk generated of size: {len(new_text)}')  
   
+                    step_has_text = True
                     self.full_response += new_text  
-                    self.text_queue.put(new_text)  
+                    self.text_queue.put_nowait(new_text)  
   
         except Exception as e:  
             console_logger.error(f"Error in text generation: {e}")  
         finally:  
-            self.text_generation_complete.set()  
+            self.text_queue.put_nowait(None)  
             console_logger.info("Text token generation complete")  
-        
-        # Detach the context when done
-        if token:
-            context_api.detach(token)
-
-    def generate_tokens_wrapper(self, llm_agent_executor: Runnable, argument_dictionary: Dict[str, Any]) -> None:  
-        asyncio.run(self.generate_tokens(llm_agent_executor, argument_dictionary))
 
-    def generate_sentences(self) -> None:  
+    async def generate_sentences(self) -> None:  
         """  
-        Processes text chunks from the text_queue, splits them into sentences,  
-        and places the sentences into the sentence_queue.  
-        Runs in a separate thread.  
+        Processes text chunks from the text_queue, splits them into sentences with the  
+        incremental segmenter, and places the sentences into the sentence_queue.  
         """  
-        # Activate the parent context in this thread
-        token = context_api.attach(self.parent_context) if self.parent_context else None
-
-        sentence_buffer: str = ""  
+        segmenter: utils_segmenter.SentenceSegmenter = utils_segmenter.get_sentence_segmenter()
         first_sentence_chunk: bool = True  
-        sentence_pattern: re.Pattern = re.compile(r'[^.!।?:\n\t]+[.!।?:\n\t]')  
-  
-        while not (self.text_generation_complete.is_set() and self.text_queue.empty()):  
-            try:  
-                new_text: str = self.text_queue.get(timeout=0.1)  
-                sentence_buffer += new_text  
-                sentences: list = sentence_pattern.findall(sentence_buffer)  
-  
-                for sentence in sentences:  
-                    stripped_sentence: str = sentence.strip()  
-                    if(stripped_sentence == ""):
-                        continue
-                    if first_sentence_chunk:  
-                        first_sentence_chunk = False  
-                        console_logger.info(f'First sentence generated of size: {len(stripped_sentence)}')  
-                    self.sentence_queue.put(stripped_sentence)  
-                    self.total_sentences += 1
-                    console_logger.info(f'Adding sentence to queue : [{stripped_sentence}], total sentences: {self.total_sentences}')
-  
-                # Retain any partial sentence in the buffer  
-                sentence_buffer = re.sub(r'.*[.!।?:\n\t]', '', sentence_buffer)  
-            except queue.Empty:  
-                continue  
+
+        def add_sentence(sentence: str) -> None:
+            nonlocal first_sentence_chunk
+            if first_sentence_chunk:  
+                first_sentence_chunk = False  
+                console_logger.info(f'First sentence generated of size: {len(sentence)}')  
+            self.sentence_queue.put_nowait(sentence)  
+            self.total_sentences += 1
+            console_logger.info(f'Adding sentence to queue : [{sentence}], total sentences: {self.total_sentences}')
   
-        if sentence_buffer.strip():  
-            self.sentence_queue.put(sentence_buffer.strip())  
+        try:
+            while True:
+                timeout = segmenter.get_first_chunk_timeout()
+                try:
+                    new_text = await asyncio.wait_for(self.text_queue.get(), timeout) if timeout is not None else await self.text_queue.get()
+                except asyncio.TimeoutError:
+                    # The text stream paused before the first chunk ended: cut it on time anyway
+                    sentence = segmenter.poll()
+                    if sentence:
+                        add_sentence(sentence)
+                    continue
+                if new_text is None:
+                    break
+                for sentence in segmenter.feed(new_text):
+                    add_sentence(sentence)
   
-        self.sentence_generation_complete.set()  
-        console_logger.info("Text Sentence generation complete")  
+            # Any partial sentence left in the buffer  
+            remaining = segmenter.flush()
+            if remaining:  
+                add_sentence(remaining)
+        finally:
+            self.sentence_queue.put_nowait(None)  
+            console_logger.info("Text Sentence generation complete")  
 
-        # Detach the context when done
-        if token:
-            context_api.detach(token)
- 
+    async def checkout_synthesizer(self) -> utils_tts_pool.PooledSynthesizer:
+        """
+        Checks a synthesizer out of the pool, waiting for as long as it takes: a sentence is never
+        dropped because the pool is busy.
+        """
+        while True:
+            try:
+                return await utils_tts_pool.synthesizer_pool.acheckout(self.voice_name, self.output_format)
+            except TimeoutError as e:
+                console_logger.warning(f"{e}, still waiting")
+
+    def get_lookahead(self) -> int:
+        """
+        Returns how many sentences may be synthesized at once: `lookahead`, or 1 while the pool has no
+        free synthesizer, so that concurrent responses share the pool instead of queueing behind each other's lookahead.
+        """
+        if self.lookahead > 1 and utils_tts_pool.synthesizer_pool.is_under_pressure(self.voice_name, self.output_format):
+            return 1
+        return self.lookahead
 
-    def generate_audio(self) -> None:  
+    async def synthesize_sentence(self, job: "SentenceJob") -> None:
+        """
+        Produces the audio of one sentence into its job, from the TTS cache or a pooled synthesizer.
+        """
+        with console_tracer.start_as_current_span("synthesize_sentence") as span:
+            span.set_attribute("sentence.index", job.index)
+            cacheable = utils_tts_cache.is_cacheable(job.sentence)
+            cache_key = utils_tts_cache.get_tts_cache_key(job.sentence, self.voice_name, self.output_format) if cacheable else None
+            pooled_synthesizer: Optional[utils_tts_pool.PooledSynthesizer] = None
+            try:
+                cached_audio: Optional[bytes] = await utils_tts_cache.tts_cache.get(cache_key) if cacheable else None
+                if cached_audio:
+                    console_logger.info(f'Streaming cached audio for sentence: {job.sentence}')  
+                    job.source = "tts cache"
+                    for audio_chunk in utils_tts_cache.split_audio(cached_audio, self.codec):
+                        job.add_audio(audio_chunk)
+                        self.total_audio_chunks += 1
+                    self.total_sentences_cached += 1
+                    return
+
+                for attempt in range(1, tts_synthesis_attempts + 1):
+                    pooled_synthesizer = await self.checkout_synthesizer()
+                    pooled_synthesizer.on_synthesizing = functools.partial(self.az_speech_synthesis_callback, job)
+                    pooled_synthesizer.on_completed = functools.partial(self.az_speech_synthesis_completecallback, job)
+                    pooled_synthesizer.on_canceled = functools.partial(self.az_speech_synthesis_canceledcallback, job)
+
+                    console_logger.info(f'Generating audio for sentence: {job.sentence}')  
+                    pooled_synthesizer.synthesizer.speak_text_async(job.sentence)
+                    succeeded = await job.completed
+                    if succeeded or job.audio or attempt == tts_synthesis_attempts:
+                        break
+                    # Nothing of the sentence was heard yet, so it can be synthesized again on another synthesizer
+                    console_logger.warning(f'Retrying synthesis of sentence: {job.sentence}')
+                    utils_tts_pool.synthesizer_pool.checkin(pooled_synthesizer)
+                    pooled_synthesizer = None
+                    job.completed = self.loop.create_future()
+                if succeeded and cacheable and job.audio and utils_tts_cache.should_store(job.sentence, cache_key):
+                    # Release the sentence to the player first, the cache write must not delay it
+                    job.finish()
+                    utils_tts_cache.store_in_background(cache_key, b"".join(job.audio))
+            except asyncio.CancelledError:
+                # The response was cancelled mid-sentence: stop the synthesis before the synthesizer goes back to the pool.
+                # Cancelling the task also cancels the job.completed future it was awaiting.
+                if pooled_synthesizer is not None and (job.completed.cancelled() or not job.completed.done()):
+                    await asyncio.to_thread(pooled_synthesizer.stop_speaking)
+                raise
+            except Exception as e:  
+                console_logger.error(f"Error in synthesize_sentence: {e}")  
+            finally:
+                if pooled_synthesizer is not None:
+                    utils_tts_pool.synthesizer_pool.checkin(pooled_synthesizer)
+                job.finish()
+                span.set_attribute("tts.source", job.source)
+                span.set_attribute("tts.total_ms", job.total_ms())
+                if job.first_chunk_ms() is not None:
+                    span.set_attribute("tts.first_chunk_ms", job.first_chunk_ms())
+                    self.sentence_first_chunk_ms.append(job.first_chunk_ms())
+
+    async def generate_audio(self) -> None:  
         """  
-        Converts sentences from the sentence_queue into audio chunks and places them into the audio_queue.  
-        Runs in a separate thread.  
-          
-        Args:  
-            llm_audio_generator (Runnable): An instance responsible for generating audio from text.  
+        Schedules sentences from the sentence_queue for synthesis, keeping up to `lookahead` sentences  
+        in flight on separate pooled synthesizers (one while the pool is exhausted, see get_lookahead),  
+        and hands them to the reassembly stage in order.  
         """  
-        # Activate the parent context in this thread
-        token = context_api.attach(self.parent_context) if self.parent_context else None
-        self.speech_synthesizer.synthesizing.connect(self.az_speech_synthesis_callback)
-        self.speech_synthesizer.synthesis_completed.connect(self.az_speech_synthesis_completecallback)
-
-        while not (self.sentence_generation_complete.is_set() and self.sentence_queue.empty()):  
-            try:  
-                sentence: Optional[str] = self.sentence_queue.get(timeout=0.5)  
-                if not sentence:  
-                    continue  
-  
-                console_logger.info(f'Generating audio for sentence: {sentence}')  
-  
-                result = self.speech_synthesizer.speak_text_async(sentence).get()  
-  
-            except queue.Empty:  
-                continue  
-            except Exception as e:  
-                console_logger.error(f"Error in generate_audio: {e}")  
-                continue  
+        jobs: asyncio.Queue = asyncio.Queue()
+        reassembly = asyncio.create_task(self.reassemble_audio(jobs))
+        sentence_synthesized = asyncio.Event()
+        synthesis_tasks = set()
+        index = 0
+        try:
+            while (sentence := await self.sentence_queue.get()) is not None:  
+                held_back = False
+                while self.sentences_in_flight >= self.get_lookahead():
+                    held_back = held_back or self.sentences_in_flight < self.lookahead
+                    sentence_synthesized.clear()
+                    await sentence_synthesized.wait()
+                self.total_lookahead_reduced += held_back
+                job = SentenceJob(index, sentence, self.loop)
+                index += 1
+                self.sentences_in_flight += 1
+                jobs.put_nowait(job)
+                task = asyncio.create_task(self.synthesize_sentence(job))
+                synthesis_tasks.add(task)
 
-        while(self.total_sentences > self.total_sentences_audio_complete):
-            console_logger.info(f'total sentences : {self.total_sentences}, total_sentences_audio_complete : {self.total_sentences_audio_complete}')            
-            # sleep for 0.5 second to ensure all audio chunks are generated
-            time.sleep(0.5)
+                def on_synthesized(task: asyncio.Task) -> None:
+                    synthesis_tasks.discard(task)
+                    self.sentences_in_flight -= 1
+                    sentence_synthesized.set()
+                task.add_done_callback(on_synthesized)
 
-        self.audio_generation_complete.set()
-        console_logger.info("Audio chunk generation complete")
+            jobs.put_nowait(None)
+            await reassembly
+        except Exception as e:
+            console_logger.error(f"Error in generate_audio: {e}")
+        finally:
+            for task in list(synthesis_tasks):
+                task.cancel()
+            reassembly.cancel()
+            if self.filler_task is not None:
+                self.filler_task.cancel()
+            self.audio_queue.put_nowait(None)
+            console_logger.info("Audio chunk generation complete")
 
-        # Detach the context when done
-        if token:
-            context_api.detach(token)
+    async def reassemble_audio(self, jobs: asyncio.Queue) -> None:
+        """
+        Streams the audio of each sentence in sentence order. The audio of the sentence at the
+        head is streamed as it is produced; later sentences are buffered until their turn.
+        """
+        while (job := await jobs.get()) is not None:
+            first_job_chunk = True
+            while (audio_chunk := await job.chunks.get()) is not None:
+                if first_job_chunk and self.stream_started:
+                    # Keep the response one continuous stream for container formats
+                    audio_chunk = self.codec.strip_stream_header(audio_chunk)
+                first_job_chunk = False
+                self.record_first_audio_chunk(audio_chunk, job.source)
+                self.put_audio(audio_chunk)
+                self.stream_started = True
   
     async def audio_queue_iterator(self) -> AsyncGenerator[bytes, None]:  
         """  
@@ -228,73 +455,78 @@ class TextToGPTAudioStreamGenerator:
         Yields:  
             bytes: Audio chunk data.  
         """  
-        # Activate the parent context in this thread
-        token = context_api.attach(self.parent_context) if self.parent_context else None
-
         first_network_audio_chunk: bool = True  
   
-        while not (self.audio_generation_complete.is_set() and self.audio_queue.empty()):  
-            try:  
-                audio_chunk: bytes = self.audio_queue.get(timeout=0.1)  
-                if first_network_audio_chunk:  
-                    first_network_audio_chunk = False  
-                    console_logger.info(f'First audio chunk added to queue of size: {len(audio_chunk)}')  
-                
-                self.total_audio_chunks_on_queue_iter += 1
-                yield audio_chunk  
-            except queue.Empty:  
-                await asyncio.sleep(0.01)  
-                continue
+        while (audio_chunk := await self.audio_queue.get()) is not None:  
+            if first_network_audio_chunk:  
+                first_network_audio_chunk = False  
+                console_logger.info(f'First audio chunk added to queue of size: {len(audio_chunk)}')  
+            
+            self.total_audio_chunks_on_queue_iter += 1
+            yield audio_chunk  
 
         console_logger.info("Audio chunk Queue_iter complete")  
-        # Detach the context when done
-        if token:
-            context_api.detach(token)
   
     # @console_tracer.start_as_current_span("generate_first_audio_chunk")
     async def generate_audio_chunks(  
         self,  
         llm_agent_executor: Runnable,  
-        argument_dictionary: Dict[str, Any]  
+        argument_dictionary: Dict[str, Any],  
+        cancellation: Optional[asyncio.Event] = None  
     ) -> AsyncGenerator[bytes, None]:  
         """  
-        Orchestrates the generation of audio chunks from text by managing threads and asynchronous operations.  
+        Orchestrates the generation of audio chunks from text by running the pipeline stages as tasks.  
           
         Args:  
             llm_agent_executor (Runnable): Runnable instance for text generation.  
             argument_dictionary (Dict[str, str]): Dictionary of arguments for the agent executor.  
+            cancellation (Optional[asyncio.Event]): Cancels the response when set, see cancel.  
           
         Yields:  
             AsyncGenerator[bytes, None]: Yields audio chunks as they become available.  
         """  
         with console_tracer.start_as_current_span("generate_audio_chunks") as span:
             self.first_audio_chunk_span = console_tracer.start_span("first_audio_chunk")
-            # Capture the current context to pass to threads
+            # Capture the current context to pass to the SDK callback threads
             self.parent_context = context_api.get_current()
+            self.loop = asyncio.get_running_loop()
+            self.user_language = argument_dictionary.get("user_language") or "English"
 
-            token_gen_thread: threading.Thread = threading.Thread(target=self.generate_tokens_wrapper, args=(llm_agent_executor,argument_dictionary,), daemon=True)
-            token_gen_thread.start()  
-    
-            # Start sentence processing thread  
-            sentence_gen_thread: threading.Thread = threading.Thread(target=self.generate_sentences, daemon=True)  
-            sentence_gen_thread.start()  
-    
-            # Start audio generation thread  
-            audio_gen_thread: threading.Thread = threading.Thread(target=self.generate_audio, args=(), daemon=True)
-            audio_gen_thread.start()  
-    
-            # Yield audio chunks as they become available  
-            async for audio_chunk in self.audio_queue_iterator():  
-                self.total_audio_chunks_yield += 1
-                yield audio_chunk  
+            stages = [
+                asyncio.create_task(self.generate_tokens(llm_agent_executor, argument_dictionary)),
+                asyncio.create_task(self.generate_sentences()),
+                asyncio.create_task(self.generate_audio()),
+            ]
+            self.stages = stages
+            watcher = asyncio.create_task(self.cancel_when_set(cancellation)) if cancellation is not None else None
+            try:
+                # Yield audio chunks as they become available  
+                async for audio_chunk in self.audio_queue_iterator():  
+                    self.total_audio_chunks_yield += 1
+                    yield audio_chunk  
 
-            del self.speech_synthesizer
-            # Ensure threads have completed  
-            token_gen_thread.join()
-            sentence_gen_thread.join()  
-            audio_gen_thread.join()  
+                if not self.cancelled:
+                    # A cancellation may still arrive while the stages wind down; the stages handle their own errors
+                    await asyncio.gather(*stages, return_exceptions=True)
+            finally:
+                # The consumer may stop early, for example when the client disconnects
+                for stage in stages:
+                    stage.cancel()
+                if self.filler_task is not None:
+                    self.filler_task.cancel()
+                if watcher is not None:
+                    watcher.cancel()
+            span.set_attribute("cancelled", self.cancelled)
 
             console_logger.info(f'Total audio chunks generated: {self.total_audio_chunks}')
+            console_logger.info(f'Total sentences served from the tts cache: {self.total_sentences_cached}')
+            if self.sentence_first_chunk_ms:
+                span.set_attribute("tts.avg_first_chunk_ms", sum(self.sentence_first_chunk_ms) / len(self.sentence_first_chunk_ms))
+                console_logger.info(f'Sentence first audio chunk latency in ms, avg: {sum(self.sentence_first_chunk_ms) / len(self.sentence_first_chunk_ms):.0f}, max: {max(self.sentence_first_chunk_ms):.0f}')
+            if self.total_lookahead_reduced:
+                span.set_attribute("tts.lookahead_reduced", self.total_lookahead_reduced)
+                console_logger.info(f'Sentences held back by a busy synthesizer pool: {self.total_lookahead_reduced}')
+            console_logger.info(f'Total fillers streamed: {self.total_fillers}')
             console_logger.info(f'Total audio chunks on queue_iter: {self.total_audio_chunks_on_queue_iter}')
             console_logger.info(f'Total audio chunks yielded: {self.total_audio_chunks_yield}')
-            console_logger.info("Audio chunk generation process complete")  
\ No newline at end of file
+            console_logger.info("Audio chunk generation process complete")
@@ -0,0 +1,26 @@
+# Standard Library Imports
+import importlib
+import os
+import sys
+import types
+
+# Third-Party Imports
+import pytest
+
+# The server modules configure Azure Monitor on import; keep it offline for the tests
+os.environ.setdefault("APPLICATIONINSIGHTS_CONNECTION_STRING", "InstrumentationKey=00000000-0000-0000-0000-000000000000")
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def utils_db_async(monkeypatch):
+    """
+    Imports utils_db_async with utils_db replaced: utils_db connects to Cosmos DB on import.
+    """
+    fake_utils_db = types.ModuleType("server.utils_db")
+    fake_utils_db.max_history = -6
+    monkeypatch.setitem(sys.modules, "server.utils_db", fake_utils_db)
+    monkeypatch.delitem(sys.modules, "server.utils_db_async", raising=False)
+    yield importlib.import_module("server.utils_db_async")
+    sys.modules.pop("server.utils_db_async", None)
@@ -0,0 +1,59 @@
+from server import utils_cache
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_least_recently_used_entry_is_evicted():
+    cache = utils_cache.LRUTTLCache(max_items=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.get_stats()["evictions"] == 1
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(utils_cache.time, "monotonic", clock)
+    cache = utils_cache.LRUTTLCache(max_items=10, ttl_seconds=60)
+    cache.set("a", 1)
+    clock.now += 59
+    assert cache.get("a") == 1
+    clock.now += 2
+    assert cache.get("a") is None
+    assert cache.get_stats()["size"] == 0
+
+def test_setting_a_key_again_renews_it(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(utils_cache.time, "monotonic", clock)
+    cache = utils_cache.LRUTTLCache(max_items=10, ttl_seconds=60)
+    cache.set("a", 1)
+    clock.now += 50
+    cache.set("a", 2)
+    clock.now += 50
+    assert cache.get("a") == 2
+
+def test_entries_are_evicted_by_total_bytes():
+    cache = utils_cache.LRUTTLCache(max_items=10, ttl_seconds=60, max_bytes=10)
+    cache.set("a", b"12345")
+    cache.set("b", b"12345")
+    cache.set("c", b"1")
+    assert cache.get("a") is None
+    assert cache.get_stats()["bytes"] == 6
+    # An entry larger than the limit is still kept on its own
+    cache.set("d", b"x" * 20)
+    assert cache.get("d") == b"x" * 20
+    assert cache.get_stats()["size"] == 1
+
+def test_invalidate_and_stats():
+    cache = utils_cache.LRUTTLCache(max_items=10, ttl_seconds=60, max_bytes=100)
+    cache.set("a", b"123")
+    cache.invalidate("a")
+    cache.invalidate("missing")
+    assert cache.get("a") is None
+    assert cache.get_stats() == {"size": 0, "bytes": 0, "hits": 0, "misses": 1, "evictions": 0}
@@ -0,0 +1,49 @@
+# Standard Library Imports
+import struct
+
+from server import utils_codecs
+from server import utils_filler
+
+def make_ogg_page(granule: int, payload: bytes) -> bytes:
+    segments = [255] * (len(payload) // 255) + [len(payload) % 255]
+    return struct.pack("<4sBBqIIIB", b"OggS", 0, 0, granule, 1, 0, 0, len(segments)) + bytes(segments) + payload
+
+def make_mp3_frame() -> bytes:
+    # MPEG-2 layer III, 32 kbps, 16 kHz, no padding: 144 bytes and 36 ms
+    return b"\xff\xf3\x48\xc4" + b"\x00" * 140
+
+def test_pcm_frames_are_sample_aligned():
+    frames = utils_codecs.split_pcm_frames(b"\x01\x00" * 500, bytes_per_ms=16)
+    assert [len(frame) for frame, _ in frames] == [320, 320, 320, 40]
+    assert [duration for _, duration in frames] == [20, 20, 20, 2.5]
+
+def test_ogg_stream_is_split_on_pages():
+    head = make_ogg_page(0, b"OpusHead" + b"\x00" * 11)
+    pages = [make_ogg_page(960 * (index + 1), b"\x00" * 300) for index in range(3)]
+    frames = utils_codecs.split_ogg_pages(head + b"".join(pages))
+    assert [frame for frame, _ in frames] == [head, *pages]
+    assert [duration for _, duration in frames] == [0, 20, 20, 20]
+
+def test_amr_wb_stream_is_split_on_frames():
+    # Frame type 8 (23.85 kbps) is 61 bytes, frame type 2 (12.65 kbps) is 33 bytes
+    audio = utils_codecs.AMR_WB_HEADER + b"\x44" + b"\x00" * 60 + b"\x14" + b"\x00" * 32
+    frames = utils_codecs.split_amr_wb_frames(audio)
+    assert [len(frame) for frame, _ in frames] == [9, 61, 33]
+    assert [duration for _, duration in frames] == [0, 20, 20]
+
+def test_mp3_stream_is_split_on_frames():
+    frames = utils_codecs.split_mp3_frames(make_mp3_frame() * 3 + b"\xff")
+    assert [len(frame) for frame, _ in frames] == [144, 144, 144, 1]
+    assert [duration for _, duration in frames] == [36, 36, 36, 0]
+
+def test_filler_chunks_keep_frames_whole():
+    codec = utils_codecs.get_audio_codec("mp3")
+    audio = make_mp3_frame() * 10
+    chunks = utils_filler.split_filler_audio(audio, codec)
+    assert b"".join(chunk for chunk, _ in chunks) == audio
+    assert all(len(chunk) % 144 == 0 for chunk, _ in chunks)
+    assert [duration for _, duration in chunks] == [108, 108, 108, 36]
+
+def test_filler_fade_is_pcm_only():
+    assert len(utils_filler.fade_out(b"\x10\x00" * 800, utils_codecs.get_audio_codec("pcm"))) == utils_filler.filler_fade_ms * 16
+    assert utils_filler.fade_out(make_mp3_frame(), utils_codecs.get_audio_codec("mp3")) is None
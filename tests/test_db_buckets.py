@@ -0,0 +1,107 @@
+# Standard Library Imports
+import asyncio
+
+# Third-Party Imports
+import pytest
+from azure.cosmos import exceptions
+
+def messages(count: int, start: int = 0) -> list:
+    return [{"role": "user", "content": str(index)} for index in range(start, start + count)]
+
+def test_last_bucket(utils_db_async):
+    assert utils_db_async.get_last_bucket(0, 40) == -1
+    assert utils_db_async.get_last_bucket(1, 40) == 0
+    assert utils_db_async.get_last_bucket(40, 40) == 0
+    assert utils_db_async.get_last_bucket(41, 40) == 1
+
+def test_bucket_id(utils_db_async):
+    assert utils_db_async.get_bucket_id("session", 3) == "session:3"
+
+def test_first_messages_go_to_bucket_zero(utils_db_async):
+    new_messages = messages(3)
+    assert utils_db_async.group_by_bucket(0, 40, new_messages) == {0: new_messages}
+
+def test_messages_spanning_a_bucket_boundary(utils_db_async):
+    new_messages = messages(5, start=38)
+    buckets = utils_db_async.group_by_bucket(38, 40, new_messages)
+    assert buckets == {0: new_messages[:2], 1: new_messages[2:]}
+
+def test_messages_spanning_several_buckets(utils_db_async):
+    new_messages = messages(9, start=3)
+    buckets = utils_db_async.group_by_bucket(3, 4, new_messages)
+    assert {bucket: len(bucket_messages) for bucket, bucket_messages in buckets.items()} == {0: 1, 1: 4, 2: 4}
+    # Every appended message lands in the bucket its position falls into
+    for bucket, bucket_messages in buckets.items():
+        assert all(int(message["content"]) // 4 == bucket for message in bucket_messages)
+    assert utils_db_async.get_last_bucket(3 + 9, 4) == 2
+
+class FakeContainer:
+    """
+    Holds documents of one partition and applies transactional batches the way Cosmos DB does:
+    every write changes the document's etag, and a failed precondition fails the whole batch.
+    """
+    def __init__(self, documents: list) -> None:
+        self.documents = {document["id"]: dict(document, _etag="0") for document in documents}
+        self.etags = 0
+
+    async def read_item(self, item, partition_key, response_hook=None):
+        if item not in self.documents:
+            raise exceptions.CosmosResourceNotFoundError()
+        return dict(self.documents[item])
+
+    async def execute_item_batch(self, batch_operations, partition_key, response_hook=None):
+        documents = {key: dict(document, messages=list(document.get("messages", []))) for key, document in self.documents.items()}
+        for operation in batch_operations:
+            kind, arguments = operation[0], operation[1]
+            options = operation[2] if len(operation) > 2 else {}
+            if kind == "create":
+                document = dict(arguments[0])
+            else:
+                item_id, patch_operations = arguments
+                document = documents[item_id]
+                if "if_match_etag" in options and options["if_match_etag"] != document["_etag"]:
+                    raise RuntimeError("Precondition failed")
+                assert len(patch_operations) <= 10
+                for patch_operation in patch_operations:
+                    if patch_operation["path"] == "/messages/-":
+                        document["messages"].append(patch_operation["value"])
+                    elif patch_operation["op"] == "incr":
+                        document[patch_operation["path"][1:]] += patch_operation["value"]
+                    else:
+                        document[patch_operation["path"][1:]] = patch_operation["value"]
+            self.etags += 1
+            document["_etag"] = str(self.etags)
+            documents[document["id"]] = document
+        self.documents = documents
+        return []
+
+def test_legacy_append_of_more_than_ten_messages(utils_db_async):
+    container = FakeContainer([{"id": "session", "deviceId": "device", "messages": messages(3)}])
+    asyncio.run(utils_db_async.append_messages_to_buckets(container, {"id": "session", "deviceId": "device"}, messages(25, start=3)))
+    assert container.documents["session"]["messages"] == messages(28)
+
+def test_legacy_append_fails_on_concurrent_write(utils_db_async):
+    container = FakeContainer([{"id": "session", "deviceId": "device", "messages": messages(3)}])
+    original_read_item = container.read_item
+
+    async def read_then_concurrent_write(item, partition_key, response_hook=None):
+        document = await original_read_item(item, partition_key, response_hook)
+        await container.execute_item_batch([("patch", ("session", [{"op": "add", "path": "/messages/-", "value": {"role": "user", "content": "other"}}]))], partition_key)
+        return document
+
+    container.read_item = read_then_concurrent_write
+    with pytest.raises(RuntimeError):
+        asyncio.run(utils_db_async.append_messages_to_buckets(container, {"id": "session", "deviceId": "device"}, messages(12, start=3)))
+    assert len(container.documents["session"]["messages"]) == 4
+
+def test_bucketed_append_across_buckets(utils_db_async):
+    container = FakeContainer([])
+    conversation = {"id": "session", "deviceId": "device"}
+    asyncio.run(utils_db_async.append_messages_to_buckets(container, conversation, messages(30)))
+    asyncio.run(utils_db_async.append_messages_to_buckets(container, conversation, messages(25, start=30)))
+    bucket_size = utils_db_async.conversation_bucket_size
+    assert container.documents["session"]["messageCount"] == 55
+    stored = []
+    for bucket in range(utils_db_async.get_last_bucket(55, bucket_size) + 1):
+        stored += container.documents[utils_db_async.get_bucket_id("session", bucket)]["messages"]
+    assert stored == messages(55)
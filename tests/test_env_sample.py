@@ -0,0 +1,15 @@
+# Standard Library Imports
+import os
+
+# Third-Party Imports
+from dotenv import dotenv_values
+
+env_sample = dotenv_values(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server", ".env.sample"))
+
+def test_comments_are_not_part_of_values():
+    assert [key for key, value in env_sample.items() if value and "#" in value] == []
+
+def test_vad_settings_parse():
+    assert env_sample["VAD_ENABLED"].lower() == "true"
+    for key in ["VAD_TRAILING_SILENCE_MS", "VAD_MIN_SPEECH_MS", "VAD_MIN_ENERGY_DB", "VAD_NOISE_MARGIN_DB", "VAD_MAX_ZCR"]:
+        float(env_sample[key])
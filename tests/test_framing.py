@@ -0,0 +1,46 @@
+# Third-Party Imports
+import pytest
+
+from server import utils_framing
+
+def get_stream() -> bytes:
+    return (utils_framing.encode_frame(utils_framing.FRAME_AUDIO, b"\x01\x02\x03" * 100)
+            + utils_framing.encode_text_frame(utils_framing.FRAME_TRANSCRIPT, "नमस्ते")
+            + utils_framing.encode_frame(utils_framing.FRAME_AUDIO, b"")
+            + utils_framing.encode_json_frame(utils_framing.FRAME_METRICS, {"first_audio_ms": 420}))
+
+def decode(chunks) -> list:
+    decoder = utils_framing.FrameDecoder()
+    frames = []
+    for chunk in chunks:
+        frames += [(frame_type, bytes(payload)) for frame_type, payload in decoder.feed(chunk)]
+    assert decoder.is_complete()
+    return frames
+
+def test_frames_in_one_chunk_are_not_copied():
+    stream = get_stream()
+    frames = utils_framing.FrameDecoder().feed(stream)
+    assert [frame_type for frame_type, _ in frames] == [utils_framing.FRAME_AUDIO, utils_framing.FRAME_TRANSCRIPT, utils_framing.FRAME_AUDIO, utils_framing.FRAME_METRICS]
+    assert all(payload.obj is stream for _, payload in frames)
+    assert bytes(frames[1][1]).decode("utf-8") == "नमस्ते"
+    assert bytes(frames[3][1]) == b'{"first_audio_ms": 420}'
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 5, 7, 64])
+def test_frames_split_across_chunks(chunk_size):
+    stream = get_stream()
+    chunks = [stream[start:start + chunk_size] for start in range(0, len(stream), chunk_size)]
+    assert decode(chunks) == decode([stream])
+
+def test_partial_frame_is_incomplete():
+    stream = get_stream()
+    decoder = utils_framing.FrameDecoder()
+    decoder.feed(stream[:-1])
+    assert not decoder.is_complete()
+    decoder = utils_framing.FrameDecoder()
+    decoder.feed(stream[:3])
+    assert not decoder.is_complete()
+
+def test_unknown_framing_falls_back_to_json():
+    assert utils_framing.get_stream_framing(None) == utils_framing.framing_json
+    assert utils_framing.get_stream_framing(" Binary ") == utils_framing.framing_binary
+    assert utils_framing.get_stream_framing("protobuf") == utils_framing.framing_json
@@ -0,0 +1,95 @@
+# Standard Library Imports
+import asyncio
+import importlib
+import sys
+
+# Third-Party Imports
+import pytest
+
+@pytest.fixture
+def utils_persistence(utils_db_async, monkeypatch):
+    monkeypatch.delitem(sys.modules, "server.utils_persistence", raising=False)
+    yield importlib.import_module("server.utils_persistence")
+    sys.modules.pop("server.utils_persistence", None)
+
+def get_queue(utils_persistence, max_size: int = 10):
+    return utils_persistence.ConversationWriteQueue(max_size=max_size, max_batch_size=10, max_retries=0,
+                                                    retry_base_delay=0.01, retry_max_delay=0.01)
+
+def conversation(device_id: str) -> dict:
+    return {"id": f"session-{device_id}", "deviceId": device_id}
+
+def test_turns_are_written_in_order(utils_persistence, utils_db_async, monkeypatch):
+    written = []
+
+    async def add_messages(conversation, messages):
+        written.extend(message["content"] for message in messages)
+        return True
+
+    monkeypatch.setattr(utils_db_async, "add_messages_to_conversation", add_messages)
+    queue = get_queue(utils_persistence)
+
+    async def main():
+        for index in range(5):
+            await queue.enqueue(conversation("a"), [{"role": "user", "content": str(index)}])
+        await queue.wait_for_device("a")
+
+    asyncio.run(main())
+    assert written == ["0", "1", "2", "3", "4"]
+    assert queue.get_stats()["written"] == 5
+
+def test_enqueue_cancelled_while_waiting_for_a_slot(utils_persistence, utils_db_async, monkeypatch):
+    release = None
+
+    async def add_messages(conversation, messages):
+        await release.wait()
+        return True
+
+    monkeypatch.setattr(utils_db_async, "add_messages_to_conversation", add_messages)
+    queue = get_queue(utils_persistence, max_size=1)
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        await queue.enqueue(conversation("a"), [{"role": "user", "content": "written"}])
+        blocked = asyncio.create_task(queue.enqueue(conversation("b"), [{"role": "user", "content": "cancelled"}]))
+        await asyncio.sleep(0.01)
+        blocked.cancel()
+        await asyncio.gather(blocked, return_exceptions=True)
+        # The cancelled turn was never queued, so waiting for its device returns at once
+        await asyncio.wait_for(queue.wait_for_device("b"), timeout=1)
+        release.set()
+        await asyncio.wait_for(queue.flush(), timeout=1)
+
+    asyncio.run(main())
+    assert queue.get_stats()["queue_depth"] == 0
+
+def test_turns_left_by_a_finished_loop_are_resumed(utils_persistence, utils_db_async, monkeypatch):
+    written = []
+
+    async def never_returns(conversation, messages):
+        await asyncio.Event().wait()
+
+    async def add_messages(conversation, messages):
+        written.extend(message["content"] for message in messages)
+        return True
+
+    queue = get_queue(utils_persistence)
+
+    async def first_recording():
+        await queue.enqueue(conversation("a"), [{"role": "user", "content": "first"}])
+        await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(utils_db_async, "add_messages_to_conversation", never_returns)
+    asyncio.run(first_recording())
+    assert queue.get_stats()["queue_depth"] == 1
+
+    async def next_recording():
+        await queue.wait_for_device("a")
+        await queue.enqueue(conversation("a"), [{"role": "user", "content": "second"}])
+        await queue.flush()
+
+    monkeypatch.setattr(utils_db_async, "add_messages_to_conversation", add_messages)
+    asyncio.run(next_recording())
+    assert written == ["first", "second"]
+    assert queue.get_stats()["resumed"] == 1
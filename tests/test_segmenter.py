@@ -0,0 +1,80 @@
+# Third-Party Imports
+import pytest
+
+from server.utils_segmenter import SentenceSegmenter
+
+def get_segmenter(**overrides) -> SentenceSegmenter:
+    settings = dict(first_chunk_min_words=3, first_chunk_max_words=12, first_chunk_max_ms=60000,
+                    min_chunk_chars=60, max_chunk_words=40)
+    settings.update(overrides)
+    return SentenceSegmenter(**settings)
+
+def feed_by_character(segmenter: SentenceSegmenter, text: str) -> list:
+    chunks = []
+    for char in text:
+        chunks += segmenter.feed(char)
+    return chunks
+
+def test_first_chunk_is_cut_at_sentence_end():
+    segmenter = get_segmenter()
+    assert feed_by_character(segmenter, "Namaste. ") == ["Namaste."]
+
+def test_first_chunk_is_cut_at_clause_after_min_words():
+    segmenter = get_segmenter()
+    assert feed_by_character(segmenter, "Sure, let me check that for you, ") == ["Sure, let me check that for you,"]
+
+def test_first_chunk_is_cut_after_max_words():
+    segmenter = get_segmenter(first_chunk_max_words=4)
+    assert feed_by_character(segmenter, "one two three four five six") == ["one two three four"]
+
+def test_later_chunks_are_merged_up_to_min_chunk_chars():
+    segmenter = get_segmenter(min_chunk_chars=30)
+    chunks = feed_by_character(segmenter, "Hi. Your plan is active. It renews monthly. Thanks. ")
+    chunks.append(segmenter.flush())
+    assert chunks == ["Hi.", "Your plan is active. It renews monthly.", "Thanks."]
+
+@pytest.mark.parametrize("amount", ["₹1,250", "2.5", "10:30"])
+def test_number_separators_do_not_split(amount):
+    segmenter = get_segmenter()
+    chunks = feed_by_character(segmenter, f"Your amount is {amount} today. ")
+    assert chunks == [f"Your amount is {amount} today."]
+
+def test_abbreviation_does_not_split():
+    segmenter = get_segmenter()
+    assert feed_by_character(segmenter, "You received Rs. 500 today. ") == ["You received Rs. 500 today."]
+
+def test_newline_forces_a_cut_below_min_chunk_chars():
+    segmenter = get_segmenter()
+    text = "Namaste. Your balance is ₹1,250 and the last payment of ₹500 was received. wait a minute, I am checking.\n"
+    assert feed_by_character(segmenter, text) == [
+        "Namaste.",
+        "Your balance is ₹1,250 and the last payment of ₹500 was received.",
+        "wait a minute, I am checking.",
+    ]
+    assert segmenter.flush() is None
+
+def test_first_chunk_timeout_is_none_before_text():
+    segmenter = get_segmenter()
+    assert segmenter.get_first_chunk_timeout() is None
+    segmenter.feed("Let")
+    assert 0 < segmenter.get_first_chunk_timeout() <= 60
+
+def test_poll_cuts_overdue_first_chunk():
+    segmenter = get_segmenter()
+    assert segmenter.feed("let me check your") == []
+    assert segmenter.poll() is None
+    # The text stream paused past the deadline: the first chunk is cut at the last complete word
+    segmenter.first_chunk_max_ms = 0
+    assert segmenter.get_first_chunk_timeout() is None
+    assert segmenter.poll() == "let me check"
+    assert segmenter.poll() is None
+    assert segmenter.flush() == "your"
+
+def test_poll_waits_for_min_words():
+    segmenter = get_segmenter(first_chunk_max_ms=0)
+    segmenter.feed("let me ")
+    assert segmenter.poll() is None
+
+def test_tab_is_a_word_gap():
+    segmenter = get_segmenter()
+    assert feed_by_character(segmenter, "Your\tplan\tis active. ") == ["Your\tplan\tis active."]
@@ -0,0 +1,27 @@
+from server import utils_codecs
+from server import utils_tts_cache
+
+def test_canned_phrase_and_its_clauses_are_stored_on_first_synthesis():
+    for sentence in ["Wait a minute, I am checking for more information.", "wait a minute,", "I am checking for more information."]:
+        assert utils_tts_cache.should_store(sentence, f"canned-{sentence}")
+
+def test_other_sentences_are_stored_after_repeated_syntheses():
+    sentence = "Your balance is ₹1,250, Ramesh."
+    results = [utils_tts_cache.should_store(sentence, "balance-key") for _ in range(utils_tts_cache.tts_cache_min_syntheses)]
+    assert results == [False] * (utils_tts_cache.tts_cache_min_syntheses - 1) + [True]
+
+def test_long_sentences_are_not_cacheable():
+    assert utils_tts_cache.is_cacheable("Namaste.")
+    assert not utils_tts_cache.is_cacheable("a" * (utils_tts_cache.tts_cache_max_sentence_chars + 1))
+
+def test_cached_audio_is_split_on_frame_boundaries():
+    frame = b"\xff\xf3\x48\xc4" + b"\x00" * 140
+    audio = frame * 30
+    chunks = utils_tts_cache.split_audio(audio, utils_codecs.get_audio_codec("mp3"))
+    assert b"".join(chunks) == audio
+    assert len(chunks) > 1 and all(len(chunk) % len(frame) == 0 for chunk in chunks)
+
+def test_cached_pcm_is_split_by_duration():
+    audio = b"\x00\x01" * 8000
+    chunks = utils_tts_cache.split_audio(audio, utils_codecs.get_audio_codec("pcm"))
+    assert [len(chunk) for chunk in chunks] == [8000, 8000]
@@ -0,0 +1,49 @@
+# Third-Party Imports
+import numpy as np
+
+from server.utils_vad import EndpointDetector
+
+sample_rate = 16000
+
+def get_detector() -> EndpointDetector:
+    return EndpointDetector(sample_rate=sample_rate, frame_ms=20, min_energy_db=-50, noise_margin_db=10,
+                            max_zcr=0.3, min_speech_ms=200, trailing_silence_ms=800)
+
+def tone(ms: int, level_db: float = -12) -> bytes:
+    t = np.arange(sample_rate * ms // 1000) / sample_rate
+    return (32768 * 10 ** (level_db / 20) * np.sin(2 * np.pi * 200 * t)).astype(np.int16).tobytes()
+
+def noise(ms: int, level_db: float) -> bytes:
+    samples = np.random.default_rng(0).normal(0, 32768 * 10 ** (level_db / 20), sample_rate * ms // 1000)
+    return samples.astype(np.int16).tobytes()
+
+def silence(ms: int) -> bytes:
+    return bytes(sample_rate * ms // 1000 * 2)
+
+def test_endpoint_after_speech_and_trailing_silence():
+    detector = get_detector()
+    assert not detector.process(tone(400))
+    assert not detector.process(silence(780))
+    assert detector.process(silence(20))
+    assert detector.speech_ms == 400
+    assert detector.process(tone(100))
+
+def test_silence_alone_is_not_an_endpoint():
+    detector = get_detector()
+    assert not detector.process(silence(2000))
+    assert detector.speech_ms == 0
+
+def test_short_blip_is_not_an_utterance():
+    detector = get_detector()
+    assert not detector.process(tone(100) + silence(1500))
+
+def test_hiss_is_not_speech():
+    detector = get_detector()
+    assert not detector.process(noise(400, -45) + silence(1000))
+    assert detector.speech_ms == 0
+
+def test_odd_sized_chunks_are_buffered_to_frames():
+    audio = tone(400) + silence(800)
+    detector = get_detector()
+    detected = [detector.process(audio[start:start + 333]) for start in range(0, len(audio), 333)]
+    assert detected[-1] and not any(detected[:-2])